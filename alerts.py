@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+
+from rollups import to_epoch
+from trips import haversine_km
+
+# Правила: поле зразка, поріг спрацювання (above/below) і поріг зняття (clear)
+# з гістерезисом, щоб значення на межі не сипало повідомленнями; cooldown —
+# мінімальна пауза між повторними сповіщеннями одного правила, секунди.
+DEFAULT_RULES = (
+    {'name': 'engine_overheat', 'field': 'engine_temperature', 'above': 110, 'clear': 100,
+     'cooldown': 600, 'message': "🔥 Перегрів двигуна: {value:.0f}°C"},
+    {'name': 'akk_low', 'field': 'batteryAkkVoltage', 'below': 11.8, 'clear': 12.2,
+     'cooldown': 3600, 'message': "🪫 Низька напруга акумулятора: {value:.2f} V"},
+    {'name': 'fuel_low', 'field': 'fuel_liters', 'below': 2.0, 'clear': 3.0,
+     'cooldown': 3600, 'message': "⛽ Пального лишилось {value:.1f} л"},
+    {'name': 'oil_service', 'field': 'oilServiceLeft', 'below': 100, 'clear': 500,
+     'cooldown': 86400, 'message': "🛢 До заміни масла {value:.0f} км"},
+    {'name': 'chain_service', 'field': 'chainServiceLeft', 'below': 50, 'clear': 300,
+     'cooldown': 86400, 'message': "🔗 До мастки ланцюга {value:.0f} км"},
+    # parked_distance рахує рушій: км від точки паркування, якщо її задано (/park)
+    {'name': 'parked_moved', 'field': 'parked_distance', 'above': 0.1, 'clear': 0.05,
+     'cooldown': 300, 'message': "🚨 Мотоцикл зрушив з місця стоянки: {value:.2f} км"},
+)
+
+class Rule:
+    __slots__ = ('name', 'field', 'sign', 'trigger', 'clear', 'cooldown', 'message', 'devices')
+
+    def __init__(self, name, field, above=None, below=None, clear=None, cooldown=600,
+                 message=None, devices=None):
+        if (above is None) == (below is None):
+            raise ValueError(f"rule {name}: exactly one of above/below is required")
+        self.name = name
+        self.field = field
+        # sign зводить обидва напрямки до порівняння "більше": value * sign > trigger
+        self.sign = 1.0 if above is not None else -1.0
+        threshold = above if above is not None else below
+        self.trigger = self.sign * threshold
+        self.clear = self.sign * (threshold if clear is None else clear)
+        if self.clear > self.trigger:
+            raise ValueError(f"rule {name}: clear must be on the safe side of the threshold")
+        self.cooldown = cooldown
+        self.message = message or f"⚠️ {name}: {{value}}"
+        self.devices = frozenset(devices) if devices else None
+
+class AlertEngine:
+    """Перевірка правил на кожній пачці з TelemetryIngestQueue.
+
+    Працює в потоці записувача, тож не зачіпає HTTP-запит пристрою. На
+    зразок — один прохід по списку правил зі станом (активне, час
+    останнього сповіщення) у плоских списках пристрою. Сповіщення віддаються
+    в notify(device_id, rule, value, sample); зразки, старші за max_age
+    (вивантаження офлайн-буфера), лише оновлюють стан і не сповіщають."""
+
+    def __init__(self, rules=DEFAULT_RULES, notify=None, max_age=600):
+        self.rules = [r if isinstance(r, Rule) else Rule(**r) for r in rules]
+        self.notify = notify
+        self.max_age = max_age
+        self._state = {}      # device_id -> [active list, last_sent list]
+        self._parked = {}     # device_id -> (lat, lon)
+        self._lock = threading.Lock()
+        self.stats = {'samples': 0, 'fired': 0, 'suppressed': 0}
+
+    def park(self, device_id, lat, lon):
+        with self._lock:
+            self._parked[device_id] = (lat, lon)
+
+    def unpark(self, device_id):
+        with self._lock:
+            return self._parked.pop(device_id, None) is not None
+
+    def parked(self, device_id):
+        with self._lock:
+            return self._parked.get(device_id)
+
+    def _state_for(self, device_id):
+        state = self._state.get(device_id)
+        if state is None:
+            n = len(self.rules)
+            state = self._state[device_id] = [[False] * n, [float('-inf')] * n]
+        return state
+
+    def evaluate(self, sample, now):
+        """Повертає [(rule, value)] для правил, що спрацювали на цьому зразку."""
+        device_id = sample.get('device_id')
+        active, last_sent = self._state_for(device_id)
+        point = self._parked.get(device_id)
+        if point is not None and sample.get('latitude') is not None and sample.get('longitude') is not None \
+                and (sample['latitude'] or sample['longitude']):
+            sample = dict(sample, parked_distance=haversine_km(point[0], point[1], sample['latitude'], sample['longitude']))
+        fired = []
+        for i, rule in enumerate(self.rules):
+            value = sample.get(rule.field)
+            if value is None or (rule.devices is not None and device_id not in rule.devices):
+                continue
+            signed = value * rule.sign
+            if not active[i]:
+                if signed > rule.trigger:
+                    active[i] = True
+                    if now - last_sent[i] >= rule.cooldown:
+                        last_sent[i] = now
+                        fired.append((rule, value))
+                    else:
+                        self.stats['suppressed'] += 1
+            elif signed < rule.clear:
+                active[i] = False
+        return fired
+
+    def process(self, samples):
+        now = time.time()
+        alerts = []
+        with self._lock:
+            for sample in samples:
+                fired = self.evaluate(sample, now)
+                self.stats['samples'] += 1
+                ts = sample.get('timestamp')
+                if fired and (ts is None or now - to_epoch(ts) <= self.max_age):
+                    alerts.extend((sample, rule, value) for rule, value in fired)
+            self.stats['fired'] += len(alerts)
+        if self.notify is not None:
+            for sample, rule, value in alerts:
+                try:
+                    self.notify(sample.get('device_id'), rule, value, sample)
+                except Exception as e:
+                    print("❌ Помилка відправки сповіщення:", e)
+        return len(alerts)
+
+class RateLimitedSender:
+    """Черга повідомлень Telegram у циклі PTB з обмеженням швидкості:
+    не частіше rate повідомлень за секунду загалом і per_chat_interval
+    секунд між повідомленнями в один чат (ліміти Bot API).
+    submit() можна викликати з будь-якого потоку."""
+
+    def __init__(self, send, rate=25.0, per_chat_interval=1.0, max_queue=1000):
+        self.send = send  # async send(chat_id, text)
+        self.interval = 1.0 / rate
+        self.per_chat_interval = per_chat_interval
+        self.max_queue = max_queue
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._chat_next = {}
+        self.stats = {'sent': 0, 'dropped': 0, 'errors': 0}
+
+    def start(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = self._loop.create_task(self._run())
+
+    def submit(self, chat_id, text):
+        if self._loop is None or self._loop.is_closed():
+            self.stats['dropped'] += 1
+            return False
+        self._loop.call_soon_threadsafe(self._put, chat_id, text)
+        return True
+
+    def _put(self, chat_id, text):
+        try:
+            self._queue.put_nowait((chat_id, text))
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+
+    async def _run(self):
+        next_send = 0.0
+        while True:
+            chat_id, text = await self._queue.get()
+            now = self._loop.time()
+            wait = max(next_send, self._chat_next.get(chat_id, 0.0)) - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                now = self._loop.time()
+            try:
+                await self.send(chat_id, text)
+                self.stats['sent'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                print("❌ Не вдалося надіслати сповіщення:", e)
+                # RetryAfter від Bot API: поважаємо паузу, яку попросив сервер
+                now += float(getattr(e, 'retry_after', 0) or 0)
+            next_send = now + self.interval
+            self._chat_next[chat_id] = now + self.per_chat_interval
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
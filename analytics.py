@@ -0,0 +1,214 @@
+import threading
+import time
+
+import numpy as np
+
+from rollups import to_epoch
+
+# колонки, що вантажаться в масиви (порядок = порядок у SELECT)
+COLUMNS = ('ts', 'fuel', 'total', 'air', 'remaining')
+
+LOAD_SQL = '''
+    SELECT CAST(strftime('%s', timestamp) AS INTEGER), fuel_liters, totalDistance,
+           air_temperature, distanceRemCharge
+    FROM telemetry
+    WHERE device_id = ? AND timestamp >= ?
+    ORDER BY timestamp, id
+'''
+
+# межі діапазонів температури повітря, °C
+TEMPERATURE_BANDS = (0.0, 10.0, 20.0, 30.0)
+
+def _as_float(value):
+    return np.nan if value is None else float(value)
+
+def segments(fuel, total):
+    """Пальне і пробіг між сусідніми зразками. Зростання пального — заправка
+    або шум датчика, а не витрата; скидання одометра не рахується."""
+    used = np.nan_to_num(-np.diff(fuel))
+    used[used < 0] = 0.0
+    dist = np.nan_to_num(np.diff(total))
+    dist[dist < 0] = 0.0
+    return used, dist
+
+def rolling_consumption(used, dist, window_km):
+    """л/100км на останніх window_km кілометрах для кожної точки (NaN, поки не набралось)."""
+    cum_fuel = np.concatenate(([0.0], np.cumsum(used)))
+    cum_dist = np.concatenate(([0.0], np.cumsum(dist)))
+    start = np.searchsorted(cum_dist, cum_dist - window_km, side='right') - 1
+    valid = start >= 0
+    start[~valid] = 0
+    km = cum_dist - cum_dist[start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (cum_fuel - cum_fuel[start]) / km * 100
+    result[~valid | (km <= 0)] = np.nan
+    return result
+
+def consumption_by_band(used, dist, air, bands=TEMPERATURE_BANDS, min_km=1.0):
+    """Витрата за діапазонами температури повітря: [(від, до, км, л/100км)]."""
+    air = air[1:]
+    known = ~np.isnan(air)
+    band = np.digitize(air[known], bands)
+    km = np.bincount(band, weights=dist[known], minlength=len(bands) + 1)
+    liters = np.bincount(band, weights=used[known], minlength=len(bands) + 1)
+    edges = (None,) + tuple(bands) + (None,)
+    result = []
+    for i in range(len(bands) + 1):
+        if km[i] >= min_km:
+            result.append((edges[i], edges[i + 1], float(km[i]), float(liters[i] / km[i] * 100)))
+    return result
+
+def detect_refuels(ts, fuel, min_liters=1.0, noise=0.05):
+    """Заправки — серії зростань fuel_liters сумарно від min_liters.
+    Повертає [(час, літрів, було, стало)]."""
+    diff = np.diff(fuel)
+    rising = np.nan_to_num(diff) > noise
+    if not rising.any():
+        return []
+    edges = np.diff(np.concatenate(([0], rising.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)  # не включно
+    added = fuel[ends] - fuel[starts]
+    keep = added >= min_liters
+    return [
+        (float(ts[e]), float(a), float(fuel[s]), float(fuel[e]))
+        for s, e, a in zip(starts[keep], ends[keep], added[keep])
+    ]
+
+def estimate_range(fuel, total, since=0, min_km=5.0):
+    """Запас ходу за лінійною регресією fuel_liters від totalDistance на ділянці
+    з індексу since (остання заправка). Повертає (км, л/100км) або (None, None)."""
+    fuel, total = fuel[since:], total[since:]
+    known = ~(np.isnan(fuel) | np.isnan(total))
+    fuel, total = fuel[known], total[known]
+    if len(total) < 2 or total[-1] - total[0] < min_km:
+        return None, None
+    slope, _ = np.polyfit(total - total[0], fuel, 1)
+    if slope >= 0:
+        return None, None
+    return float(fuel[-1] / -slope), float(-slope * 100)
+
+class FuelAnalytics:
+    """Аналітика витрати пального по історії телеметрії пристрою.
+
+    Перше звернення вантажить вікно window_days з БД у масиви NumPy;
+    далі process() (слухач TelemetryIngestQueue) лише докладає нові
+    зразки в чергу пристрою, а report() дописує їх у кінець масивів,
+    відрізає старе і перераховує звіт. Повне перечитування — тільки
+    якщо прийшов зразок, старший за вже завантажені (офлайн-буфер)."""
+
+    def __init__(self, pool, window_days=30, rolling_km=50.0, refuel_min_liters=1.0, max_pending=100000):
+        self.pool = pool
+        self.max_pending = max_pending
+        self.window = window_days * 86400
+        self.rolling_km = rolling_km
+        self.refuel_min_liters = refuel_min_liters
+        self._series = {}   # device_id -> {'arrays': {...} | None, 'pending': [...], 'report': ...}
+        self._lock = threading.Lock()          # series/pending: слухач проти report()
+        self._report_lock = threading.Lock()   # один перерахунок за раз
+
+    def _load(self, device_id, now):
+        since = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - self.window))
+        cur = self.pool.connection().cursor()
+        cur.row_factory = None  # кортежі замість sqlite3.Row: np.array бере їх напряму
+        cur.execute(LOAD_SQL, (device_id, since))
+        parts = []
+        while True:
+            rows = cur.fetchmany(50000)
+            if not rows:
+                break
+            parts.append(np.array(rows, dtype=np.float64))  # None -> NaN
+        data = np.concatenate(parts) if parts else np.empty((0, len(COLUMNS)))
+        return {name: np.ascontiguousarray(data[:, i]) for i, name in enumerate(COLUMNS)}
+
+    def process(self, samples):
+        with self._lock:
+            for sample in samples:
+                device_id = sample.get('device_id')
+                entry = self._series.get(device_id)
+                if entry is None:
+                    continue  # пристрій ще не запитували — завантажиться з БД
+                if len(entry['pending']) >= self.max_pending and entry['arrays'] is not None:
+                    # звіт давно не питали — звільняємо пам'ять, наступний report() перечитає БД
+                    del self._series[device_id]
+                    continue
+                entry['pending'].append((
+                    to_epoch(sample.get('timestamp')),
+                    _as_float(sample.get('fuel_liters')),
+                    _as_float(sample.get('totalDistance')),
+                    _as_float(sample.get('air_temperature')),
+                    _as_float(sample.get('distanceRemCharge')),
+                ))
+                entry['report'] = None
+
+    def invalidate(self, device_id=None):
+        with self._lock:
+            if device_id is None:
+                self._series.clear()
+            else:
+                self._series.pop(device_id, None)
+
+    def _arrays(self, device_id, now):
+        with self._lock:
+            entry = self._series.get(device_id)
+            if entry is not None and entry['report'] is not None:
+                return entry, None
+            if entry is None:
+                # реєструємо до запиту, щоб пачки, записані під час завантаження, не загубились
+                entry = self._series[device_id] = {'arrays': None, 'pending': [], 'report': None}
+            pending, entry['pending'] = entry['pending'], []
+            arrays = entry['arrays']
+        if arrays is None:
+            arrays = self._load(device_id, now)
+            last = arrays['ts'][-1] if len(arrays['ts']) else -np.inf
+            pending = [p for p in pending if p[0] > last]
+        if pending:
+            block = np.array(pending, dtype=np.float64)
+            last = arrays['ts'][-1] if len(arrays['ts']) else -np.inf
+            if block[0, 0] < last or np.any(np.diff(block[:, 0]) < 0):
+                arrays = self._load(device_id, now)  # запізнілі зразки — перечитуємо вікно
+            else:
+                arrays = {name: np.concatenate((arrays[name], block[:, i])) for i, name in enumerate(COLUMNS)}
+        first = np.searchsorted(arrays['ts'], now - self.window)
+        if first:
+            arrays = {name: values[first:] for name, values in arrays.items()}
+        return entry, arrays
+
+    def compute(self, arrays):
+        ts, fuel, total = arrays['ts'], arrays['fuel'], arrays['total']
+        report = {'samples': int(len(ts)), 'since': float(ts[0]) if len(ts) else None}
+        if len(ts) < 2:
+            return report
+        used, dist = segments(fuel, total)
+        rolling = rolling_consumption(used, dist, self.rolling_km)
+        refuels = detect_refuels(ts, fuel, self.refuel_min_liters)
+        last_refuel = int(np.searchsorted(ts, refuels[-1][0])) if refuels else 0
+        range_km, range_consumption = estimate_range(fuel, total, since=last_refuel)
+        km = float(dist.sum())
+        report.update({
+            'distance': km,
+            'fuel_used': float(used.sum()),
+            'avg_consumption': float(used.sum() / km * 100) if km > 0 else None,
+            'rolling_km': self.rolling_km,
+            'rolling_consumption': None if np.isnan(rolling[-1]) else float(rolling[-1]),
+            'by_temperature': consumption_by_band(used, dist, arrays['air']),
+            'refuels': refuels,
+            'range_km': range_km,
+            'range_consumption': range_consumption,
+            'fuel_liters': None if np.isnan(fuel[-1]) else float(fuel[-1]),
+            'device_range_km': None if np.isnan(arrays['remaining'][-1]) else float(arrays['remaining'][-1]),
+        })
+        return report
+
+    def report(self, device_id, now=None):
+        now = time.time() if now is None else now
+        with self._report_lock:
+            entry, arrays = self._arrays(device_id, now)
+            if arrays is None:
+                return entry['report']
+            report = self.compute(arrays)
+            with self._lock:
+                entry['arrays'] = arrays
+                if not entry['pending']:
+                    entry['report'] = report
+        return report
@@ -1,13 +1,18 @@
 import os
-import sqlite3
+import io
+import gzip
 import json
-import requests
+import time
+import asyncio
+import atexit
+import functools
 import logging
 import pytz
+import tempfile
 from datetime import datetime, timedelta
 
-from flask import Flask, request, jsonify
-from apscheduler.schedulers.background import BackgroundScheduler
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from werkzeug.utils import secure_filename
 from telegram import (
     Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton,
     InlineKeyboardButton, InlineKeyboardMarkup
@@ -17,66 +22,197 @@ from telegram.ext import (
     ContextTypes, ConversationHandler, CallbackQueryHandler
 )
 
+from storage import ConnectionPool
+from ingest import TelemetryIngestQueue, validate_telemetry
+from telemetry_cache import LatestTelemetryCache
+from notify import CommandNotifier
+from weather import WeatherClient
+from async_db import AsyncDB
+from rollups import RollupEngine, RESOLUTIONS
+from trips import TripDetector
+from analytics import FuelAnalytics
+from alerts import AlertEngine, RateLimitedSender
+from geo import GeoIndex, GeofenceMonitor
+from jobs import JobRunner
+from metrics import REGISTRY, Counter, Gauge, Histogram, SamplingProfiler, StatsCollector, timed
+from telemetry_codec import decode as decode_telemetry, DecodeError
+import export
+
 # ==========  CONFIG  ==========
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "7997519934:AAGuQH9UbjnTytxe9iGe5m53xXiwdImI8p0")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")  # власний Bot API сервер або заглушка в тестах
 ADMIN_CHAT_ID = int(os.getenv("ADMIN_CHAT_ID", "587618394"))
 ESP32_DEVICE_ID = os.getenv("ESP32_DEVICE_ID", "fixik4308")
 MASTER_PIN = os.getenv("MASTER_PIN", "8748")
 OPENWEATHER_API = os.getenv("OPENWEATHER_API", "1fc7aa0291a70d68f04424895faf1f5a")
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
 TIMEZONE = os.getenv("TZ", "Europe/Kyiv")
-DB_FILE = "hondashadow.db"
+DB_FILE = os.getenv("DB_FILE", "hondashadow.db")
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "50000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.05"))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "5000"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+EXPORT_BOT_MAX_BYTES = int(os.getenv("EXPORT_BOT_MAX_BYTES", str(45 * 1024 * 1024)))  # ліміт Bot API — 50 МБ
+LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "30"))
+LONG_POLL_RECHECK = float(os.getenv("LONG_POLL_RECHECK", "5"))
+COMMAND_LEASE_SECONDS = float(os.getenv("COMMAND_LEASE_SECONDS", "30"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+TRIP_IDLE_TIMEOUT = float(os.getenv("TRIP_IDLE_TIMEOUT", "300"))
+TRIP_MIN_DISTANCE = float(os.getenv("TRIP_MIN_DISTANCE", "0.3"))
+ANALYTICS_WINDOW_DAYS = float(os.getenv("ANALYTICS_WINDOW_DAYS", "30"))
+ANALYTICS_ROLLING_KM = float(os.getenv("ANALYTICS_ROLLING_KM", "50"))
+REFUEL_MIN_LITERS = float(os.getenv("REFUEL_MIN_LITERS", "1.0"))
+ALERT_MAX_AGE = float(os.getenv("ALERT_MAX_AGE", "600"))
+ALERT_RATE = float(os.getenv("ALERT_RATE", "25"))
+GEO_MIN_MOVE_M = float(os.getenv("GEO_MIN_MOVE_M", "20"))
+GEO_MIN_INTERVAL = float(os.getenv("GEO_MIN_INTERVAL", "60"))
+GEO_RETENTION_DAYS = float(os.getenv("GEO_RETENTION_DAYS", "365"))
+GEO_TRACK_MAX_POINTS = int(os.getenv("GEO_TRACK_MAX_POINTS", "5000"))  # довший трек проріджується до спрощення
+DAILY_REPORT_TIME = os.getenv("DAILY_REPORT_TIME", "08:00")  # для ADMIN_CHAT_ID; порожнє — вимкнено
+JOB_JITTER = float(os.getenv("JOB_JITTER", "30"))
+JOB_MISFIRE_GRACE = float(os.getenv("JOB_MISFIRE_GRACE", "600"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+MAINTENANCE_HOUR = int(os.getenv("MAINTENANCE_HOUR", "4"))
+VACUUM_WEEKDAY = os.getenv("VACUUM_WEEKDAY", "sun")  # порожнє — без VACUUM
+VACUUM_MIN_FREE_RATIO = float(os.getenv("VACUUM_MIN_FREE_RATIO", "0.2"))
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+RAW_RETENTION_DAYS = float(os.getenv("RAW_RETENTION_DAYS", "90"))
+ROLLUP_RETENTION_DAYS = {
+    RESOLUTIONS['1m']: float(os.getenv("ROLLUP_1M_RETENTION_DAYS", "14")),
+    RESOLUTIONS['1h']: float(os.getenv("ROLLUP_1H_RETENTION_DAYS", "365")),
+    RESOLUTIONS['1d']: float(os.getenv("ROLLUP_1D_RETENTION_DAYS", "0")),  # 0 — зберігати завжди
+}
 
 # ==========  FLASK APP ==========
 app = Flask(__name__)
 bot_app = None  # set later after Application init
 
+# ==========  METRICS  ==========
+HTTP_SECONDS = Histogram('http_request_duration_seconds', "HTTP-запити за маршрутом", ('route', 'method', 'status'))
+DB_SECONDS = Histogram('db_call_duration_seconds', "Виклики функцій БД", ('helper',))
+DB_ERRORS = Counter('db_call_errors_total', "Винятки у функціях БД", ('helper',))
+BOT_SECONDS = Histogram('bot_message_duration_seconds', "Текстові повідомлення за гілкою handle_message", ('branch',))
+BOT_ERRORS = Counter('bot_message_errors_total', "Винятки в handle_message за гілкою", ('branch',))
+# хелпери викликають один одного (park_device -> save_setting) — міряємо лише зовнішній
+db_helper = timed(DB_SECONDS, errors=DB_ERRORS, outermost=True)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    # викликається і для 500 з необробленого винятку; для потокових відповідей — час до заголовків
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_SECONDS.labels(route, request.method, str(response.status_code)).observe(time.perf_counter() - started)
+    return response
+
 # ==========  DATABASE  ==========
+db = ConnectionPool(DB_FILE)
+ingest_queue = TelemetryIngestQueue(
+    db,
+    max_pending=INGEST_MAX_PENDING,
+    batch_size=INGEST_BATCH_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL,
+)
+latest_telemetry = LatestTelemetryCache()
+command_notifier = CommandNotifier()
+rollups = RollupEngine(db, raw_days=RAW_RETENTION_DAYS)
+ingest_queue.add_listener(rollups.process)
+trips = TripDetector(db, idle_timeout=TRIP_IDLE_TIMEOUT, min_distance=TRIP_MIN_DISTANCE,
+                     raw_days=RAW_RETENTION_DAYS)
+ingest_queue.add_listener(trips.process)
+analytics = FuelAnalytics(
+    db, window_days=ANALYTICS_WINDOW_DAYS, rolling_km=ANALYTICS_ROLLING_KM,
+    refuel_min_liters=REFUEL_MIN_LITERS,
+)
+ingest_queue.add_listener(analytics.process)
+geo_index = GeoIndex(db, min_move_m=GEO_MIN_MOVE_M, min_interval=GEO_MIN_INTERVAL,
+                     track_max_points=GEO_TRACK_MAX_POINTS)
+ingest_queue.add_listener(geo_index.process)
 
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    # Телеметрія
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS telemetry (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            device_id TEXT,
-            engine_temperature REAL,
-            air_temperature REAL,
-            latitude REAL,
-            longitude REAL,
-            fuel_pulses REAL,
-            fuel_liters REAL,
-            dailyDistance REAL,
-            totalDistance REAL,
-            dailyAvgConsumption REAL,
-            totalAvgConsumption REAL,
-            distanceRemCharge REAL,
-            batteryVoltage REAL,
-            batteryAkkVoltage REAL,
-            chainServiceLeft REAL,
-            oilServiceLeft REAL
-        )
-    ''')
-    # Налаштування (наприклад, ПІН, нагадування, пробіг)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT
-        )
-    ''')
-    # Команди для ESP32
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS commands (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_id TEXT,
-            command_type TEXT,
-            value TEXT,
-            executed INTEGER DEFAULT 0
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with db.transaction() as c:
+        # Телеметрія
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS telemetry (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                device_id TEXT,
+                engine_temperature REAL,
+                air_temperature REAL,
+                latitude REAL,
+                longitude REAL,
+                fuel_pulses REAL,
+                fuel_liters REAL,
+                dailyDistance REAL,
+                totalDistance REAL,
+                dailyAvgConsumption REAL,
+                totalAvgConsumption REAL,
+                distanceRemCharge REAL,
+                batteryVoltage REAL,
+                batteryAkkVoltage REAL,
+                chainServiceLeft REAL,
+                oilServiceLeft REAL,
+                device_seq INTEGER
+            )
+        ''')
+        # Налаштування (наприклад, ПІН, нагадування, пробіг)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        # Команди для ESP32
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS commands (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT,
+                command_type TEXT,
+                value TEXT,
+                executed INTEGER DEFAULT 0,
+                created_at REAL,
+                acked_at REAL,
+                lease_until REAL,
+                deliveries INTEGER DEFAULT 0
+            )
+        ''')
+        # Реєстр пристроїв парку
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS devices (
+                device_id TEXT PRIMARY KEY,
+                name TEXT,
+                registered_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Які пристрої належать якому чату; selected — активний пристрій
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_devices (
+                chat_id INTEGER,
+                device_id TEXT,
+                selected INTEGER DEFAULT 0,
+                PRIMARY KEY (chat_id, device_id)
+            )
+        ''')
+
+def ensure_indexes():
+    with db.transaction() as c:
+        c.execute('CREATE INDEX IF NOT EXISTS idx_telemetry_device_id ON telemetry (device_id, id)')
+        # експорт за діапазоном часу, див. export.iter_chunks
+        c.execute('CREATE INDEX IF NOT EXISTS idx_telemetry_device_time ON telemetry (device_id, timestamp)')
+        # дедуплікація офлайн-буфера: один рядок на номер послідовності пристрою
+        c.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_telemetry_device_seq ON telemetry (device_id, device_seq)
+            WHERE device_seq IS NOT NULL
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_commands_device_executed ON commands (device_id, executed)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_user_devices_device ON user_devices (device_id)')
 
 def ensure_telemetry_columns():
     required_cols = {
@@ -89,130 +225,369 @@ def ensure_telemetry_columns():
         'batteryAkkVoltage': 'REAL',
         'chainServiceLeft': 'REAL',
         'oilServiceLeft': 'REAL',
+        'device_seq': 'INTEGER',
+    }
+    with db.transaction() as c:
+        columns = [row[1] for row in c.execute("PRAGMA table_info(telemetry)")]
+        for col, col_type in required_cols.items():
+            if col not in columns:
+                print(f"Adding column {col} ({col_type})")
+                c.execute(f"ALTER TABLE telemetry ADD COLUMN {col} {col_type}")
+
+def ensure_command_columns():
+    # час у секундах unix (REAL), щоб затримку рахувати простим відніманням
+    required_cols = {
+        'created_at': 'REAL',
+        'acked_at': 'REAL',
+        'lease_until': 'REAL',
+        'deliveries': 'INTEGER DEFAULT 0',
     }
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("PRAGMA table_info(telemetry)")
-    columns = [row[1] for row in c.fetchall()]
-    for col, col_type in required_cols.items():
-        if col not in columns:
-            print(f"Adding column {col} ({col_type})")
-            c.execute(f"ALTER TABLE telemetry ADD COLUMN {col} {col_type}")
-    conn.commit()
-    conn.close()
-
-def save_telemetry(data):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO telemetry (
-            device_id, engine_temperature, air_temperature,
-            latitude, longitude, fuel_pulses, fuel_liters,
-            dailyDistance, totalDistance, dailyAvgConsumption,
-            totalAvgConsumption, distanceRemCharge, batteryVoltage,
-            batteryAkkVoltage, chainServiceLeft, oilServiceLeft
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        data.get('device_id'), data.get('engine_temperature'),
-        data.get('air_temperature'), data.get('latitude'),
-        data.get('longitude'), data.get('fuel_pulses'),
-        data.get('fuel_liters'), data.get('dailyDistance'),
-        data.get('totalDistance'), data.get('dailyAvgConsumption'),
-        data.get('totalAvgConsumption'), data.get('distanceRemCharge'),
-        data.get('batteryVoltage'), data.get('batteryAkkVoltage'),
-        data.get('chainServiceLeft'), data.get('oilServiceLeft')
-    ))
-    conn.commit()
-    conn.close()
-
-def get_last_telemetry():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT * FROM telemetry ORDER BY id DESC LIMIT 1')
-    row = c.fetchone()
-    conn.close()
+    with db.transaction() as c:
+        columns = [row[1] for row in c.execute("PRAGMA table_info(commands)")]
+        for col, col_type in required_cols.items():
+            if col not in columns:
+                print(f"Adding column {col} ({col_type})")
+                c.execute(f"ALTER TABLE commands ADD COLUMN {col} {col_type}")
+
+@db_helper
+def query_last_telemetry(device_id=None):
+    # останній за часом, а не за id (офлайн-буфер дописує старі зразки), по idx_telemetry_device_time
+    if device_id is None:
+        row = db.query_one('''
+            SELECT t.* FROM devices d
+            JOIN telemetry t ON t.id = (
+                SELECT id FROM telemetry WHERE device_id = d.device_id
+                ORDER BY timestamp DESC, id DESC LIMIT 1
+            )
+            ORDER BY t.timestamp DESC, t.id DESC LIMIT 1
+        ''')
+    else:
+        row = db.query_one(
+            'SELECT * FROM telemetry WHERE device_id=? ORDER BY timestamp DESC, id DESC LIMIT 1', (device_id,)
+        )
     if not row:
         return None
+    return dict(row)
+
+def get_last_telemetry(device_id=None):
+    # знімок з пам'яті; кеш прогрівається з БД при старті і оновлюється в esp32_push
+    return latest_telemetry.get(device_id)
+
+@db_helper
+def add_command(cmd_type, value="", device_id=None):
+    device_id = device_id or ESP32_DEVICE_ID
+    db.execute('''
+        INSERT INTO commands (device_id, command_type, value, executed, created_at)
+        VALUES (?, ?, ?, 0, ?)
+    ''', (device_id, cmd_type, value, time.time()))
+    command_notifier.notify(device_id)
+
+@db_helper
+def lease_commands(device_id=None, lease_seconds=None):
+    """Атомарно забирає команди пристрою, які ніхто не тримає, і позначає їх
+    як "в дорозі" до lease_until. Непідтверджені вчасно команди знову
+    стають доступними — так пристрій отримає їх повторно."""
+    now = time.time()
+    rows = db.query_all('''
+        UPDATE commands SET lease_until=?, deliveries=deliveries+1
+        WHERE id IN (
+            SELECT id FROM commands
+            WHERE device_id=? AND executed=0 AND (lease_until IS NULL OR lease_until<=?)
+        )
+        RETURNING id, command_type, value
+    ''', (now + (lease_seconds or COMMAND_LEASE_SECONDS), device_id or ESP32_DEVICE_ID, now))
+    return sorted((dict(row) for row in rows), key=lambda cmd: cmd['id'])
+
+@db_helper
+def next_lease_expiry(device_id=None):
+    row = db.query_one(
+        'SELECT MIN(lease_until) FROM commands WHERE device_id=? AND executed=0',
+        (device_id or ESP32_DEVICE_ID,)
+    )
+    return row[0] if row else None
+
+def ack_command(command_id, device_id=None):
+    return ack_commands([command_id], device_id)
+
+@db_helper
+def ack_commands(command_ids, device_id=None):
+    ids = json.dumps([int(i) for i in command_ids])
+    if device_id is None:
+        cur = db.execute('''
+            UPDATE commands SET executed=1, acked_at=?, lease_until=NULL
+            WHERE executed=0 AND id IN (SELECT value FROM json_each(?))
+        ''', (time.time(), ids))
+    else:
+        cur = db.execute('''
+            UPDATE commands SET executed=1, acked_at=?, lease_until=NULL
+            WHERE executed=0 AND device_id=? AND id IN (SELECT value FROM json_each(?))
+        ''', (time.time(), device_id, ids))
+    return cur.rowcount
+
+@db_helper
+def get_command_latency(device_id=None, limit=1000):
+    # час від постановки команди в чергу до підтвердження пристроєм
+    where = "acked_at IS NOT NULL AND created_at IS NOT NULL"
+    params = ()
+    if device_id is not None:
+        where += " AND device_id=?"
+        params = (device_id,)
+    row = db.query_one(f'''
+        SELECT COUNT(*), AVG(rtt), MAX(rtt), SUM(deliveries > 1) FROM (
+            SELECT acked_at - created_at AS rtt, deliveries FROM commands
+            WHERE {where} ORDER BY id DESC LIMIT ?
+        )
+    ''', params + (limit,))
+    count, avg_rtt, max_rtt, redelivered = row
     return {
-        "id": row[0],
-        "timestamp": row[1],
-        "device_id": row[2],
-        "engine_temperature": row[3],
-        "air_temperature": row[4],
-        "latitude": row[5],
-        "longitude": row[6],
-        "fuel_pulses": row[7],
-        "fuel_liters": row[8],
-        "dailyDistance": row[9],
-        "totalDistance": row[10],
-        "dailyAvgConsumption": row[11],
-        "totalAvgConsumption": row[12],
-        "distanceRemCharge": row[13],
-        "batteryVoltage": row[14],
-        "batteryAkkVoltage": row[15],
-        "chainServiceLeft": row[16],
-        "oilServiceLeft": row[17]
+        "acked": count,
+        "avg_rtt_ms": (avg_rtt or 0) * 1000,
+        "max_rtt_ms": (max_rtt or 0) * 1000,
+        "redelivered": redelivered or 0,
     }
 
-def add_command(cmd_type, value=""):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO commands (device_id, command_type, value, executed)
-        VALUES (?, ?, ?, 0)
-    ''', (ESP32_DEVICE_ID, cmd_type, value))
-    conn.commit()
-    conn.close()
-
-def get_unexecuted_commands():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        SELECT id, command_type, value FROM commands
-        WHERE executed=0 AND device_id=?
-    ''', (ESP32_DEVICE_ID,))
-    rows = c.fetchall()
-    conn.close()
-    cmds = []
-    for row in rows:
-        cmds.append({
-            "id": row[0],
-            "command_type": row[1],
-            "value": row[2]
-        })
-    return cmds
-
-def ack_command(command_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('UPDATE commands SET executed=1 WHERE id=?', (command_id,))
-    conn.commit()
-    conn.close()
+# ==========  FLEET  ==========
+known_devices = set()
+chat_devices = {}  # chat_id -> активний device_id, кеш над user_devices
+
+@db_helper
+def register_device(device_id, name=None):
+    if device_id in known_devices:
+        return
+    db.execute('INSERT OR IGNORE INTO devices (device_id, name) VALUES (?, ?)', (device_id, name))
+    known_devices.add(device_id)
+
+@db_helper
+def load_devices():
+    if not db.query_one('SELECT 1 FROM devices LIMIT 1'):
+        # перший запуск з реєстром — переносимо пристрої зі старої історії
+        db.execute('''
+            INSERT OR IGNORE INTO devices (device_id)
+            SELECT DISTINCT device_id FROM telemetry WHERE device_id IS NOT NULL
+        ''')
+    known_devices.update(row[0] for row in db.query_all('SELECT device_id FROM devices'))
+    # пристрій за замовчуванням завжди відомий, навіть якщо ще не пушив
+    register_device(ESP32_DEVICE_ID)
 
+@db_helper
+def get_user_devices(chat_id):
+    rows = db.query_all(
+        'SELECT device_id, selected FROM user_devices WHERE chat_id=? ORDER BY device_id', (chat_id,)
+    )
+    return [dict(row) for row in rows]
+
+@db_helper
+def bind_device(chat_id, device_id):
+    register_device(device_id)
+    with db.transaction() as c:
+        c.execute('UPDATE user_devices SET selected=0 WHERE chat_id=?', (chat_id,))
+        c.execute('''
+            INSERT INTO user_devices (chat_id, device_id, selected) VALUES (?, ?, 1)
+            ON CONFLICT (chat_id, device_id) DO UPDATE SET selected=1
+        ''', (chat_id, device_id))
+    chat_devices[chat_id] = device_id
+
+@db_helper
+def select_device(chat_id, device_id):
+    with db.transaction() as c:
+        owned = c.execute(
+            'SELECT 1 FROM user_devices WHERE chat_id=? AND device_id=?', (chat_id, device_id)
+        ).fetchone()
+        if not owned:
+            return False
+        c.execute('UPDATE user_devices SET selected=(device_id=?) WHERE chat_id=?', (device_id, chat_id))
+    chat_devices[chat_id] = device_id
+    return True
+
+@db_helper
+def get_device_chats(device_id):
+    return [row[0] for row in db.query_all('SELECT chat_id FROM user_devices WHERE device_id=?', (device_id,))]
+
+@db_helper
+def get_chat_device(chat_id):
+    device_id = chat_devices.get(chat_id)
+    if device_id is None:
+        row = db.query_one(
+            'SELECT device_id FROM user_devices WHERE chat_id=? ORDER BY selected DESC, device_id LIMIT 1',
+            (chat_id,)
+        )
+        # чат без прив'язок працює з основним мотоциклом, як і раніше
+        device_id = row[0] if row else ESP32_DEVICE_ID
+        chat_devices[chat_id] = device_id
+    return device_id
+
+
+@db_helper
 def save_setting(key, value):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, str(value)))
-    conn.commit()
-    conn.close()
+    db.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, str(value)))
 
+@db_helper
 def get_setting(key, default=None):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT value FROM settings WHERE key=?', (key,))
-    row = c.fetchone()
-    conn.close()
+    row = db.query_one('SELECT value FROM settings WHERE key=?', (key,))
     return row[0] if row else default
 
+# ==========  ALERTS  ==========
+async def send_alert_message(chat_id, text):
+    await bot_app.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+
+alert_sender = RateLimitedSender(send_alert_message, rate=ALERT_RATE)
+
+def send_alert(device_id, rule, value, sample):
+    # потік записувача телеметрії: лише ставимо повідомлення в чергу циклу PTB
+    text = f"{rule.message.format(value=value)}\n🏍 {device_id}"
+    for chat_id in get_device_chats(device_id) or [ADMIN_CHAT_ID]:
+        alert_sender.submit(chat_id, text)
+
+alerts = AlertEngine(notify=send_alert, max_age=ALERT_MAX_AGE)
+ingest_queue.add_listener(alerts.process)
+
+@db_helper
+def park_device(device_id, lat, lon):
+    alerts.park(device_id, lat, lon)
+    save_setting(f'park:{device_id}', f'{lat},{lon}')
+
+@db_helper
+def unpark_device(device_id):
+    db.execute('DELETE FROM settings WHERE key=?', (f'park:{device_id}',))
+    return alerts.unpark(device_id)
+
+@db_helper
+def load_parking():
+    for key, value in db.query_all("SELECT key, value FROM settings WHERE key LIKE 'park:%'"):
+        lat, lon = value.split(',')
+        alerts.park(key[len('park:'):], float(lat), float(lon))
+
+def send_geofence_event(device_id, fence, event, sample):
+    verb = "заїхав у зону" if event == 'enter' else "виїхав із зони"
+    text = f"📍 {device_id} {verb} «{fence['name']}»"
+    for chat_id in get_device_chats(device_id) or [ADMIN_CHAT_ID]:
+        alert_sender.submit(chat_id, text)
+
+geofences = GeofenceMonitor(notify=send_geofence_event, max_age=ALERT_MAX_AGE)
+ingest_queue.add_listener(geofences.process)
+
+@db_helper
+def add_geofence(device_id, name, lat, lon, radius_m):
+    cur = db.execute(
+        'INSERT INTO geofences (device_id, name, latitude, longitude, radius_m) VALUES (?, ?, ?, ?, ?)',
+        (device_id, name, lat, lon, radius_m)
+    )
+    fence = {'id': cur.lastrowid, 'device_id': device_id, 'name': name,
+             'latitude': lat, 'longitude': lon, 'radius_m': radius_m}
+    geofences.add(fence)
+    return fence
+
+@db_helper
+def delete_geofence(device_id, fence_id):
+    cur = db.execute('DELETE FROM geofences WHERE id=? AND device_id=?', (fence_id, device_id))
+    if cur.rowcount:
+        geofences.remove(fence_id)
+    return cur.rowcount > 0
+
+# ==========  HISTORY  ==========
+@db_helper
+def get_day_summary(device_id, day=None):
+    # доба за місцевим часом = 24 годинні агрегати, незалежно від обсягу сирих даних
+    tz = pytz.timezone(TIMEZONE)
+    day = day or (datetime.now(tz) - timedelta(days=1)).date()
+    start = tz.localize(datetime(day.year, day.month, day.day))
+    end = tz.localize(datetime(day.year, day.month, day.day) + timedelta(days=1))
+    hours = rollups.history(device_id, '1h', start.timestamp(), end.timestamp())
+    if not hours:
+        return None
+    engine_max = [h['engine_temperature']['max'] for h in hours if h['engine_temperature']['max'] is not None]
+    akk_min = [h['batteryAkkVoltage']['min'] for h in hours if h['batteryAkkVoltage']['min'] is not None]
+    return {
+        "day": day.isoformat(),
+        "samples": sum(h['samples'] for h in hours),
+        "distance": sum(h['distance'] for h in hours),
+        "fuel_used": sum(h['fuel_used'] for h in hours),
+        "engine_max": max(engine_max) if engine_max else None,
+        "akk_min": min(akk_min) if akk_min else None,
+    }
+
+@db_helper
+def export_to_file(fmt, device_id, days):
+    """Експорт останніх days діб у тимчасовий файл (для відправки ботом).
+    Повертає (файл, розмір) або (None, розмір), якщо файл завеликий для Telegram."""
+    since = export.parse_bound(time.time() - days * 86400)
+    out = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+    for part in export.stream_export(db, fmt, device_id, since, chunk=EXPORT_CHUNK_SIZE):
+        out.write(part)
+        if out.tell() > EXPORT_BOT_MAX_BYTES:
+            out.close()
+            return None, EXPORT_BOT_MAX_BYTES
+    size = out.tell()
+    out.seek(0)
+    return out, size
+
+@db_helper
+def run_retention():
+    deleted = rollups.prune(raw_days=RAW_RETENTION_DAYS, keep=ROLLUP_RETENTION_DAYS)
+    deleted += geo_index.prune(GEO_RETENTION_DAYS)
+    if deleted:
+        print(f"🧹 Видалено застарілих рядків: {deleted}")
+
+@db_helper
+def replay_late():
+    # зразки з офлайн-буфера, старші за вже оброблені, агрегати й поїздки пропустили —
+    # перераховуємо ці пристрої від часу найстаршого такого зразка
+    devices = rollups.rebuild_late()
+    samples, stored = trips.replay_late()
+    if devices or samples:
+        print(f"🔁 Перераховано запізнілу телеметрію: агрегати {devices} пристр., "
+              f"поїздки з {samples} зразків ({stored} поїздок)")
+
+@db_helper
+def optimize_db():
+    # ANALYZE лише там, де статистика застаріла, і стиснення WAL після нічної чистки
+    db.execute('PRAGMA optimize')
+    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+@db_helper
+def vacuum_db():
+    # VACUUM тримає лок запису весь час роботи (записувач телеметрії чекає
+    # і накопичує чергу), тож робимо його, лише коли вільних сторінок багато
+    pages = db.query_one('PRAGMA page_count')[0]
+    free = db.query_one('PRAGMA freelist_count')[0]
+    if not pages or free / pages < VACUUM_MIN_FREE_RATIO:
+        return
+    started = time.monotonic()
+    db.execute('VACUUM')
+    print(f"🧹 VACUUM: звільнено {free} сторінок за {time.monotonic() - started:.1f} с")
+
+# ==========  ASYNC DB FACADE  ==========
+# Обробники бота працюють у циклі asyncio і ходять у БД лише через ці обгортки.
+# get_last_telemetry читає кеш у пам'яті, тому лишається синхронною.
+db_executor = AsyncDB(max_workers=DB_EXECUTOR_WORKERS)
+add_command_async = db_executor.wrap(add_command)
+save_setting_async = db_executor.wrap(save_setting)
+get_setting_async = db_executor.wrap(get_setting)
+get_user_devices_async = db_executor.wrap(get_user_devices)
+bind_device_async = db_executor.wrap(bind_device)
+select_device_async = db_executor.wrap(select_device)
+get_chat_device_async = db_executor.wrap(get_chat_device)
+get_day_summary_async = db_executor.wrap(get_day_summary)
+get_last_trips_async = db_executor.wrap(timed(DB_SECONDS, 'last_trips', DB_ERRORS, outermost=True)(trips.last_trips))
+export_to_file_async = db_executor.wrap(export_to_file)
+get_analytics_async = db_executor.wrap(timed(DB_SECONDS, 'analytics_report', DB_ERRORS, outermost=True)(analytics.report))
+park_device_async = db_executor.wrap(park_device)
+unpark_device_async = db_executor.wrap(unpark_device)
+add_geofence_async = db_executor.wrap(add_geofence)
+delete_geofence_async = db_executor.wrap(delete_geofence)
+
+async def current_device_id(update: Update):
+    chat_id = update.effective_chat.id
+    device_id = chat_devices.get(chat_id)
+    if device_id is None:
+        device_id = await get_chat_device_async(chat_id)
+    return device_id
+
 # ==========  WEATHER  ==========
-def get_weather(lat, lon):
-    try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&lang=ua&appid={OPENWEATHER_API}"
-        r = requests.get(url)
-        w = r.json()
-        return f"🌤 {w['weather'][0]['description'].capitalize()}, {w['main']['temp']}°C, Вологість: {w['main']['humidity']}%"
-    except Exception as e:
-        return "⚠️ Не вдалося отримати погоду."
+weather_client = WeatherClient(OPENWEATHER_API, base_url=OPENWEATHER_URL, ttl=WEATHER_CACHE_TTL)
+
+async def get_weather(lat, lon):
+    return await weather_client.get(lat, lon)
 
 # ==========  TELEGRAM BOT ==========
 
@@ -220,10 +595,11 @@ HEAD_MENU = [
     [KeyboardButton("📊 Статус"), KeyboardButton("🌤 Погода")],
     [KeyboardButton("⛽️ Дизель"), KeyboardButton("🛵 Пробіг")],
     [KeyboardButton("⚙️ Управління"), KeyboardButton("🧰 ТО")],
-    [KeyboardButton("🛠 Налаштування")]
+    [KeyboardButton("🛠 Налаштування"), KeyboardButton("🏁 Поїздки")]
 ]
 FUEL_MENU = [
     [KeyboardButton("🛢 Залишок"), KeyboardButton("⛽ Заправився")],
+    [KeyboardButton("⛽ Аналітика")],
     [KeyboardButton("⬅️ Назад")]
 ]
 MANAGE_MENU = [
@@ -241,6 +617,21 @@ SETTING_MENU = [
     [KeyboardButton("🌚 Енергозберігаючий режим"), KeyboardButton("🌞 Пробудження")],
     [KeyboardButton("⬅️ Назад")]
 ]
+# ReplyKeyboardMarkup незмінні — будуємо один раз, а не на кожне натискання
+HEAD_KEYBOARD = ReplyKeyboardMarkup(HEAD_MENU, resize_keyboard=True)
+FUEL_KEYBOARD = ReplyKeyboardMarkup(FUEL_MENU, resize_keyboard=True)
+MANAGE_KEYBOARD = ReplyKeyboardMarkup(MANAGE_MENU, resize_keyboard=True)
+SERVICE_KEYBOARD = ReplyKeyboardMarkup(SERVICE_MENU, resize_keyboard=True)
+SETTING_KEYBOARD = ReplyKeyboardMarkup(SETTING_MENU, resize_keyboard=True)
+
+# Що означатиме наступний вільний текст користувача: user_data['state'] =
+# (стан, аргумент). Як fallbacks у ConversationHandler, натиснута кнопка
+# меню завжди має пріоритет і скидає стан.
+STATE_REFUEL = 'refuel_amount'
+STATE_PIN = 'pin'
+
+def set_state(context, state, arg=None):
+    context.user_data['state'] = (state, arg)
 
 def make_status_text(data):
     if not data:
@@ -263,6 +654,57 @@ def make_status_text(data):
     )
     return text
 
+def make_trips_text(last_trips, open_trip=None):
+    tz = pytz.timezone(TIMEZONE)
+    lines = ["🏁 <b>Останні поїздки:</b>"]
+    if open_trip:
+        lines.append(f"🟢 Зараз у дорозі: {open_trip['distance']:.1f} км")
+    if not last_trips and not open_trip:
+        return "🏁 Поїздок ще немає."
+    for trip in last_trips:
+        start = datetime.strptime(trip['start_time'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=pytz.utc).astimezone(tz)
+        end = datetime.strptime(trip['end_time'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=pytz.utc).astimezone(tz)
+        minutes = int((end - start).total_seconds() // 60)
+        line = (
+            f"\n📅 {start:%d.%m %H:%M}–{end:%H:%M} ({minutes} хв)\n"
+            f"🛣 {trip['distance']:.1f} км, ⛽ {trip['fuel_burned']:.2f} л"
+        )
+        if trip['avg_consumption'] is not None:
+            line += f", {trip['avg_consumption']:.1f} л/100км"
+        if trip['max_engine_temperature'] is not None:
+            line += f"\n🌡 Макс. {trip['max_engine_temperature']:.0f}°C"
+        lines.append(line)
+    return "\n".join(lines)
+
+def make_analytics_text(report):
+    if not report or report['samples'] < 2 or 'distance' not in report:
+        return "⛽ Для аналітики поки замало даних."
+    tz = pytz.timezone(TIMEZONE)
+    since = datetime.fromtimestamp(report['since'], tz)
+    lines = [
+        f"⛽ <b>Аналітика з {since:%d.%m}:</b>",
+        f"🛣 {report['distance']:.1f} км, витрачено {report['fuel_used']:.2f} л",
+    ]
+    if report['avg_consumption'] is not None:
+        lines.append(f"🛢 Середній розхід: {report['avg_consumption']:.2f} л/100км")
+    if report['rolling_consumption'] is not None:
+        lines.append(f"📉 За останні {report['rolling_km']:.0f} км: {report['rolling_consumption']:.2f} л/100км")
+    if report['by_temperature']:
+        lines.append("\n🌡 <b>Розхід за температурою повітря:</b>")
+        for low, high, km, consumption in report['by_temperature']:
+            band = f"до {high:.0f}°C" if low is None else f"від {low:.0f}°C" if high is None else f"{low:.0f}…{high:.0f}°C"
+            lines.append(f"• {band}: {consumption:.2f} л/100км ({km:.0f} км)")
+    if report['refuels']:
+        lines.append("\n⛽ <b>Заправки:</b>")
+        for when, liters, before, after in report['refuels'][-3:]:
+            lines.append(f"• {datetime.fromtimestamp(when, tz):%d.%m %H:%M}: +{liters:.1f} л ({before:.1f} → {after:.1f})")
+    if report['range_km'] is not None:
+        line = f"\n🔮 Запас ходу за трендом: {report['range_km']:.0f} км ({report['range_consumption']:.2f} л/100км)"
+        if report['device_range_km'] is not None:
+            line += f"\n🛵 За оцінкою пристрою: {report['device_range_km']:.0f} км"
+        lines.append(line)
+    return "\n".join(lines)
+
 async def delete_message_job(context: ContextTypes.DEFAULT_TYPE):
     chat_id, message_id = context.job.data
     try:
@@ -282,7 +724,7 @@ async def reply_and_delete(update: Update, context: ContextTypes.DEFAULT_TYPE, t
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text( 
         "Вітаю! Я HiSha.\nГотовa розпочати:",
-        reply_markup=ReplyKeyboardMarkup(HEAD_MENU, resize_keyboard=True)
+        reply_markup=HEAD_KEYBOARD
     )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -299,227 +741,712 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/reset_all — Зброс(ПІН)\n"
         "/power_save_on — Увімкнути енергозберігаючий режим(ПІН)\n"
         "/power_save_off — Вимкнути енергозберігаючий режим(ПІН)\n"
+        "/trips — Останні поїздки\n"
+        "/export [csv|gpx|parquet] [днів] — Вивантажити історію\n"
+        "/park — Охорона: сповістити, якщо мотоцикл зрушить\n"
+        "/unpark — Зняти з охорони\n"
+        "/report [ГГ:ХХ|off] — Час щоденного звіту\n"
+        "/zones — Геозони\n"
+        "/zone_add НАЗВА [РАДІУС_М] — Зона навколо поточної точки\n"
+        "/zone_del ID — Видалити геозону\n"
+        "/devices — Мої пристрої\n"
+        "/bind ID PIN — Прив'язати пристрій\n"
+        "/use ID — Вибрати активний пристрій\n"
         "/help — Список команд"
     )
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = get_last_telemetry()
+    device_id = await current_device_id(update)
+    data = get_last_telemetry(device_id)
     await update.message.reply_html(make_status_text(data))
 
 async def location(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = get_last_telemetry()
+    device_id = await current_device_id(update)
+    data = get_last_telemetry(device_id)
     if not data:
         await update.message.reply_text("❌ Дані ще не надійшли.")
         return
     await update.message.reply_location(data['latitude'], data['longitude'])
 
 async def refuel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    device_id = await current_device_id(update)
     try:
         liters = float(context.args[0])
-        add_command("refuel", str(liters))
+        await add_command_async("refuel", str(liters), device_id=device_id)
         await update.message.reply_text(f"✅ Заправка на {liters} л відправлена пристрою.")
     except Exception:
         await update.message.reply_text("❗️ Використання: /refuel 5")
 
 async def ignite(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await reply_and_delete(update, context, "Введіть PIN для запуску запалення:", delete_user_msg=True)
-    context.user_data['awaiting_pin'] = 'ignite'
+    set_state(context, STATE_PIN, 'ignite')
 
 async def starter(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await reply_and_delete(update, context, "Введіть PIN для запуску стартера:", delete_user_msg=True)
-    context.user_data['awaiting_pin'] = 'starter'
+    set_state(context, STATE_PIN, 'starter')
 
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    add_command("stop_ignition")
-    add_command("stop_starter")
+    device_id = await current_device_id(update)
+    await add_command_async("stop_ignition", device_id=device_id)
+    await add_command_async("stop_starter", device_id=device_id)
     await reply_and_delete(update, context, "✅ Відправлено: вимкнення запалення та стартера.", delete_user_msg=True)
 
 async def reset_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await reply_and_delete(update, context, "Введіть PIN для збросу значень:", delete_user_msg=True)
-    context.user_data['awaiting_pin'] = 'reset_all'
+    set_state(context, STATE_PIN, 'reset_all')
 
 async def power_save_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await reply_and_delete(update, context, "Введіть PIN для увімкнення енергозберігаючого режиму:", delete_user_msg=True)
-    context.user_data['awaiting_pin'] = 'power_save_on'
+    set_state(context, STATE_PIN, 'power_save_on')
 
 async def power_save_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await reply_and_delete(update, context, "Введіть PIN для вимкнення енергозберігаючого режиму:", delete_user_msg=True)
-    context.user_data['awaiting_pin'] = 'power_save_off'
+    set_state(context, STATE_PIN, 'power_save_off')
 
 async def service_oil_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    save_setting('oil_last_reset', datetime.now(pytz.timezone(TIMEZONE)).isoformat())
+    await save_setting_async('oil_last_reset', datetime.now(pytz.timezone(TIMEZONE)).isoformat())
     await update.message.reply_text("✅ Лічильник масла скинуто!")
 
 async def service_chain_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    save_setting('chain_last_reset', datetime.now(pytz.timezone(TIMEZONE)).isoformat())
+    await save_setting_async('chain_last_reset', datetime.now(pytz.timezone(TIMEZONE)).isoformat())
     await update.message.reply_text("✅ Лічильник ланцюга скинуто!")
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text
-    if text == "Старт 🚀":
-        await start(update, context)
-    elif text == "📊 Статус":
-        await status(update, context)
-    elif text == "🛵 Пробіг":
-        data = get_last_telemetry()
-        if data:
-           await update.message.reply_text(f"🏍 Загальний пробіг: {data['totalDistance']:.2f} км")
-           await update.message.reply_text(f"🛵 Пробіг сьогодні: {data['dailyDistance']:.2f} км")
-        else:
-            await update.message.reply_text("❌ Дані ще не надійшли.")
-    elif text == "⛽️ Дизель": 
-        await update.message.reply_text("Меню пального:", reply_markup=ReplyKeyboardMarkup(FUEL_MENU, resize_keyboard=True))
-    elif text == "🛢 Залишок":
-        data = get_last_telemetry()
-        if data:
-           await update.message.reply_text(f"🛢 Дизель: {data['fuel_liters']:.2f} л")
-           await update.message.reply_text(f"⚡️ Імпульси: {data['fuel_pulses']}")
-           await update.message.reply_text(f"⛽️ Середній розхід: {data['totalAvgConsumption']:.2f} л/100 км")
-           await update.message.reply_text(f"⛽️ Середній розхід сьогодні: {data['dailyAvgConsumption']:.2f} л/100 км")
-           await update.message.reply_text(f"🛣 Проїхати можна ще: {data['distanceRemCharge']:.2f} км")
-        else:
-            await update.message.reply_text("❌ Дані ще не надійшли.")
-    elif context.user_data.get('awaiting_refuel'):
+async def show_trips(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    device_id = await current_device_id(update)
+    last_trips = await get_last_trips_async(device_id)
+    await update.message.reply_html(make_trips_text(last_trips, trips.open_trip(device_id)))
+
+async def export_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+    fmt = args[0].lower() if args else 'csv'
+    try:
+        days = float(args[1]) if len(args) > 1 else 1.0
+    except ValueError:
+        days = 0
+    if fmt not in export.FORMATS or not 0 < days <= 366:
+        await update.message.reply_text("❗️ Використання: /export [csv|gpx|parquet] [днів]")
+        return
+    if fmt == 'parquet' and not export.PARQUET_AVAILABLE:
+        await update.message.reply_text("❌ Parquet недоступний на сервері (потрібен pyarrow).")
+        return
+    device_id = await current_device_id(update)
+    out, size = await export_to_file_async(fmt, device_id, days)
+    if out is None:
+        await update.message.reply_text(
+            f"❌ Файл більший за {size // (1024 * 1024)} МБ — зменшіть період або скористайтесь HTTP-експортом /export."
+        )
+        return
+    with out:
+        filename = f"{device_id}-{datetime.now(pytz.timezone(TIMEZONE)):%Y%m%d-%H%M}.{export.FORMATS[fmt][1]}"
+        await update.message.reply_document(document=out, filename=filename)
+
+async def show_analytics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    device_id = await current_device_id(update)
+    report = await get_analytics_async(device_id)
+    await update.message.reply_html(make_analytics_text(report))
+
+async def park(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    device_id = await current_device_id(update)
+    data = get_last_telemetry(device_id)
+    if not data or data.get('latitude') is None or not (data['latitude'] or data['longitude']):
+        await update.message.reply_text("❌ Немає координат GPS, охорону не ввімкнено.")
+        return
+    await park_device_async(device_id, data['latitude'], data['longitude'])
+    await update.message.reply_text("🛡 Охорону ввімкнено: повідомлю, якщо мотоцикл зрушить з місця.")
+
+async def unpark(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    device_id = await current_device_id(update)
+    if await unpark_device_async(device_id):
+        await update.message.reply_text("🔓 Охорону вимкнено.")
+    else:
+        await update.message.reply_text("ℹ️ Охорона й так не ввімкнена.")
+
+async def report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    if not context.args:
+        times = await db_executor.call(get_report_times)
+        current = times.get(chat_id)
+        await update.message.reply_text(
+            (f"🕊 Щоденний звіт о {current}." if current else "🕊 Щоденний звіт вимкнено.")
+            + "\nЗмінити: /report ГГ:ХХ, вимкнути: /report off"
+        )
+        return
+    value = context.args[0].lower()
+    if value != 'off':
         try:
-            liters = float(text.replace(',', '.'))  # дозволяємо 1.5 або 1,5
-            add_command("refuel", str(liters))
-            await update.message.reply_text(f"✅ Заправка на {liters} л відправлена пристрою.")
+            hour, minute = parse_report_time(value)
         except ValueError:
-            await update.message.reply_text("❗️ Невірний формат — введіть число, наприклад: 5 або 1.5")
-        finally:
-            context.user_data.pop('awaiting_refuel', None)
+            await update.message.reply_text("❗️ Використання: /report 08:00 або /report off")
+            return
+        value = f"{hour:02d}:{minute:02d}"
+    await set_report_time_async(chat_id, value)
+    if value == 'off':
+        await update.message.reply_text("🔕 Щоденний звіт вимкнено.")
+    else:
+        await update.message.reply_text(f"✅ Щоденний звіт щодня о {value}.")
+
+async def zones(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    device_id = await current_device_id(update)
+    fences = geofences.fences(device_id)
+    if not fences:
+        await update.message.reply_text("📍 Геозон ще немає. Додати: /zone_add НАЗВА [РАДІУС_М]")
         return
-    elif text == "⛽ Заправився":
-        context.user_data['awaiting_refuel'] = True
-        await update.message.reply_text("Введіть, будь ласка, кількість літрів:")
-    elif text == "🌤 Погода":
-        data = get_last_telemetry()
-        if data:
-            weather = get_weather(data['latitude'], data['longitude'])
-            await update.message.reply_text(weather)
-        else:
-            await update.message.reply_text("❌ Дані ще не надійшли.")
-    elif text == "⚙️ Управління":
-        await update.message.reply_text("Меню керування:", reply_markup=ReplyKeyboardMarkup(MANAGE_MENU, resize_keyboard=True))
-    elif text == "🛠 Налаштування":
-        await update.message.reply_text("Меню керування:", reply_markup=ReplyKeyboardMarkup(SETTING_MENU, resize_keyboard=True))
-    elif text == "🧰 ТО":
-        await update.message.reply_text("Меню ТО:", reply_markup=ReplyKeyboardMarkup(SERVICE_MENU, resize_keyboard=True))
-    elif text == "⬅️ Назад":
-        await update.message.reply_text("Повертаюся в головне меню.", reply_markup=ReplyKeyboardMarkup(HEAD_MENU, resize_keyboard=True))
-    elif text == "🧮 Обнулити лічильники":
-        await reset_all(update, context)
-    elif text == "🌚 Енергозберігаючий режим":
-        await power_save_on(update, context)
-    elif text == "🌞 Пробудження":
-        await power_save_off(update, context)
-    elif text == "🔑 Увімкнути запалення":
-        await ignite(update, context)
-    elif text == "🗝 Завести двигун":
-        await starter(update, context)
-    elif text == "🛑 Заглушити двигун":
-        await stop(update, context)
-    elif text == "🚫 Вимкнути запалення":
-        add_command("stop_ignition")
-        await update.message.reply_text("✅ Запалення вимкнено.")
-    elif text == "ℹ️ Нагадування":
-        data = get_last_telemetry()
-        if data:
-            oil_left = data.get('oilServiceLeft')
-            chain_left = data.get('chainServiceLeft')
-            await update.message.reply_text(
-                f"🔗 До мастки ланцюга: {int(chain_left)} км\n🛢 До заміни масла: {int(oil_left)} км"
-            )
-        else:
-            await update.message.reply_text("❌ Дані ще не надійшли.")
-    elif text == "✅ Змастив цеп":
-        add_command("reset_chain")
-        await update.message.reply_text("✅ Лічильник ланцюга скинуто!")
-    elif text == "✅ Замінив масло":
-        add_command("reset_oil")
-        await update.message.reply_text("✅ Лічильник масла скинуто!")
+    lines = [f"{f['id']}. {f['name']} — {f['radius_m']:.0f} м" for f in fences]
+    await update.message.reply_text("📍 Геозони:\n" + "\n".join(lines) + "\n\nВидалити: /zone_del ID")
+
+async def zone_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+    try:
+        radius = float(args[-1]) if len(args) > 1 else 200.0
+        name = " ".join(args[:-1] if len(args) > 1 else args)
+    except ValueError:
+        radius, name = 200.0, " ".join(args)
+    if not name or not 10 <= radius <= 50000:
+        await update.message.reply_text("❗️ Використання: /zone_add НАЗВА [РАДІУС_М]")
+        return
+    device_id = await current_device_id(update)
+    data = get_last_telemetry(device_id)
+    if not data or data.get('latitude') is None or not (data['latitude'] or data['longitude']):
+        await update.message.reply_text("❌ Немає координат GPS.")
+        return
+    fence = await add_geofence_async(device_id, name, data['latitude'], data['longitude'], radius)
+    await update.message.reply_text(f"✅ Зону «{name}» ({radius:.0f} м) додано, ID {fence['id']}.")
+
+async def zone_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args or []) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text("❗️ Використання: /zone_del ID")
+        return
+    device_id = await current_device_id(update)
+    if await delete_geofence_async(device_id, int(context.args[0])):
+        await update.message.reply_text("🗑 Зону видалено.")
+    else:
+        await update.message.reply_text("❌ Такої зони немає.")
+
+async def devices(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    owned = await get_user_devices_async(update.effective_chat.id)
+    if not owned:
+        await update.message.reply_text(
+            f"🏍 Активний пристрій: {await current_device_id(update)}\n"
+            "Щоб додати свій: /bind ID PIN"
+        )
+        return
+    lines = [("✅ " if d['selected'] else "▫️ ") + d['device_id'] for d in owned]
+    await update.message.reply_text("🏍 Ваші пристрої:\n" + "\n".join(lines) + "\n\nПеремкнути: /use ID")
+
+async def bind(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) != 2:
+        await reply_and_delete(update, context, "❗️ Використання: /bind ID PIN", delete_user_msg=True)
+        return
+    device_id, pin = context.args
+    if pin != MASTER_PIN:
+        await reply_and_delete(update, context, "❌ Невірний PIN.", delete_user_msg=True)
+        return
+    await bind_device_async(update.effective_chat.id, device_id)
+    await reply_and_delete(update, context, f"✅ Пристрій {device_id} додано і вибрано.", delete_user_msg=True)
+
+async def use_device(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) != 1:
+        await update.message.reply_text("❗️ Використання: /use ID")
+        return
+    if await select_device_async(update.effective_chat.id, context.args[0]):
+        await update.message.reply_text(f"✅ Активний пристрій: {context.args[0]}")
+    else:
+        await update.message.reply_text("❌ Цей пристрій не прив'язано. Спершу /bind ID PIN")
+
+# ==========  MESSAGE ROUTER  ==========
+# Текст кнопки -> обробник: один пошук у dict замість ланцюжка if/elif.
+# Вільний текст трактується за станом користувача (див. set_state).
+
+# дія, що чекає PIN -> (команда пристрою, відповідь)
+PIN_COMMANDS = {
+    'ignite': ("start_ignition", "✅ Запалення ввімкнено!"),
+    'starter': ("start_starter", "✅ Стартер ввімкнено!"),
+    'reset_all': ("reset_all", "✅ Лічильники скинуто!"),
+    'power_save_on': ("power_save_on", "✅ Спимо!"),
+    'power_save_off': ("power_save_off", "✅ Прокинулась!"),
+}
+
+def show_menu(title, keyboard):
+    async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await update.message.reply_text(title, reply_markup=keyboard)
+    return handler
+
+def device_command(cmd_type, reply):
+    async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await add_command_async(cmd_type, device_id=await current_device_id(update))
+        await update.message.reply_text(reply)
+    return handler
+
+async def show_mileage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    data = get_last_telemetry(await current_device_id(update))
+    if data:
+        await update.message.reply_text(f"🏍 Загальний пробіг: {data['totalDistance']:.2f} км")
+        await update.message.reply_text(f"🛵 Пробіг сьогодні: {data['dailyDistance']:.2f} км")
     else:
-        if context.user_data.get('awaiting_pin'):
-            pin_action = context.user_data.pop('awaiting_pin')
-            if text.strip() == MASTER_PIN:
-                if pin_action == 'ignite':
-                    add_command("start_ignition", MASTER_PIN)
-                    await reply_and_delete(update, context, "✅ Запалення ввімкнено!", delete_user_msg=True)
-                elif pin_action == 'starter':
-                    add_command("start_starter", MASTER_PIN)
-                    await reply_and_delete(update, context, "✅ Стартер ввімкнено!", delete_user_msg=True)
-                elif pin_action == 'reset_all':
-                    add_command("reset_all", MASTER_PIN)
-                    await reply_and_delete(update, context, "✅ Лічильники скинуто!", delete_user_msg=True)
-                elif pin_action == 'power_save_on':
-                    add_command("power_save_on", MASTER_PIN)
-                    await reply_and_delete(update, context, "✅ Спимо!", delete_user_msg=True)
-                elif pin_action == 'power_save_off':
-                    add_command("power_save_off", MASTER_PIN)
-                    await reply_and_delete(update, context, "✅ Прокинулась!", delete_user_msg=True)
-            else:
-                await reply_and_delete(update, context, "❌ Невірний PIN.", delete_user_msg=True)
-        else:
-            await reply_and_delete(update, context, "❓ Невідома команда. Спробуйте /help", delete_user_msg=True)
+        await update.message.reply_text("❌ Дані ще не надійшли.")
+
+async def show_fuel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    data = get_last_telemetry(await current_device_id(update))
+    if data:
+        await update.message.reply_text(f"🛢 Дизель: {data['fuel_liters']:.2f} л")
+        await update.message.reply_text(f"⚡️ Імпульси: {data['fuel_pulses']}")
+        await update.message.reply_text(f"⛽️ Середній розхід: {data['totalAvgConsumption']:.2f} л/100 км")
+        await update.message.reply_text(f"⛽️ Середній розхід сьогодні: {data['dailyAvgConsumption']:.2f} л/100 км")
+        await update.message.reply_text(f"🛣 Проїхати можна ще: {data['distanceRemCharge']:.2f} км")
+    else:
+        await update.message.reply_text("❌ Дані ще не надійшли.")
+
+async def ask_refuel_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    set_state(context, STATE_REFUEL)
+    await update.message.reply_text("Введіть, будь ласка, кількість літрів:")
+
+async def show_weather(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    data = get_last_telemetry(await current_device_id(update))
+    if data:
+        weather = await get_weather(data['latitude'], data['longitude'])
+        await update.message.reply_text(weather)
+    else:
+        await update.message.reply_text("❌ Дані ще не надійшли.")
+
+async def show_service_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    data = get_last_telemetry(await current_device_id(update))
+    if data:
+        oil_left = data.get('oilServiceLeft')
+        chain_left = data.get('chainServiceLeft')
+        await update.message.reply_text(
+            f"🔗 До мастки ланцюга: {int(chain_left)} км\n🛢 До заміни масла: {int(oil_left)} км"
+        )
+    else:
+        await update.message.reply_text("❌ Дані ще не надійшли.")
+
+async def on_refuel_amount(update: Update, context: ContextTypes.DEFAULT_TYPE, _):
+    try:
+        liters = float(update.message.text.replace(',', '.'))  # дозволяємо 1.5 або 1,5
+    except ValueError:
+        await update.message.reply_text("❗️ Невірний формат — введіть число, наприклад: 5 або 1.5")
+        return
+    await add_command_async("refuel", str(liters), device_id=await current_device_id(update))
+    await update.message.reply_text(f"✅ Заправка на {liters} л відправлена пристрою.")
+
+async def on_pin(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    if update.message.text.strip() != MASTER_PIN:
+        await reply_and_delete(update, context, "❌ Невірний PIN.", delete_user_msg=True)
+        return
+    cmd_type, reply = PIN_COMMANDS[action]
+    await add_command_async(cmd_type, MASTER_PIN, device_id=await current_device_id(update))
+    await reply_and_delete(update, context, reply, delete_user_msg=True)
+
+async def unknown_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_and_delete(update, context, "❓ Невідома команда. Спробуйте /help", delete_user_msg=True)
+
+MESSAGE_ROUTES = {
+    "Старт 🚀": start,
+    "📊 Статус": status,
+    "🏁 Поїздки": show_trips,
+    "🛵 Пробіг": show_mileage,
+    "⛽️ Дизель": show_menu("Меню пального:", FUEL_KEYBOARD),
+    "🛢 Залишок": show_fuel,
+    "⛽ Аналітика": show_analytics,
+    "⛽ Заправився": ask_refuel_amount,
+    "🌤 Погода": show_weather,
+    "⚙️ Управління": show_menu("Меню керування:", MANAGE_KEYBOARD),
+    "🛠 Налаштування": show_menu("Меню керування:", SETTING_KEYBOARD),
+    "🧰 ТО": show_menu("Меню ТО:", SERVICE_KEYBOARD),
+    "⬅️ Назад": show_menu("Повертаюся в головне меню.", HEAD_KEYBOARD),
+    "🧮 Обнулити лічильники": reset_all,
+    "🌚 Енергозберігаючий режим": power_save_on,
+    "🌞 Пробудження": power_save_off,
+    "🔑 Увімкнути запалення": ignite,
+    "🗝 Завести двигун": starter,
+    "🛑 Заглушити двигун": stop,
+    "🚫 Вимкнути запалення": device_command("stop_ignition", "✅ Запалення вимкнено."),
+    "ℹ️ Нагадування": show_service_reminders,
+    "✅ Змастив цеп": device_command("reset_chain", "✅ Лічильник ланцюга скинуто!"),
+    "✅ Замінив масло": device_command("reset_oil", "✅ Лічильник масла скинуто!"),
+}
+STATE_HANDLERS = {
+    STATE_REFUEL: on_refuel_amount,
+    STATE_PIN: on_pin,
+}
+
+def route_message(text, user_data):
+    """(мітка гілки, обробник) для тексту. Стан знімається тут: і кнопка, і
+    вільний текст його закривають. Мітка не містить вільного тексту (PIN)."""
+    handler = MESSAGE_ROUTES.get(text)
+    state = user_data.pop('state', None)
+    if handler is not None:
+        return text, handler
+    if state is not None:
+        name, arg = state
+        state_handler = STATE_HANDLERS[name]
+        return name, lambda update, context: state_handler(update, context, arg)
+    return 'unknown', unknown_message
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    branch, handler = route_message(update.message.text, context.user_data)
+    started = time.perf_counter()
+    try:
+        await handler(update, context)
+    except Exception:
+        BOT_ERRORS.labels(branch).inc()
+        raise
+    finally:
+        BOT_SECONDS.labels(branch).observe(time.perf_counter() - started)
 
 # ==========  ESP32 API ==========
 @app.route('/esp32_push', methods=['POST'])
 def esp32_push():
-    data = request.json
-    save_telemetry(data)
+    try:
+        sample = validate_telemetry(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    if sample['device_id'] is None:
+        sample['device_id'] = ESP32_DEVICE_ID
+    if not ingest_queue.submit(sample):
+        # черга переповнена — пристрій має повторити пізніше
+        return jsonify({"status": "busy"}), 503, {"Retry-After": "1"}
+    latest_telemetry.update(sample)
+    register_device(sample['device_id'])
     return jsonify({"status": "ok"})
 
+@app.route('/esp32_push/bin', methods=['POST'])
+def esp32_push_bin():
+    # компактний формат, див. telemetry_codec.py; кілька зразків за запит
+    try:
+        samples = [validate_telemetry(s) for s in decode_telemetry(request.get_data())]
+    except (DecodeError, ValueError) as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    if not samples:
+        return jsonify({"status": "ok", "accepted": 0})
+    for sample in samples:
+        sample['device_id'] = sample['device_id'] or ESP32_DEVICE_ID
+    if not ingest_queue.submit_many(samples):
+        return jsonify({"status": "busy"}), 503, {"Retry-After": "1"}
+    latest_telemetry.update(samples[-1])
+    register_device(samples[-1]['device_id'])
+    return jsonify({"status": "ok", "accepted": len(samples)})
+
+@app.route('/esp32_push/bulk', methods=['POST'])
+def esp32_push_bulk():
+    """Вивантаження офлайн-буфера: NDJSON (один зразок на рядок), за потреби
+    з Content-Encoding: gzip. Тіло читається потоково і пишеться пачками по
+    BULK_CHUNK_SIZE рядків в одній транзакції; повтори за (device_id, device_seq)
+    відкидаються, тож обірване завантаження можна просто надіслати ще раз."""
+    stream = request.stream
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    received = inserted = invalid = 0
+    errors = []
+    latest = {}
+    chunk = []
+
+    def flush():
+        nonlocal inserted
+        inserted += len(ingest_queue.write(chunk, retry=False))
+        chunk.clear()
+
+    try:
+        for line_no, line in enumerate(io.BufferedReader(stream), 1):
+            if not line.strip():
+                continue
+            received += 1
+            try:
+                sample = validate_telemetry(json.loads(line))
+            except ValueError as e:  # json.JSONDecodeError теж ValueError
+                invalid += 1
+                if len(errors) < 20:
+                    errors.append({"line": line_no, "error": str(e)})
+                continue
+            sample['device_id'] = sample['device_id'] or ESP32_DEVICE_ID
+            chunk.append(sample)
+            latest[sample['device_id']] = sample
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                flush()
+        flush()
+    except (OSError, EOFError) as e:  # пошкоджений gzip або обірване з'єднання
+        return jsonify({"status": "error", "error": str(e), "received": received, "inserted": inserted}), 400
+    for device_id, sample in latest.items():
+        latest_telemetry.update(sample)
+        register_device(device_id)
+    return jsonify({
+        "status": "ok",
+        "received": received,
+        "inserted": inserted,
+        "duplicates": received - inserted - invalid,
+        "invalid": invalid,
+        "errors": errors,
+    })
+
+@app.route('/esp32_push/stats', methods=['GET'])
+def esp32_push_stats():
+    stats = ingest_queue.stats()
+    stats['commands'] = get_command_latency(request.args.get('device_id'))
+    stats['alerts'] = dict(alerts.stats, **alert_sender.stats)
+    stats['jobs'] = job_runner.stats()
+    return jsonify(stats)
+
+def pending_commands():
+    counts = {(device_id,): 0 for device_id in known_devices}
+    for device_id, n in db.query_all('SELECT device_id, COUNT(*) FROM commands WHERE executed=0 GROUP BY device_id'):
+        counts[(device_id,)] = n
+    return counts
+
+Gauge('commands_pending', "Непідтверджені команди пристрою", ('device_id',), collect=pending_commands)
+Gauge('device_last_push_age_seconds', "Секунд від останнього пушу телеметрії", ('device_id',),
+      collect=lambda: {(device_id,): age for device_id, age in latest_telemetry.push_ages().items()})
+StatsCollector('ingest', "Черга запису телеметрії (ingest_queue.stats)", lambda: ingest_queue.stats())
+StatsCollector('alerts', "Сповіщення і їх відправка", lambda: dict(alerts.stats, **alert_sender.stats))
+StatsCollector('weather', "Кеш погоди", lambda: weather_client.stats)
+profiler = SamplingProfiler()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    # лише з PROFILER_ENABLED: семплює всі потоки процесу ?seconds= секунд (займає один потік Flask)
+    if not PROFILER_ENABLED:
+        return jsonify({"status": "error", "error": "profiler disabled"}), 404
+    seconds = min(max(request.args.get('seconds', 10, type=float), 0.1), PROFILER_MAX_SECONDS)
+    stacks = profiler.run(seconds)
+    if stacks is None:
+        return jsonify({"status": "error", "error": "profiler busy"}), 409
+    return Response(SamplingProfiler.folded(stacks), mimetype='text/plain')
+
+@app.route('/history', methods=['GET'])
+def history():
+    device_id = request.args.get('device_id') or ESP32_DEVICE_ID
+    resolution = request.args.get('resolution', '1h')
+    if resolution not in RESOLUTIONS:
+        return jsonify({"status": "error", "error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+    try:
+        rows = rollups.history(device_id, resolution, request.args.get('since'), request.args.get('until'))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify({"device_id": device_id, "resolution": resolution, "history": rows})
+
+@app.route('/export', methods=['GET'])
+def export_telemetry():
+    """Потоковий експорт телеметрії: ?device_id=&since=&until=&format=csv|gpx|parquet.
+    Межі — unix-секунди або ISO 8601 (UTC, якщо без зони); until не включається."""
+    device_id = request.args.get('device_id') or ESP32_DEVICE_ID
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in export.FORMATS:
+        return jsonify({"status": "error", "error": f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    if fmt == 'parquet' and not export.PARQUET_AVAILABLE:
+        return jsonify({"status": "error", "error": "parquet export requires pyarrow"}), 501
+    try:
+        since = export.parse_bound(request.args.get('since'))
+        until = export.parse_bound(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    mimetype, ext = export.FORMATS[fmt]
+    body = export.stream_export(db, fmt, device_id, since, until, chunk=EXPORT_CHUNK_SIZE)
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{secure_filename(device_id) or "telemetry"}.{ext}"',
+    })
+
+@app.route('/geo/track', methods=['GET'])
+def geo_track():
+    """Де був пристрій: ?device_id=&since=&until=&tolerance=метрів (0 — без спрощення).
+    Діапазон довший за GEO_TRACK_MAX_POINTS зразків проріджується (step у відповіді)."""
+    device_id = request.args.get('device_id') or ESP32_DEVICE_ID
+    try:
+        since = export.parse_bound(request.args.get('since'))
+        until = export.parse_bound(request.args.get('until'))
+        tolerance = float(request.args.get('tolerance', 10))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify(geo_index.track(device_id, since, until, tolerance))
+
+@app.route('/geo/visits', methods=['GET'])
+def geo_visits():
+    """Візити біля точки: ?lat=&lon=&radius=метрів[&device_id=&since=&until=]."""
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        radius = min(float(request.args.get('radius', 100)), 50000)
+        since, until = request.args.get('since'), request.args.get('until')
+        visits = geo_index.visits(lat, lon, radius, request.args.get('device_id'), since, until)
+    except (KeyError, ValueError) as e:
+        return jsonify({"status": "error", "error": f"bad parameter: {e}"}), 400
+    return jsonify({"lat": lat, "lon": lon, "radius": radius, "visits": visits})
+
 @app.route('/esp32_push/commands', methods=['GET'])
 def esp32_get_commands():
-    device_id = request.args.get('device_id')
-    cmds = get_unexecuted_commands()
-    return jsonify({"commands": cmds})
+    device_id = request.args.get('device_id') or ESP32_DEVICE_ID
+    wait = min(max(request.args.get('wait', 0, type=float), 0), LONG_POLL_MAX_WAIT)
+    lease = min(max(request.args.get('lease', COMMAND_LEASE_SECONDS, type=float), 1), 3600)
+    deadline = time.monotonic() + wait
+    # long-poll: версію беремо до запиту в БД, щоб не проґавити команду між ними
+    version = command_notifier.version(device_id)
+    cmds = lease_commands(device_id, lease)
+    while not cmds:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # перечитуємо БД хоча б раз на LONG_POLL_RECHECK — команду міг додати інший процес
+        timeout = min(remaining, LONG_POLL_RECHECK)
+        expiry = next_lease_expiry(device_id)
+        if expiry is not None:
+            # прокинутись, коли спливе оренда непідтвердженої команди
+            timeout = max(0.0, min(timeout, expiry - time.time()))
+        new_version = command_notifier.wait(device_id, version, timeout)
+        if new_version is not None:
+            version = new_version
+        cmds = lease_commands(device_id, lease)
+    return jsonify({"commands": cmds, "lease": lease})
 
 @app.route('/esp32_push/commands/ack', methods=['POST'])
 def esp32_ack_command():
-    data = request.json
-    ack_command(data['command_id'])
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or 'command_id' not in data:
+        return jsonify({"status": "error", "error": "command_id is required"}), 400
+    try:
+        ack_command(data['command_id'], data.get('device_id'))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "error": "command_id must be an integer"}), 400
     return jsonify({"status": "acknowledged"})
 
+@app.route('/esp32_push/commands/ack_batch', methods=['POST'])
+def esp32_ack_commands():
+    data = request.get_json(silent=True) or {}
+    command_ids = data.get('command_ids')
+    if not isinstance(command_ids, list):
+        return jsonify({"status": "error", "error": "command_ids must be a list"}), 400
+    try:
+        acked = ack_commands(command_ids, data.get('device_id'))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "error": "command_ids must be integers"}), 400
+    return jsonify({"status": "acknowledged", "acked": acked})
+
 # ==========  AUTOREPORT ==========
-def send_daily_report():
-    data = get_last_telemetry()
+bot_loop = None  # цикл PTB, див. post_init
+
+def make_day_summary_text(summary):
+    if not summary:
+        return "📈 За вчора даних немає."
+    text = (
+        f"📈 <b>За вчора:</b> {summary['distance']:.1f} км, "
+        f"витрачено {summary['fuel_used']:.2f} л"
+    )
+    if summary['engine_max'] is not None:
+        text += f"\n🌡 Макс. температура двигуна: {summary['engine_max']:.1f}°C"
+    if summary['akk_min'] is not None:
+        text += f"\n⚡️ Мін. напруга акумулятора: {summary['akk_min']:.2f} V"
+    return text
+
+async def daily_report(chat_id):
+    device_id = await get_chat_device_async(chat_id)
+    data = get_last_telemetry(device_id)
     if data:
-        weather = get_weather(data['latitude'], data['longitude'])
+        weather = await get_weather(data['latitude'], data['longitude'])
+        summary = await get_day_summary_async(device_id)
         chain_left = int(data.get('chainServiceLeft', 0))
         oil_left = int(data.get('oilServiceLeft', 0))
         text = (
             "🕊 <b>Щоденний звіт</b>\n"
             + make_status_text(data) + "\n\n"
+            + make_day_summary_text(summary) + "\n\n"
             + weather + "\n\n"
             + f"🔗 До мастки ланцюга: {chain_left} км\n"
             + f"🛢 До заміни масла: {oil_left} км"
         )
-        try:
-            import asyncio
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                asyncio.create_task(bot_app.bot.send_message(chat_id=ADMIN_CHAT_ID, text=text, parse_mode='HTML'))
-            else:
-                loop.run_until_complete(bot_app.bot.send_message(chat_id=ADMIN_CHAT_ID, text=text, parse_mode='HTML'))
-        except Exception as e:
-            print("❌ Не вдалося надіслати щоденний звіт:", e)
-
-def setup_scheduler():
-    scheduler = BackgroundScheduler(timezone=TIMEZONE)
-    scheduler.add_job(send_daily_report, 'cron', hour=8, minute=0)
-    scheduler.start()
+        await bot_app.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+
+# ==========  JOBS  ==========
+job_runner = JobRunner(TIMEZONE, jitter=JOB_JITTER, misfire_grace=JOB_MISFIRE_GRACE, workers=JOB_WORKERS)
+
+def parse_report_time(value):
+    """'07:30' -> (7, 30); ValueError, якщо формат не той."""
+    parsed = datetime.strptime(value.strip(), '%H:%M')
+    return parsed.hour, parsed.minute
+
+@db_helper
+def get_report_times():
+    """{chat_id: 'HH:MM'} — налаштування чатів (settings 'report:<chat_id>')
+    поверх DAILY_REPORT_TIME для адміна."""
+    times = {ADMIN_CHAT_ID: DAILY_REPORT_TIME} if DAILY_REPORT_TIME else {}
+    for key, value in db.query_all("SELECT key, value FROM settings WHERE key LIKE 'report:%'"):
+        times[int(key[len('report:'):])] = value
+    return {chat_id: value for chat_id, value in times.items() if value != 'off'}
+
+def schedule_report(chat_id, value):
+    name = f'report:{chat_id}'
+    if value in (None, 'off'):
+        job_runner.remove(name)
+        return
+    hour, minute = parse_report_time(value)
+    job_runner.add(name, functools.partial(daily_report, chat_id), 'cron', hour=hour, minute=minute)
+
+@db_helper
+def set_report_time(chat_id, value):
+    save_setting(f'report:{chat_id}', value)
+    schedule_report(chat_id, value)
+
+set_report_time_async = db_executor.wrap(set_report_time)
+
+def setup_jobs(reports=True):
+    """Реєструє регулярні задачі і запускає планувальник. Викликати з циклу
+    asyncio, в якому вони мають працювати (post_init бота або ASGI-лідер)."""
+    job_runner.add('close_idle_trips', trips.close_idle, 'interval', blocking=True, jitter=0, minutes=1)
+    job_runner.add('replay_late', replay_late, 'interval', blocking=True, jitter=0, minutes=1)
+    job_runner.add('retention', run_retention, 'cron', blocking=True, minute=17)
+    job_runner.add('db_optimize', optimize_db, 'cron', blocking=True, hour=MAINTENANCE_HOUR, minute=40)
+    if VACUUM_WEEKDAY:
+        job_runner.add('db_vacuum', vacuum_db, 'cron', blocking=True,
+                       day_of_week=VACUUM_WEEKDAY, hour=MAINTENANCE_HOUR, minute=50)
+    if reports:
+        for chat_id, value in get_report_times().items():
+            try:
+                schedule_report(chat_id, value)
+            except ValueError:
+                print(f"⚠️ Невірний час звіту для чату {chat_id}: {value}")
+    job_runner.start()
+    return job_runner
+
+async def post_init(application: Application):
+    global bot_loop
+    bot_loop = asyncio.get_running_loop()
+    alert_sender.start(bot_loop)
+    if not job_runner.running:
+        setup_jobs()
+
+async def post_shutdown(application: Application):
+    job_runner.shutdown()
+    await alert_sender.close()
+    await weather_client.close()
+    db_executor.shutdown()
 
 # ==========  MAIN ==========
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO)
+def init_storage():
+    # схема і прогрів стану в пам'яті; викликається до старту записувача
     init_db()
     ensure_telemetry_columns()
-    setup_scheduler()
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    ensure_command_columns()
+    ensure_indexes()
+    rollups.init_schema()
+    trips.init_schema()
+    geo_index.init_schema()
+    load_devices()
+    load_parking()
+    geofences.load(db)
+    latest_telemetry.warm(db)
+    rollups.warm(latest_telemetry.get(d) for d in latest_telemetry.devices())
+
+def build_application(webhook=False):
+    """PTB Application з усіма обробниками. webhook=True — без Updater:
+    оновлення подає ASGI-сервер (див. asgi.py)."""
+    global bot_app
+    builder = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL + "/bot").base_file_url(TELEGRAM_API_URL + "/file/bot")
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
     bot_app = application
 
-    # handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("status", status))
@@ -533,12 +1460,35 @@ if __name__ == '__main__':
     application.add_handler(CommandHandler("power_save_off", power_save_off))
     application.add_handler(CommandHandler("service_oil_reset", service_oil_reset))
     application.add_handler(CommandHandler("service_chain_reset", service_chain_reset))
+    application.add_handler(CommandHandler("trips", show_trips))
+    application.add_handler(CommandHandler("export", export_history))
+    application.add_handler(CommandHandler("park", park))
+    application.add_handler(CommandHandler("unpark", unpark))
+    application.add_handler(CommandHandler("report", report))
+    application.add_handler(CommandHandler("zones", zones))
+    application.add_handler(CommandHandler("zone_add", zone_add))
+    application.add_handler(CommandHandler("zone_del", zone_del))
+    application.add_handler(CommandHandler("devices", devices))
+    application.add_handler(CommandHandler("bind", bind))
+    application.add_handler(CommandHandler("use", use_device))
     application.add_handler(MessageHandler(filters.TEXT, handle_message))
+    return application
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    init_storage()
+    ingest_queue.start()
+    atexit.register(ingest_queue.stop)
+    application = build_application()
 
     # Flask+PTB in one process (webhook на Heroku/Render, або polling)
     import threading
     def run_flask():
         app.run(host='0.0.0.0', port=int(os.environ.get("PORT", 5000)), threaded=True)
 
-    threading.Thread(target=run_flask).start()
+    # daemon: після run_polling процес має завершитись, а не приймати
+    # телеметрію, яку вже нікому дописати
+    threading.Thread(target=run_flask, daemon=True).start()
     application.run_polling(allowed_updates=Update.ALL_TYPES)
+    ingest_queue.stop()  # відтепер /esp32_push відповідає 503
+    trips.flush()
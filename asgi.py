@@ -0,0 +1,353 @@
+"""Продакшн-режим: один ASGI-застосунок під uvicorn з кількома воркерами.
+
+    WEBHOOK_URL=https://bot.example.com uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 4
+
+Гарячі маршрути ESP32 (/esp32_push, /esp32_push/bin, long-poll команд) і
+вебхук Telegram — нативні async-обробники в циклі воркера; решта API
+(bulk, export, history, geo, ack...) — той самий Flask-застосунок через
+WSGI-адаптер у пулі потоків.
+
+Стан у пам'яті між воркерами не ділиться, тому один воркер стає
+лідером (flock на DB_FILE.leader; якщо лідер помре, лок забере інший):
+- лише лідер тримає бота, регулярні задачі (jobs.py) і слухачів телеметрії зі станом
+  (агрегати, поїздки, аналітика, сповіщення, геозони); їх годує
+  TelemetryTailer з таблиці telemetry, куди пишуть усі воркери; його
+  позиція зберігається в settings (tailer:last_id), і новий лідер
+  продовжує з неї, а не з кінця таблиці;
+- вебхук, що потрапив не до лідера, кладеться в таблицю bot_updates,
+  лідер забирає її кожні WEBHOOK_RELAY_INTERVAL секунд і щоразу перед
+  власним вебхуком, тож оновлення йдуть у боті в тому порядку, в якому
+  воркери відповіли Telegram 200 (Telegram не шле наступне оновлення
+  чату, поки не отримав відповідь на попереднє);
+- команди, додані в іншому процесі (бот у лідері, API в будь-якому
+  воркері), кожен воркер помічає, перечитуючи хвіст commands раз на
+  COMMAND_WATCH_INTERVAL секунд, і будить свої long-poll цих пристроїв;
+- бот стартує у фоні і повторює спроби кожні LEADER_RETRY секунд, тож
+  недоступний Telegram не валить запуск воркера; якщо ж не вдалося
+  підняти tailer чи задачі, лідер віддає лок іншому воркеру.
+
+Без WEBHOOK_URL лідер забирає оновлення бота через getUpdates (polling),
+як python app.py.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from telegram import Update
+
+import app as core
+from ingest import TelemetryTailer, validate_telemetry
+from telemetry_codec import decode as decode_telemetry, DecodeError
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(core.TELEGRAM_TOKEN.encode()).hexdigest()[:32]
+WEBHOOK_RELAY_INTERVAL = float(os.getenv("WEBHOOK_RELAY_INTERVAL", "0.2"))
+COMMAND_WATCH_INTERVAL = float(os.getenv("COMMAND_WATCH_INTERVAL", "0.05"))
+LEADER_RETRY = float(os.getenv("LEADER_RETRY", "5"))
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "32"))
+
+# слухачі зі станом працюють лише в лідері, через TelemetryTailer
+stateful_listeners = core.ingest_queue.detach_listeners()
+
+class Runtime:
+    """Ролі процесу: кожен воркер приймає телеметрію, лідер — ще й усе інше."""
+
+    def __init__(self):
+        self.leader = False
+        self.lock_file = None
+        self.tailer = None
+        self.bot = None
+        self.tasks = []
+        self.relay_lock = asyncio.Lock()
+        self.relayed_id = 0
+        self.command_id = 0
+
+    def try_lead(self):
+        if self.lock_file is None:
+            self.lock_file = open(core.DB_FILE + ".leader", "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    async def start(self):
+        core.init_storage()
+        core.db.execute('CREATE TABLE IF NOT EXISTS bot_updates (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT)')
+        core.ingest_queue.start()
+        self.command_id = core.db.query_one('SELECT MAX(id) FROM commands')[0] or 0
+        self.tasks.append(asyncio.create_task(self.watch_commands()))
+        if not (self.try_lead() and self.become_leader()):
+            self.tasks.append(asyncio.create_task(self.wait_for_leadership()))
+
+    async def wait_for_leadership(self):
+        while not self.leader:
+            await asyncio.sleep(LEADER_RETRY)
+            if self.try_lead():
+                self.become_leader()
+
+    def become_leader(self):
+        self.leader = True
+        print(f"👑 Воркер {os.getpid()} — лідер")
+
+        def update_cache(samples):
+            for sample in samples:
+                core.latest_telemetry.update(sample)
+
+        def save_position(samples):
+            # останнім слухачем: пачка вже роздана всім іншим
+            core.save_setting('tailer:last_id', samples[-1]['id'])
+
+        try:
+            # з місця, де зупинився попередній лідер: рядки, які він не встиг
+            # роздати, інакше не дістались би нікому. Пачку, яку він роздав,
+            # але не зберіг, слухачі побачать вдруге; для агрегатів це
+            # запізнілі зразки (кеш новіший), їх перерахує replay_late
+            last_id = core.get_setting('tailer:last_id')
+            self.tailer = TelemetryTailer(core.db, stateful_listeners + [update_cache, save_position])
+            self.tailer.start(int(last_id) if last_id else None)
+            core.setup_jobs()
+        except Exception as e:
+            print("❌ Не вдалося стати лідером, лок віддано:", e)
+            self.resign()
+            return False
+        self.tasks.append(asyncio.create_task(self.start_bot()))
+        return True
+
+    def resign(self):
+        # лідер без tailer і задач лише тримав би лок від інших воркерів
+        self.leader = False
+        if self.tailer is not None:
+            try:
+                self.tailer.stop()
+            except Exception as e:
+                print("❌ Не вдалося зупинити читання телеметрії:", e)
+            self.tailer = None
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    async def start_bot(self):
+        # поки Telegram недоступний, вебхуки (якщо вони вже налаштовані)
+        # накопичуються в bot_updates, а телеметрія і задачі працюють
+        while True:
+            bot = core.build_application(webhook=bool(WEBHOOK_URL))
+            try:
+                await bot.initialize()
+                if WEBHOOK_URL:
+                    await bot.bot.set_webhook(
+                        WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                        allowed_updates=Update.ALL_TYPES, drop_pending_updates=False,
+                    )
+                else:
+                    print("ℹ️ WEBHOOK_URL не задано — бот працює через polling")
+                    await bot.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+                await core.post_init(bot)
+                await bot.start()
+            except Exception as e:
+                print(f"❌ Не вдалося запустити бота, повтор через {LEADER_RETRY:g} с:", e)
+                await self._discard_bot(bot)
+                await asyncio.sleep(LEADER_RETRY)
+                continue
+            self.bot = bot
+            if WEBHOOK_URL:
+                self.tasks.append(asyncio.create_task(self.relay_updates()))
+            return
+
+    @staticmethod
+    async def _discard_bot(bot):
+        try:
+            if bot.updater is not None and bot.updater.running:
+                await bot.updater.stop()
+            if bot.running:
+                await bot.stop()
+            await bot.shutdown()
+        except Exception as e:
+            print("❌ Не вдалося зупинити бота:", e)
+
+    async def _relay_pending(self):
+        # викликати під relay_lock. Рядки видаляються лише після того, як
+        # потрапили в update_queue; relayed_id не дає віддати їх двічі,
+        # якщо DELETE не вдався
+        rows = await core.db_executor.call(
+            core.db.query_all, 'SELECT id, payload FROM bot_updates WHERE id>? ORDER BY id', (self.relayed_id,)
+        )
+        for row in rows:
+            try:
+                update = Update.de_json(json.loads(row['payload']), self.bot.bot)
+            except Exception as e:
+                print(f"❌ Пошкоджене оновлення Telegram #{row['id']} пропущено:", e)
+            else:
+                await self.bot.update_queue.put(update)
+            self.relayed_id = row['id']
+        if rows:
+            await core.db_executor.call(core.db.execute, 'DELETE FROM bot_updates WHERE id<=?', (self.relayed_id,))
+
+    async def deliver(self, update):
+        # спершу те, що раніше прийняли інші воркери — інакше порядок у чаті зламається
+        async with self.relay_lock:
+            try:
+                await self._relay_pending()
+            except Exception as e:
+                print("❌ Не вдалося передати оновлення Telegram:", e)
+            await self.bot.update_queue.put(update)
+
+    async def relay_updates(self):
+        # вебхуки, які прийняли інші воркери
+        while True:
+            await asyncio.sleep(WEBHOOK_RELAY_INTERVAL)
+            try:
+                async with self.relay_lock:
+                    await self._relay_pending()
+            except Exception as e:
+                print("❌ Не вдалося передати оновлення Telegram:", e)
+
+    async def watch_commands(self):
+        # CommandNotifier будить лише свій процес; нові рядки commands — по
+        # первинному ключу, без сканування
+        while True:
+            await asyncio.sleep(COMMAND_WATCH_INTERVAL)
+            try:
+                rows = await core.db_executor.call(
+                    core.db.query_all, 'SELECT id, device_id FROM commands WHERE id>? ORDER BY id', (self.command_id,)
+                )
+            except Exception as e:
+                print("❌ Не вдалося перевірити нові команди:", e)
+                continue
+            for device_id in {row['device_id'] for row in rows}:
+                core.command_notifier.notify(device_id)
+            if rows:
+                self.command_id = rows[-1]['id']
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        core.ingest_queue.stop()
+        if self.leader:
+            if self.bot is not None:
+                if self.bot.updater is not None and self.bot.updater.running:
+                    await self.bot.updater.stop()
+                await self.bot.stop()
+                await self.bot.shutdown()
+                await core.post_shutdown(self.bot)
+            core.job_runner.shutdown()
+            self.tailer.stop()
+            core.trips.flush()
+        if self.lock_file is not None:
+            self.lock_file.close()  # знімає flock
+
+runtime = Runtime()
+
+# ==========  ROUTES  ==========
+def instrumented(route, handler):
+    # ті самі http_request_duration_seconds, що й before/after_request у Flask
+    async def wrapper(request):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status_code
+            return response
+        finally:
+            core.HTTP_SECONDS.labels(route, request.method, str(status)).observe(time.perf_counter() - started)
+    return wrapper
+
+def _busy():
+    return JSONResponse({"status": "busy"}, status_code=503, headers={"Retry-After": "1"})
+
+async def _register(device_id):
+    if device_id not in core.known_devices:
+        await core.db_executor.call(core.register_device, device_id)
+
+async def esp32_push(request):
+    try:
+        sample = validate_telemetry(json.loads(await request.body()))
+    except ValueError as e:  # у т.ч. json.JSONDecodeError
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=400)
+    sample['device_id'] = sample['device_id'] or core.ESP32_DEVICE_ID
+    if not core.ingest_queue.submit(sample):
+        return _busy()
+    core.latest_telemetry.update(sample)
+    await _register(sample['device_id'])
+    return JSONResponse({"status": "ok"})
+
+async def esp32_push_bin(request):
+    try:
+        samples = [validate_telemetry(s) for s in decode_telemetry(await request.body())]
+    except (DecodeError, ValueError) as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=400)
+    if not samples:
+        return JSONResponse({"status": "ok", "accepted": 0})
+    for sample in samples:
+        sample['device_id'] = sample['device_id'] or core.ESP32_DEVICE_ID
+    if not core.ingest_queue.submit_many(samples):
+        return _busy()
+    core.latest_telemetry.update(samples[-1])
+    await _register(samples[-1]['device_id'])
+    return JSONResponse({"status": "ok", "accepted": len(samples)})
+
+def _float_arg(request, name, default):
+    try:
+        return float(request.query_params.get(name, default))
+    except ValueError:
+        return float(default)
+
+async def esp32_get_commands(request):
+    # той самий long-poll, що й у Flask-версії, але очікування не тримає потік
+    device_id = request.query_params.get('device_id') or core.ESP32_DEVICE_ID
+    wait = min(max(_float_arg(request, 'wait', 0), 0), core.LONG_POLL_MAX_WAIT)
+    lease = min(max(_float_arg(request, 'lease', core.COMMAND_LEASE_SECONDS), 1), 3600)
+    deadline = time.monotonic() + wait
+    version = core.command_notifier.version(device_id)
+    cmds = await core.db_executor.call(core.lease_commands, device_id, lease)
+    while not cmds:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        timeout = min(remaining, core.LONG_POLL_RECHECK)
+        expiry = await core.db_executor.call(core.next_lease_expiry, device_id)
+        if expiry is not None:
+            timeout = max(0.0, min(timeout, expiry - time.time()))
+        new_version = await core.command_notifier.wait_async(device_id, version, timeout)
+        if new_version is not None:
+            version = new_version
+        cmds = await core.db_executor.call(core.lease_commands, device_id, lease)
+    return JSONResponse({"commands": cmds, "lease": lease})
+
+async def telegram_webhook(request):
+    if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return Response(status_code=403)
+    payload = await request.body()
+    if runtime.bot is not None:
+        await runtime.deliver(Update.de_json(json.loads(payload), runtime.bot.bot))
+    else:
+        await core.db_executor.call(
+            core.db.execute, 'INSERT INTO bot_updates (payload) VALUES (?)', (payload.decode(),)
+        )
+    return Response(status_code=200)
+
+@asynccontextmanager
+async def lifespan(_):
+    await runtime.start()
+    try:
+        yield
+    finally:
+        await runtime.stop()
+
+app = Starlette(
+    routes=[
+        Route('/esp32_push', instrumented('/esp32_push', esp32_push), methods=['POST']),
+        Route('/esp32_push/bin', instrumented('/esp32_push/bin', esp32_push_bin), methods=['POST']),
+        Route('/esp32_push/commands', instrumented('/esp32_push/commands', esp32_get_commands), methods=['GET']),
+        Route(WEBHOOK_PATH, instrumented(WEBHOOK_PATH, telegram_webhook), methods=['POST']),
+        Mount('/', WSGIMiddleware(core.app, workers=WSGI_THREADS)),
+    ],
+    lifespan=lifespan,
+)
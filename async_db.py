@@ -0,0 +1,25 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncDB:
+    """Виконує блокуючі функції БД на обмеженому пулі потоків, щоб цикл
+    PTB не чекав на диск. Потоки пулу живуть довго, тож кожен тримає своє
+    з'єднання з ConnectionPool і не відкриває файл заново."""
+
+    def __init__(self, max_workers=4, thread_name_prefix="db"):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+    async def call(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def wrap(self, fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await self.call(fn, *args, **kwargs)
+        return wrapper
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
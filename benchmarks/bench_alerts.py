@@ -0,0 +1,93 @@
+"""Вартість перевірки правил сповіщень на зразок.
+
+AlertEngine отримує сотні правил (типові + згенеровані пороги по всіх
+числових полях) і пачки зразків від багатьох пристроїв, як від
+TelemetryIngestQueue. Окремо — RateLimitedSender з фейковою відправкою:
+скільки часу займає черга з N сповіщень у кілька чатів.
+
+    python benchmarks/bench_alerts.py --rules 300 --devices 500 --samples 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from alerts import AlertEngine, RateLimitedSender, DEFAULT_RULES
+from ingest import NUMERIC_FIELDS
+from bench_ingest import payload
+
+def make_rules(n):
+    rules = list(DEFAULT_RULES)
+    rnd = random.Random(1)
+    while len(rules) < n:
+        field = rnd.choice(NUMERIC_FIELDS)
+        above = rnd.random() < 0.5
+        threshold = rnd.uniform(0, 1000)
+        rule = {'name': f"r{len(rules)}", 'field': field, 'cooldown': 60,
+                'clear': threshold - 5 if above else threshold + 5}
+        rule['above' if above else 'below'] = threshold
+        rules.append(rule)
+    return rules
+
+def bench_engine(args):
+    fired = [0]
+
+    def notify(device_id, rule, value, sample):
+        fired[0] += 1
+
+    engine = AlertEngine(make_rules(args.rules), notify=notify)
+    for d in range(0, args.devices, 10):
+        engine.park(f"dev-{d}", 50.45, 30.52)
+    batches = []
+    for i in range(args.samples):
+        batch = [payload(d, i) for d in range(args.devices)]
+        for sample in batch:
+            sample['engine_temperature'] = 95.0 + (i % 40)  # поріг 110 / 100 туди й назад
+        batches.append(batch)
+    total = args.devices * args.samples
+    started = time.perf_counter()
+    for batch in batches:
+        engine.process(batch)
+    elapsed = time.perf_counter() - started
+    print(f"rules={len(engine.rules)} devices={args.devices} samples={total}")
+    print(f"per sample: {elapsed / total * 1e6:8.2f} µs  ({elapsed / total / len(engine.rules) * 1e9:.0f} ns/rule)")
+    print(f"throughput: {total / elapsed:8.0f} samples/s")
+    print(f"alerts:     {fired[0]} sent, {engine.stats['suppressed']} suppressed by cooldown")
+
+async def bench_sender(args):
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append((time.perf_counter(), chat_id))
+
+    sender = RateLimitedSender(send, rate=args.rate, per_chat_interval=1.0)
+    sender.start()
+    started = time.perf_counter()
+    for i in range(args.messages):
+        sender.submit(i % args.chats, f"alert {i}")
+    while len(sent) < args.messages:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await sender.close()
+    print(f"sender: {args.messages} messages to {args.chats} chats in {elapsed:.2f} s "
+          f"({args.messages / elapsed:.1f}/s, limit {args.rate:.0f}/s and 1/s per chat)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rules', type=int, default=300)
+    parser.add_argument('--devices', type=int, default=500)
+    parser.add_argument('--samples', type=int, default=200, help="зразків на пристрій")
+    parser.add_argument('--messages', type=int, default=60)
+    parser.add_argument('--chats', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=25.0)
+    args = parser.parse_args()
+    bench_engine(args)
+    asyncio.run(bench_sender(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Аналітика витрати пального на синтетичному році посекундних даних.
+
+1) Рік (31.5 млн зразків) генерується прямо в масиви NumPy і
+   проганяється через FuelAnalytics.compute — вартість самих обчислень.
+2) Кілька днів того ж ряду пишуться в тимчасову БД: міряється перший
+   report() (завантаження вікна + обчислення), інкрементальний після
+   пачки нових зразків через process() і повторний з кешу.
+
+    python benchmarks/bench_analytics.py --days 365 --db-days 7
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+START = 1700000000
+TANK = 12.0
+
+def synthetic(days, start=START):
+    """Поїздки вранці й увечері по 60 км/год, розхід залежить від температури,
+    заправка до повного баку, коли лишається 2 л."""
+    t = np.arange(start, start + days * 86400, dtype=np.float64)
+    hour = (t % 86400) / 3600
+    day = (t - start) // 86400
+    moving = ((hour >= 7) & (hour < 8)) | ((hour >= 17) & (hour < 18.5))
+    step = moving / 60.0  # км за секунду
+    air = 10 + 12 * np.sin(2 * np.pi * (day - 100) / 365) + 5 * np.sin(2 * np.pi * (hour - 9) / 24)
+    per_km = 0.04 + 0.0008 * np.clip(15 - air, 0, None)
+    used = np.cumsum(step * per_km)
+    fuel = np.round(TANK - np.mod(used, TANK - 2.0), 3)
+    total = np.round(12000 + np.cumsum(step), 3)
+    remaining = fuel / 0.045
+    return {'ts': t, 'fuel': fuel, 'total': total, 'air': np.round(air, 1), 'remaining': remaining}
+
+def fill(app, arrays):
+    from storage import INSERT_TELEMETRY_SQL, telemetry_params
+    from ingest import normalize_timestamp
+
+    def rows():
+        for ts, fuel, total, air, rem in zip(*(arrays[c].tolist() for c in ('ts', 'fuel', 'total', 'air', 'remaining'))):
+            yield telemetry_params({
+                'device_id': 'bench', 'timestamp': normalize_timestamp(ts),
+                'fuel_liters': fuel, 'totalDistance': total, 'air_temperature': air,
+                'distanceRemCharge': rem,
+            })
+
+    app.db.executemany(INSERT_TELEMETRY_SQL, rows())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--db-days', type=int, default=7)
+    args = parser.parse_args()
+
+    from analytics import FuelAnalytics
+    engine = FuelAnalytics(None, window_days=args.days + 1)
+
+    started = time.perf_counter()
+    year = synthetic(args.days)
+    print(f"generated {len(year['ts'])} samples in {time.perf_counter() - started:.1f} s")
+    started = time.perf_counter()
+    report = engine.compute(year)
+    elapsed = time.perf_counter() - started
+    print(f"compute {args.days} d:  {elapsed:6.2f} s  ({len(year['ts']) / elapsed / 1e6:.1f} M samples/s)")
+    print(f"  distance {report['distance']:.0f} km, {report['avg_consumption']:.2f} l/100km, "
+          f"{len(report['refuels'])} refuels, range {report['range_km']:.0f} km")
+    del year
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_db()
+        app.ensure_telemetry_columns()
+        app.ensure_indexes()
+
+        now = START + args.db_days * 86400
+        arrays = synthetic(args.db_days + 1)
+        head = {c: v[:args.db_days * 86400] for c, v in arrays.items()}
+        tail = {c: v[args.db_days * 86400:args.db_days * 86400 + 1000] for c, v in arrays.items()}
+        started = time.perf_counter()
+        fill(app, head)
+        print(f"filled {len(head['ts'])} rows in {time.perf_counter() - started:.1f} s")
+
+        engine = FuelAnalytics(app.db, window_days=args.db_days)
+        started = time.perf_counter()
+        engine.report('bench', now=now)
+        print(f"first report ({args.db_days} d from db): {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+        samples = [{'device_id': 'bench', 'timestamp': ts, 'fuel_liters': f, 'totalDistance': d,
+                    'air_temperature': a, 'distanceRemCharge': r}
+                   for ts, f, d, a, r in zip(*(tail[c].tolist() for c in ('ts', 'fuel', 'total', 'air', 'remaining')))]
+        engine.process(samples)
+        started = time.perf_counter()
+        report = engine.report('bench', now=now + 1000)
+        print(f"after +1000 samples:            {(time.perf_counter() - started) * 1000:8.1f} ms "
+              f"({report['samples']} samples in window)")
+        started = time.perf_counter()
+        engine.report('bench', now=now + 1000)
+        print(f"cached:                         {(time.perf_counter() - started) * 1000:8.3f} ms")
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Навантаження на обробники бота: багато одночасних симульованих
+оновлень Telegram, частина з яких пише в БД (команди пристрою).
+
+Режим "inline" відтворює стару поведінку — запис у SQLite прямо в циклі
+asyncio; режим "executor" — через AsyncDB. --write-delay імітує
+повільний диск на кожному записі.
+
+    python benchmarks/bench_bot_load.py --updates 2000 --write-delay 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_handlers import FakeMessage
+from bench_ingest import payload
+
+READS = ("📊 Статус", "🛵 Пробіг", "🛢 Залишок", "ℹ️ Нагадування")
+WRITES = ("🚫 Вимкнути запалення", "✅ Змастив цеп", "✅ Замінив масло")
+
+def fake_update(text, chat_id):
+    return SimpleNamespace(message=FakeMessage(text), effective_chat=SimpleNamespace(id=chat_id),
+                           effective_user=SimpleNamespace(id=chat_id))
+
+def percentiles(values):
+    q = statistics.quantiles(values, n=100)
+    return statistics.median(values), q[94], q[98]
+
+async def drive(app, updates, chats, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    results = {'read': [], 'write': []}
+
+    async def one(i):
+        kind = 'write' if i % 4 == 0 else 'read'
+        texts = WRITES if kind == 'write' else READS
+        update = fake_update(texts[i % len(texts)], i % chats)
+        context = SimpleNamespace(user_data={}, args=[])
+        async with sem:
+            t0 = time.perf_counter()
+            await app.handle_message(update, context)
+            results[kind].append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(updates)))
+    return results, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--write-delay', type=float, default=5.0, help="мс на кожен запис")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_db()
+        app.ensure_telemetry_columns()
+        app.ensure_command_columns()
+        app.ensure_indexes()
+        app.load_devices()
+        app.latest_telemetry.update(payload(0, 1) | {'device_id': app.ESP32_DEVICE_ID})
+
+        execute = app.db.execute
+        def slow_execute(sql, params=()):
+            time.sleep(args.write_delay / 1000)
+            return execute(sql, params)
+        app.db.execute = slow_execute
+
+        offloaded = app.add_command_async
+        async def inline_add_command(*a, **kw):
+            return app.add_command(*a, **kw)
+
+        for mode in ('inline', 'executor'):
+            app.add_command_async = inline_add_command if mode == 'inline' else offloaded
+            results, elapsed = asyncio.run(drive(app, args.updates, args.chats, args.concurrency))
+            print(f"{mode:>8}: {args.updates / elapsed:7.0f} updates/s")
+            for kind in ('read', 'write'):
+                p50, p95, p99 = percentiles(results[kind])
+                print(f"   {kind:>5}: p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  p99 {p99:8.2f} ms")
+        app.db.execute = execute
+        app.db_executor.shutdown()
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Вивантаження офлайн-буфера через POST /esp32_push/bulk.
+
+Генерує NDJSON (за замовчуванням gzip) з часом і device_seq з пристрою,
+шле його через Flask test client, а потім надсилає той самий файл ще раз:
+повтор має дати нуль нових рядків. Наприкінці перевіряється, що в БД
+збережено час пристрою, а не час прийому.
+
+    python benchmarks/bench_bulk.py --samples 100000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ingest import payload
+
+START = 1700000000  # 2023-11-14 22:13:20 UTC
+
+def body(samples, device=0):
+    lines = []
+    for i in range(samples):
+        data = payload(device, i)
+        data['timestamp'] = START + i * 5
+        data['device_seq'] = i
+        lines.append(json.dumps(data))
+    return ("\n".join(lines) + "\n").encode()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=100000)
+    parser.add_argument('--plain', action='store_true', help="без gzip")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_storage()
+        client = app.app.test_client()
+
+        raw = body(args.samples)
+        data = raw if args.plain else gzip.compress(raw, 6)
+        headers = {'Content-Type': 'application/x-ndjson'}
+        if not args.plain:
+            headers['Content-Encoding'] = 'gzip'
+        print(f"samples={args.samples} body={len(raw) / 1e6:.1f} MB "
+              f"sent={len(data) / 1e6:.1f} MB ({'plain' if args.plain else 'gzip'})")
+
+        for attempt in ('first', 'retry'):
+            started = time.perf_counter()
+            resp = client.post('/esp32_push/bulk', data=data, headers=headers)
+            elapsed = time.perf_counter() - started
+            result = resp.get_json()
+            print(f"{attempt:6s} {elapsed:6.2f} s  {args.samples / elapsed:9.0f} samples/s  "
+                  f"inserted={result['inserted']} duplicates={result['duplicates']} "
+                  f"invalid={result['invalid']}")
+
+        rows, first, last = app.db.query_one(
+            "SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM telemetry"
+        )
+        print(f"rows in db: {rows}  time range: {first} .. {last}")
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
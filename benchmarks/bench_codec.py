@@ -0,0 +1,68 @@
+"""Розмір payload і швидкість розбору: JSON (по зразку на запит і масивом)
+проти бінарного формату telemetry_codec без дельт і з дельтами.
+
+    python benchmarks/bench_codec.py --batch 60 --batches 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telemetry_codec import encode, decode
+
+def stream(n):
+    # повільно змінні показники, як у справжньої поїздки з кроком 1 с
+    for i in range(n):
+        yield {
+            'device_id': 'fixik4308', 'timestamp': 1760000000 + i, 'device_seq': 5000 + i,
+            'engine_temperature': 85.0 + (i % 7) * 0.25, 'air_temperature': 21.5,
+            'latitude': 50.450100 + i * 0.00008, 'longitude': 30.523400 + i * 0.00005,
+            'fuel_pulses': 1200 + i, 'fuel_liters': 9.8 - i * 0.0004,
+            'dailyDistance': 12.3 + i * 0.01, 'totalDistance': 15234.5 + i * 0.01,
+            'dailyAvgConsumption': 4.12, 'totalAvgConsumption': 4.31,
+            'distanceRemCharge': 227.4 - i * 0.01, 'batteryVoltage': 3.91,
+            'batteryAkkVoltage': 12.64 + (i % 3) * 0.01, 'chainServiceLeft': 312.0, 'oilServiceLeft': 2480.0,
+        }
+
+def throughput(fn, payloads, samples):
+    t0 = time.perf_counter()
+    for p in payloads:
+        fn(p)
+    return samples / (time.perf_counter() - t0)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch', type=int, default=60, help="зразків на запит")
+    parser.add_argument('--batches', type=int, default=500)
+    args = parser.parse_args()
+
+    samples = list(stream(args.batch * args.batches))
+    chunks = [samples[i:i + args.batch] for i in range(0, len(samples), args.batch)]
+    total = len(samples)
+    variants = {
+        'json per sample': ([json.dumps(s).encode() for s in samples], json.loads),
+        'json batch': ([json.dumps(c).encode() for c in chunks], json.loads),
+        'binary full': ([encode('fixik4308', c, delta=False) for c in chunks], decode),
+        'binary delta': ([encode('fixik4308', c) for c in chunks], decode),
+    }
+    print(f"{'format':>16} {'bytes/sample':>13} {'decode samples/s':>17}")
+    for name, (payloads, fn) in variants.items():
+        size = sum(len(p) for p in payloads) / total
+        print(f"{name:>16} {size:>13.1f} {throughput(fn, payloads, total):>17,.0f}")
+
+    # точність фіксованої коми; час і номер мають вертатись без втрат
+    decoded = decode(encode('fixik4308', samples[:1000]))
+    exact = ('device_id', 'timestamp', 'device_seq')
+    worst = max(abs(a[k] - b[k]) for a, b in zip(samples, decoded) for k in a if k not in exact)
+    mismatched = sum(any(a[k] != b[k] for k in exact) for a, b in zip(samples, decoded))
+    print(f"max round-trip error: {worst:.6f}")
+    print(f"time/seq mismatches:  {mismatched}")
+    if mismatched or len(decoded) != len(samples[:1000]):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Затримка доставки команд від бота до пристрою і кількість холостих
+запитів: звичайне опитування раз на --poll-interval проти long-poll.
+
+Піднімає справжній HTTP-сервер Flask на локальному порту; кожен
+симульований пристрій у своєму потоці забирає команди і підтверджує
+їх однією пачкою через /esp32_push/commands/ack_batch.
+
+    python benchmarks/bench_commands.py --devices 20 --commands 200
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def run(app, base, mode, devices, commands, poll_interval, wait, idle):
+    sent = {}
+    received = []
+    polls = [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def device(device_id):
+        session = requests.Session()
+        while not stop.is_set():
+            params = {'device_id': device_id}
+            if mode == 'longpoll':
+                params['wait'] = wait
+            cmds = session.get(f"{base}/esp32_push/commands", params=params, timeout=wait + 10).json()['commands']
+            now = time.perf_counter()
+            with lock:
+                polls[0] += 1
+            if cmds:
+                with lock:
+                    received.extend(now - sent[cmd['value']] for cmd in cmds)
+                session.post(f"{base}/esp32_push/commands/ack_batch",
+                             json={'command_ids': [cmd['id'] for cmd in cmds], 'device_id': device_id},
+                             timeout=10)
+            if mode == 'poll' and not cmds:
+                stop.wait(poll_interval)
+
+    ids = [f"dev-{n}" for n in range(devices)]
+    threads = [threading.Thread(target=device, args=(d,), daemon=True) for d in ids]
+    for t in threads:
+        t.start()
+    rng = random.Random(1)
+    started = time.perf_counter()
+    for n in range(commands):
+        time.sleep(rng.uniform(0.005, 0.03))
+        token = f"{mode}-{n}"
+        with lock:
+            sent[token] = time.perf_counter()
+        app.add_command("stop_ignition", token, device_id=rng.choice(ids))
+    while len(received) < commands and time.perf_counter() - started < 60:
+        time.sleep(0.05)
+    idle_start = polls[0]
+    time.sleep(idle)
+    idle_rate = (polls[0] - idle_start) / idle / devices
+    stop.set()
+    for device_id in ids:
+        app.command_notifier.notify(device_id)  # розбудити тих, хто чекає в long-poll
+    for t in threads:
+        t.join()
+    ms = sorted(x * 1000 for x in received)
+    print(f"{mode:>8}: delivered {len(ms)}/{commands}  "
+          f"p50 {statistics.median(ms):7.1f} ms  p99 {statistics.quantiles(ms, n=100)[98]:7.1f} ms  "
+          f"idle {idle_rate:5.2f} polls/s per device")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--commands', type=int, default=200)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--idle', type=float, default=5.0, help="тривалість холостого вікна, с")
+    parser.add_argument('--wait', type=float, default=25.0, help="long-poll timeout, с")
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_db()
+        app.ensure_telemetry_columns()
+        app.ensure_indexes()
+        server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+
+        run(app, base, 'poll', args.devices, args.commands, args.poll_interval, args.wait, args.idle)
+        run(app, base, 'longpoll', args.devices, args.commands, args.poll_interval, args.wait, args.idle)
+        server.shutdown()
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
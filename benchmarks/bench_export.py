@@ -0,0 +1,84 @@
+"""Потоковий експорт великої історії через GET /export.
+
+Наповнює тимчасову БД мільйонами рядків одного пристрою, а потім
+вичитує відповідь /export шматками через Flask test client (без
+буферизації) і міряє пропускну здатність та приріст піку RSS процесу:
+пам'ять має лишатися пласкою незалежно від діапазону.
+
+    python benchmarks/bench_export.py --rows 2000000 --format csv
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+START = 1700000000
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: КБ
+
+def fill(app, rows, device_id):
+    from storage import INSERT_TELEMETRY_SQL, telemetry_params
+    from ingest import normalize_timestamp
+
+    def samples():
+        for i in range(rows):
+            yield telemetry_params({
+                'device_id': device_id, 'timestamp': normalize_timestamp(START + i),
+                'engine_temperature': 80.0 + i % 10, 'air_temperature': 20.0,
+                'latitude': 50.45 + i * 1e-6, 'longitude': 30.52 + i * 1e-6,
+                'fuel_liters': 10.0 - i * 1e-6, 'totalDistance': 12000 + i * 0.005,
+                'batteryVoltage': 3.9, 'batteryAkkVoltage': 12.6,
+            })
+
+    app.db.executemany(INSERT_TELEMETRY_SQL, samples())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--format', choices=('csv', 'gpx', 'parquet'), default='csv')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_db()
+        app.ensure_telemetry_columns()
+        app.ensure_indexes()
+
+        started = time.perf_counter()
+        fill(app, args.rows, 'bench')
+        print(f"filled {args.rows} rows in {time.perf_counter() - started:.1f} s")
+
+        client = app.app.test_client()
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        resp = client.get(f'/export?device_id=bench&format={args.format}', buffered=False)
+        if resp.status_code != 200:
+            print(resp.status_code, resp.get_json())
+            return
+        size = parts = 0
+        for part in resp.response:
+            size += len(part)
+            parts += 1
+        resp.close()
+        elapsed = time.perf_counter() - started
+
+        print(f"format={args.format} rows={args.rows}")
+        print(f"exported:   {size / 1e6:9.1f} MB in {parts} parts, {elapsed:.2f} s")
+        print(f"throughput: {args.rows / elapsed:9.0f} rows/s")
+        print(f"peak RSS:   {rss_before:.0f} MB -> {rss_mb():.0f} MB")
+
+        resp = client.get(f'/export?device_id=bench&format={args.format}'
+                          f'&since={START + 1000}&until={START + 2000}')
+        lines = resp.data.count(b'\n')
+        print(f"range check: {lines} lines for a 1000 s window")
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
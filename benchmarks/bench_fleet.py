@@ -0,0 +1,87 @@
+"""Навантажувальний тест парку: сотні пристроїв, історія росте, а запити
+по пристрою (останній знімок, черга команд, ack) мають лишатись O(log n).
+
+    python benchmarks/bench_fleet.py --devices 300 --rows-per-step 300000 --steps 3
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ingest import payload
+from storage import INSERT_TELEMETRY_SQL, telemetry_params
+
+PENDING_SQL = "SELECT id, command_type, value FROM commands WHERE device_id=? AND executed=0 ORDER BY id"
+
+def pending_commands(db, device_id):
+    # вся черга пристрою без лізингу — міряємо сам індекс (device_id, executed)
+    return [dict(row) for row in db.query_all(PENDING_SQL, (device_id,))]
+
+def timed(fn, calls):
+    latencies = []
+    for args in calls:
+        t0 = time.perf_counter()
+        fn(*args)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(latencies)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=300)
+    parser.add_argument('--rows-per-step', type=int, default=300000)
+    parser.add_argument('--steps', type=int, default=3)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_db()
+        app.ensure_telemetry_columns()
+        app.ensure_indexes()
+        devices = [f"dev-{n}" for n in range(args.devices)]
+        for device_id in devices:
+            app.register_device(device_id)
+
+        rng = random.Random(42)
+        written = 0
+        print(f"{'rows':>10} {'latest':>10} {'pending':>10} {'add+ack':>10}   (median, us)")
+        for step in range(args.steps):
+            app.db.executemany(INSERT_TELEMETRY_SQL, (
+                telemetry_params(payload(i % args.devices, i))
+                for i in range(written, written + args.rows_per_step)
+            ))
+            # історія виконаних команд теж росте
+            app.db.executemany(
+                "INSERT INTO commands (device_id, command_type, value, executed) VALUES (?, 'stop_ignition', '', 1)",
+                ((devices[i % args.devices],) for i in range(args.rows_per_step // 10))
+            )
+            written += args.rows_per_step
+            picks = [(rng.choice(devices),) for _ in range(args.queries)]
+            latest = timed(app.query_last_telemetry, picks)
+            pending = timed(lambda device_id: pending_commands(app.db, device_id), picks)
+
+            def add_ack(device_id):
+                app.add_command("stop_ignition", device_id=device_id)
+                for cmd in pending_commands(app.db, device_id):
+                    app.ack_command(cmd['id'], device_id)
+            add_ack_us = timed(add_ack, picks[:args.queries // 4])
+            print(f"{written:>10} {latest:>10.1f} {pending:>10.1f} {add_ack_us:>10.1f}")
+
+        for sql, params in (
+            ("SELECT * FROM telemetry WHERE device_id=? ORDER BY timestamp DESC, id DESC LIMIT 1", ('dev-1',)),
+            (PENDING_SQL, ('dev-1',)),
+        ):
+            plan = app.db.query_all("EXPLAIN QUERY PLAN " + sql, params)
+            print(sql.split(' WHERE')[0], '->', '; '.join(row[3] for row in plan))
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
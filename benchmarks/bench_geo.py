@@ -0,0 +1,118 @@
+"""Просторові запити на мільйонах точок.
+
+Наповнює R*Tree telemetry_geo випадковими блуканнями пристроїв по
+області ~50×50 км і добою посекундної сирої телеметрії одного пристрою,
+а потім міряє: візити біля точки (/geo/visits), трек за добу зі
+спрощенням Дугласа–Пекера (/geo/track, з проріджуванням до
+GEO_TRACK_MAX_POINTS і без нього) і вартість перевірки геозон на
+зразок при тисячі зон.
+
+    python benchmarks/bench_geo.py --points 2000000 --fences 1000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+START = 1700000000
+LAT0, LON0 = 50.45, 30.52
+
+def walk(n, rnd, step=0.0003):
+    lat = LAT0 + rnd.uniform(-0.2, 0.2) + np.cumsum(np.random.normal(0, step, n))
+    lon = LON0 + rnd.uniform(-0.3, 0.3) + np.cumsum(np.random.normal(0, step, n))
+    return np.clip(lat, LAT0 - 0.25, LAT0 + 0.25), np.clip(lon, LON0 - 0.35, LON0 + 0.35)
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(times), max(times)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=2000000)
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--fences', type=int, default=1000)
+    args = parser.parse_args()
+    rnd = random.Random(7)
+    np.random.seed(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        from geo import GeofenceMonitor
+        from storage import INSERT_TELEMETRY_SQL, telemetry_params
+        from ingest import normalize_timestamp
+        app.init_storage()
+
+        started = time.perf_counter()
+        per_device = args.points // args.devices
+        probes = []  # точки запитів беремо з самих треків, щоб поруч були дані
+        for d in range(args.devices):
+            lat, lon = walk(per_device, rnd)
+            probes += [(f"dev-{d}", lat[i], lon[i]) for i in range(0, per_device, per_device // 10)]
+            ts = START + np.arange(per_device) * 60
+            app.db.executemany(
+                'INSERT INTO telemetry_geo (min_lat, max_lat, min_lon, max_lon, device_id, ts) VALUES (?, ?, ?, ?, ?, ?)',
+                ((a, a, o, o, f"dev-{d}", t) for a, o, t in zip(lat.tolist(), lon.tolist(), ts.tolist()))
+            )
+        print(f"indexed {per_device * args.devices} points in {time.perf_counter() - started:.1f} s")
+
+        lat, lon = walk(86400, rnd, step=0.00005)
+        app.db.executemany(INSERT_TELEMETRY_SQL, (
+            telemetry_params({'device_id': 'track', 'timestamp': normalize_timestamp(START + i),
+                              'latitude': a, 'longitude': o})
+            for i, (a, o) in enumerate(zip(lat.tolist(), lon.tolist()))
+        ))
+
+        for radius, device in ((200, False), (1000, False), (1000, True)):
+            found = []
+
+            def visits():
+                dev, p_lat, p_lon = rnd.choice(probes)
+                result = app.geo_index.visits(p_lat, p_lon, radius, dev if device else None)
+                found.append(sum(v['points'] for v in result))
+                return result
+
+            result, median, worst = timed(visits, 100)
+            print(f"visits r={radius}m{' 1 dev' if device else ''}: median {median:7.2f} ms  max {worst:7.2f} ms  "
+                  f"(~{statistics.mean(found):.0f} points)")
+        result, median, worst = timed(lambda: app.geo_index.track(
+            'track', normalize_timestamp(START), normalize_timestamp(START + 86400), 10), 5)
+        print(f"track 1 day:     median {median:7.2f} ms  max {worst:7.2f} ms  "
+              f"(step {result['step']}, {result['points']} -> {len(result['track'])} points)")
+        result, median, worst = timed(lambda: app.geo_index.track(
+            'track', normalize_timestamp(START), normalize_timestamp(START + 86400), 10, max_points=0), 3)
+        print(f"track 1 day raw: median {median:7.2f} ms  max {worst:7.2f} ms  "
+              f"({result['points']} -> {len(result['track'])} points)")
+        result, median, worst = timed(lambda: app.geo_index.track(
+            'track', normalize_timestamp(START + 3600), normalize_timestamp(START + 7200), 10), 20)
+        print(f"track 1 hour:    median {median:7.2f} ms  max {worst:7.2f} ms  "
+              f"({result['points']} -> {len(result['track'])} points)")
+
+        monitor = GeofenceMonitor()
+        for i in range(args.fences):
+            monitor.add({'id': i, 'device_id': None, 'name': f"z{i}", 'radius_m': rnd.uniform(50, 2000),
+                         'latitude': LAT0 + rnd.uniform(-0.25, 0.25), 'longitude': LON0 + rnd.uniform(-0.35, 0.35)})
+        samples = [{'device_id': f"dev-{i % args.devices}", 'timestamp': None, 'latitude': a, 'longitude': o}
+                   for i, (a, o) in enumerate(zip(lat.tolist(), lon.tolist()))]
+        started = time.perf_counter()
+        events = 0
+        for i in range(0, len(samples), 1000):
+            events += len(monitor.process(samples[i:i + 1000]))
+        elapsed = time.perf_counter() - started
+        print(f"geofences={args.fences}: {elapsed / len(samples) * 1e6:6.2f} µs/sample, {events} enter/exit events")
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
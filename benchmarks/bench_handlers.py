@@ -0,0 +1,83 @@
+"""Затримка обробників бота з кешем останньої телеметрії та без нього.
+
+Заповнює тимчасову БД історією, а потім проганяє гілки handle_message,
+що читають телеметрію, з фейковим Update (відповіді нікуди не йдуть).
+
+    python benchmarks/bench_handlers.py --history 200000 --iterations 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ingest import payload
+from storage import INSERT_TELEMETRY_SQL, telemetry_params
+
+TEXTS = ("📊 Статус", "🛵 Пробіг", "🛢 Залишок", "ℹ️ Нагадування")
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.chat_id = 1
+        self.message_id = 1
+
+    async def reply_text(self, *args, **kwargs):
+        return self
+
+    async def reply_html(self, *args, **kwargs):
+        return self
+
+def fake_update(text):
+    return SimpleNamespace(message=FakeMessage(text), effective_chat=SimpleNamespace(id=1),
+                           effective_user=SimpleNamespace(id=1))
+
+async def measure(app, iterations):
+    context = SimpleNamespace(user_data={}, args=[])
+    latencies = []
+    for i in range(iterations):
+        update = fake_update(TEXTS[i % len(TEXTS)])
+        t0 = time.perf_counter()
+        await app.handle_message(update, context)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(latencies), statistics.quantiles(latencies, n=100)[98]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--history', type=int, default=200000)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_db()
+        app.ensure_telemetry_columns()
+        app.db.executemany(INSERT_TELEMETRY_SQL, (
+            telemetry_params(payload(i % args.devices, i)) for i in range(args.history)
+        ))
+        app.ensure_indexes()
+        app.load_devices()
+        app.bind_device(1, 'dev-0')
+        app.latest_telemetry.warm(app.db)
+
+        median, p99 = asyncio.run(measure(app, args.iterations))
+        print(f"cache: median {median:8.1f} us   p99 {p99:8.1f} us")
+
+        cached = app.get_last_telemetry
+        app.get_last_telemetry = app.query_last_telemetry
+        median, p99 = asyncio.run(measure(app, args.iterations))
+        app.get_last_telemetry = cached
+        print(f"db:    median {median:8.1f} us   p99 {p99:8.1f} us")
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
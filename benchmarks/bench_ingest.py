@@ -0,0 +1,84 @@
+"""Навантаження на конвеєр прийому телеметрії рою симульованих пристроїв.
+
+Режим "queue" штовхає зразки прямо в TelemetryIngestQueue (пропускна
+здатність записувача), режим "http" — через Flask test client на
+/esp32_push. Наприкінці перевіряється, що в БД рівно стільки рядків,
+скільки зразків прийнято.
+
+    python benchmarks/bench_ingest.py --devices 50 --samples 400 --mode queue
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def payload(device, i):
+    return {
+        'device_id': f"dev-{device}",
+        'engine_temperature': 80.0 + i % 10, 'air_temperature': 20.0,
+        'latitude': 50.45, 'longitude': 30.52,
+        'fuel_pulses': i, 'fuel_liters': 10.0 - i * 0.001,
+        'dailyDistance': i * 0.01, 'totalDistance': 12000 + i * 0.01,
+        'dailyAvgConsumption': 4.1, 'totalAvgConsumption': 4.3,
+        'distanceRemCharge': 230.0, 'batteryVoltage': 3.9,
+        'batteryAkkVoltage': 12.6, 'chainServiceLeft': 300, 'oilServiceLeft': 2500,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--samples', type=int, default=400, help="зразків на пристрій")
+    parser.add_argument('--mode', choices=('queue', 'http'), default='queue')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_storage()
+        app.ingest_queue.start()
+
+        rejected = [0]
+        lock = threading.Lock()
+
+        def device(n):
+            client = app.app.test_client() if args.mode == 'http' else None
+            for i in range(args.samples):
+                while True:
+                    if client:
+                        ok = client.post('/esp32_push', json=payload(n, i)).status_code == 200
+                    else:
+                        ok = app.ingest_queue.submit(app.validate_telemetry(payload(n, i)))
+                    if ok:
+                        break
+                    with lock:
+                        rejected[0] += 1
+                    time.sleep(0.01)  # backpressure: пристрій чекає й повторює
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=device, args=(n,)) for n in range(args.devices)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        app.ingest_queue.stop()
+        elapsed = time.perf_counter() - started
+
+        total = args.devices * args.samples
+        rows = app.db.query_one("SELECT COUNT(*) FROM telemetry")[0]
+        stats = app.ingest_queue.stats()
+        print(f"mode={args.mode} devices={args.devices} samples={total}")
+        print(f"throughput:   {total / elapsed:9.0f} samples/s")
+        print(f"rows in db:   {rows} (lost: {total - rows})")
+        print(f"backpressure: {rejected[0]} retries")
+        print(f"batches:      {stats['batches']} avg {stats['avg_batch_size']:.0f} "
+              f"max {stats['max_batch_size']}")
+        print(f"flush:        avg {stats['avg_flush_ms']:.2f} ms max {stats['max_flush_ms']:.2f} ms")
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
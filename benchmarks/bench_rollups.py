@@ -0,0 +1,98 @@
+"""Агрегати телеметрії: ціна інкрементального оновлення на зразок, вартість
+денного звіту з сирих рядків проти годинних агрегатів при зростанні історії,
+і найдовша транзакція під час чистки старих даних.
+
+    python benchmarks/bench_rollups.py --devices 20 --days 30 --interval 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ingest import payload
+from storage import INSERT_TELEMETRY_SQL, telemetry_params
+
+RAW_DAY_SQL = '''
+    SELECT COUNT(*), MAX(engine_temperature), MIN(batteryAkkVoltage),
+           MAX(totalDistance) - MIN(totalDistance)
+    FROM telemetry WHERE device_id=? AND timestamp>=? AND timestamp<?
+'''
+
+def ts(epoch):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+def median_ms(fn, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--interval', type=int, default=10, help="секунд між зразками")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_db()
+        app.ensure_telemetry_columns()
+        app.ensure_indexes()
+        app.rollups.init_schema()
+
+        start = int(time.time()) - args.days * 86400
+        per_day = 86400 // args.interval
+        print(f"{'days':>5} {'raw rows':>10} {'raw day (ms)':>13} {'rollup day (ms)':>16} {'rollup us/sample':>17}")
+        for day in range(args.days):
+            samples = []
+            for i in range(per_day):
+                epoch = start + day * 86400 + i * args.interval
+                for d in range(args.devices):
+                    sample = payload(d, day * per_day + i)
+                    sample['timestamp'] = ts(epoch)
+                    samples.append(sample)
+            app.db.executemany(
+                INSERT_TELEMETRY_SQL,
+                (telemetry_params(s) for s in samples)
+            )
+            t0 = time.perf_counter()
+            for n in range(0, len(samples), 1000):
+                app.rollups.process(samples[n:n + 1000])
+            per_sample = (time.perf_counter() - t0) / len(samples) * 1e6
+
+            if (day + 1) in (1, args.days // 4, args.days // 2, args.days):
+                lo, hi = start + day * 86400, start + (day + 1) * 86400
+                raw = median_ms(lambda: app.db.query_one(RAW_DAY_SQL, ('dev-1', ts(lo), ts(hi))), 5)
+                roll = median_ms(lambda: app.rollups.history('dev-1', '1h', lo, hi))
+                rows = app.db.query_one("SELECT COUNT(*) FROM telemetry")[0]
+                print(f"{day + 1:>5} {rows:>10} {raw:>13.2f} {roll:>16.3f} {per_sample:>17.2f}")
+
+        # чистка: хочемо лише короткі транзакції, навіть коли видаляємо половину історії
+        execute = app.db.execute
+        longest = [0.0]
+        def timed_execute(sql, params=()):
+            t0 = time.perf_counter()
+            try:
+                return execute(sql, params)
+            finally:
+                longest[0] = max(longest[0], time.perf_counter() - t0)
+        app.db.execute = timed_execute
+        t0 = time.perf_counter()
+        deleted = app.rollups.prune(raw_days=args.days / 2, chunk=500, pause=0)
+        elapsed = time.perf_counter() - t0
+        app.db.execute = execute
+        print(f"prune: {deleted} rows in {elapsed:.2f} s, longest delete transaction {longest[0] * 1000:.1f} ms")
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Накладні витрати маршрутизатора повідомлень бота на потоці оновлень.
+
+Відтворює записаний потік оновлень Telegram (NDJSON з getUpdates, --replay)
+або генерує схожий: натискання меню, діалоги заправки і PIN, сміттєвий
+текст. Міряє окремо вибір обробника (route_message — пошук у dict і стан
+користувача) проти лінійного перебору, як у колишньому ланцюжку if/elif,
+і повну обробку handle_message з фейковими відповідями та заглушкою погоди.
+
+    python benchmarks/bench_router.py --updates 20000 --record /tmp/updates.ndjson
+    python benchmarks/bench_router.py --replay /tmp/updates.ndjson
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_handlers import FakeMessage
+from bench_ingest import payload
+
+# кнопка -> вага в потоці; діалоги додаються окремо
+BUTTONS = {
+    "📊 Статус": 20, "🌤 Погода": 8, "🛵 Пробіг": 8, "⛽️ Дизель": 6, "🛢 Залишок": 6,
+    "⚙️ Управління": 4, "🧰 ТО": 3, "🛠 Налаштування": 2, "⬅️ Назад": 10, "ℹ️ Нагадування": 3,
+    "🚫 Вимкнути запалення": 2, "✅ Змастив цеп": 1, "✅ Замінив масло": 1,
+}
+
+def generate(n, users, pin, seed=1):
+    rnd = random.Random(seed)
+    texts, weights = zip(*BUTTONS.items())
+    updates = []
+    while len(updates) < n:
+        user = rnd.randrange(users) + 1
+        roll = rnd.random()
+        if roll < 0.08:
+            dialog = ["⛽ Заправився", rnd.choice(["5", "12,5", "7.25", "багато"])]
+        elif roll < 0.12:
+            dialog = ["🔑 Увімкнути запалення", pin if rnd.random() < 0.8 else "0000"]
+        elif roll < 0.15:
+            dialog = [rnd.choice(["привіт", "/foo", "?", "дякую"])]
+        else:
+            dialog = [rnd.choices(texts, weights)[0]]
+        for text in dialog:
+            updates.append({
+                'update_id': len(updates) + 1,
+                'message': {'message_id': len(updates) + 1, 'date': 0, 'text': text,
+                            'chat': {'id': user, 'type': 'private'}, 'from': {'id': user, 'is_bot': False}},
+            })
+    return updates[:n]
+
+def fake_update(data):
+    message = FakeMessage(data['message']['text'])
+    message.chat_id = data['message']['chat']['id']
+    user = SimpleNamespace(id=data['message']['from']['id'])
+    return SimpleNamespace(message=message, effective_chat=SimpleNamespace(id=message.chat_id), effective_user=user)
+
+def linear_route(routes, text):
+    # вартість колишнього if/elif: порівняння з кожною кнопкою по черзі
+    for key, handler in routes.items():
+        if text == key:
+            return handler
+    return None
+
+def measure_routing(app, updates, repeat):
+    texts = [u['message']['text'] for u in updates]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            app.route_message(text, {})
+    routed = (time.perf_counter() - started) / (repeat * len(texts)) * 1e9
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            linear_route(app.MESSAGE_ROUTES, text)
+    linear = (time.perf_counter() - started) / (repeat * len(texts)) * 1e9
+    return routed, linear
+
+async def replay(app, updates):
+    job_queue = SimpleNamespace(run_once=lambda *a, **kw: None)
+    contexts = {}
+    latencies = []
+    started = time.perf_counter()
+    for data in updates:
+        update = fake_update(data)
+        user_id = update.effective_user.id
+        context = contexts.get(user_id)
+        if context is None:
+            # як у PTB: user_data живе між оновленнями одного користувача
+            context = contexts[user_id] = SimpleNamespace(user_data={}, args=[], job_queue=job_queue)
+        t0 = time.perf_counter()
+        await app.handle_message(update, context)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    return latencies, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--replay', help="NDJSON оновлень Telegram замість згенерованих")
+    parser.add_argument('--record', help="зберегти згенерований потік у NDJSON")
+    parser.add_argument('--repeat', type=int, default=20, help="проходів для заміру маршрутизації")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+        import app
+        app.init_storage()
+        app.latest_telemetry.update(payload(0, 1) | {'device_id': app.ESP32_DEVICE_ID})
+
+        async def weather_stub(lat, lon):
+            return "🌤 Ясно, 20°C"
+        app.get_weather = weather_stub
+
+        if args.replay:
+            with open(args.replay) as f:
+                updates = [u for u in map(json.loads, f) if u.get('message', {}).get('text')]
+        else:
+            updates = generate(args.updates, args.users, app.MASTER_PIN)
+            if args.record:
+                with open(args.record, 'w') as f:
+                    f.writelines(json.dumps(u, ensure_ascii=False) + "\n" for u in updates)
+        print(f"updates={len(updates)} users={len({u['message']['from']['id'] for u in updates})}")
+
+        routed, linear = measure_routing(app, updates, args.repeat)
+        print(f"route_message: {routed:7.0f} ns/update   linear scan: {linear:7.0f} ns/update")
+
+        latencies, elapsed = asyncio.run(replay(app, updates))
+        q = statistics.quantiles(latencies, n=100)
+        print(f"handle_message: {len(updates) / elapsed:7.0f} updates/s  p50 {statistics.median(latencies):7.1f} us  "
+              f"p95 {q[94]:7.1f} us  p99 {q[98]:7.1f} us")
+        commands = app.db.query_one('SELECT COUNT(*) FROM commands')[0]
+        print(f"device commands queued: {commands}")
+        app.db_executor.shutdown()
+        app.db.close_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Навантажувальний тест: Flask dev-сервер (threaded) проти asgi:app під uvicorn.
+
+Піднімає сервер окремим процесом на тимчасовій БД і ганяє по ньому
+--concurrency клієнтів httpx: пуші телеметрії, а кожен --poll-every-й
+запит — опитування команд. Друкує запити/с і перцентилі затримки.
+
+    python benchmarks/bench_runtime.py --runtime flask
+    python benchmarks/bench_runtime.py --runtime asgi --workers 2
+    python benchmarks/bench_runtime.py --runtime both
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ingest import payload
+
+FLASK_SERVER = '''
+import logging, sys
+import app
+logging.getLogger("werkzeug").setLevel(logging.WARNING)
+app.init_storage()
+app.ingest_queue.start()
+app.app.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)
+'''
+
+def start_server(runtime, port, workers, db_file):
+    env = dict(os.environ, DB_FILE=db_file, WEBHOOK_URL="")
+    if runtime == 'flask':
+        cmd = [sys.executable, '-c', FLASK_SERVER, str(port)]
+    else:
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--workers', str(workers),
+               '--log-level', 'warning', '--no-access-log']
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/esp32_push/stats", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{runtime} server did not start")
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+async def load(port, concurrency, duration, poll_every):
+    latencies = []
+    errors = [0]
+    # як ESP32 HTTPClient: нове з'єднання на запит (до того ж пул keep-alive
+    # httpx на десятках з'єднань сам стає вузьким місцем)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=10) as client:
+        deadline = time.monotonic() + duration
+
+        async def worker(n):
+            i = 0
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    if poll_every and i % poll_every == poll_every - 1:
+                        r = await client.get('/esp32_push/commands', params={'device_id': f"dev-{n}"})
+                    else:
+                        r = await client.post('/esp32_push', json=payload(n, i))
+                    if r.status_code != 200:
+                        errors[0] += 1
+                except httpx.HTTPError:
+                    errors[0] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+                i += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies), elapsed, errors[0], latencies
+
+def run(runtime, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = start_server(runtime, args.port, args.workers, os.path.join(tmp, 'bench.db'))
+        try:
+            asyncio.run(load(args.port, 4, 1.0, 0))  # прогрів
+            total, elapsed, errors, lat = asyncio.run(load(args.port, args.concurrency, args.duration, args.poll_every))
+        finally:
+            proc.terminate()
+            proc.wait(15)
+    label = runtime if runtime == 'flask' else f"asgi x{args.workers}"
+    print(f"{label:10s} {total / elapsed:8.0f} req/s  p50 {percentile(lat, 0.5):7.2f} ms  "
+          f"p95 {percentile(lat, 0.95):7.2f} ms  p99 {percentile(lat, 0.99):7.2f} ms  "
+          f"max {lat[-1] if lat else 0:7.1f} ms  errors {errors}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runtime', choices=('flask', 'asgi', 'both'), default='both')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--poll-every', type=int, default=10, help="кожен N-й запит — GET команд (0 — без)")
+    parser.add_argument('--port', type=int, default=8799)
+    args = parser.parse_args()
+    print(f"concurrency={args.concurrency} duration={args.duration:.0f}s cpus={os.cpu_count()}")
+    for runtime in (('flask', 'asgi') if args.runtime == 'both' else (args.runtime,)):
+        run(runtime, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Порівняння старого підходу (connect/commit/close на кожен виклик)
+з ConnectionPool у WAL-режимі: вставки за секунду та p99 затримки.
+
+    python benchmarks/bench_storage.py --rows 5000 --threads 4
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import ConnectionPool, INSERT_TELEMETRY_SQL, telemetry_params, TELEMETRY_FIELDS
+
+SCHEMA = (
+    "CREATE TABLE telemetry (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, "
+    + ", ".join(f"{f} {'TEXT' if f == 'device_id' else 'REAL'}" for f in TELEMETRY_FIELDS)
+    + ", device_seq INTEGER)"
+)
+
+def sample(i):
+    data = {f: float(i) for f in TELEMETRY_FIELDS}
+    data['device_id'] = 'bench'
+    return data
+
+def legacy_insert(path, data):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute(INSERT_TELEMETRY_SQL, telemetry_params(data))
+    conn.commit()
+    conn.close()
+
+def run(insert, rows, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        local = []
+        for i in range(offset, rows, threads):
+            t0 = time.perf_counter()
+            insert(sample(i))
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    p99 = statistics.quantiles(latencies, n=100)[98] * 1000
+    return rows / elapsed, p99
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=3000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        conn = sqlite3.connect(legacy_path)
+        conn.execute(SCHEMA)
+        conn.close()
+        rate, p99 = run(lambda d: legacy_insert(legacy_path, d), args.rows, args.threads)
+        print(f"before (connect per call): {rate:9.0f} inserts/s   p99 {p99:7.2f} ms")
+
+        pool = ConnectionPool(os.path.join(tmp, 'pooled.db'))
+        pool.execute(SCHEMA)
+        rate, p99 = run(lambda d: pool.execute(INSERT_TELEMETRY_SQL, telemetry_params(d)),
+                        args.rows, args.threads)
+        print(f"after  (pooled, WAL):      {rate:9.0f} inserts/s   p99 {p99:7.2f} ms")
+        pool.close_all()
+
+if __name__ == '__main__':
+    main()
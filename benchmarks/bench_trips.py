@@ -0,0 +1,88 @@
+"""Сегментація поїздок: потокова обробка і пакетний replay з історії.
+
+Генерує для кожного пристрою чергування стоянок і поїздок (зразок раз на
+--interval секунд), проганяє їх через TripDetector.process пачками як
+записувач телеметрії, а потім перебудовує ті самі поїздки через replay().
+
+    python benchmarks/bench_trips.py --devices 20 --rides 30
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage import ConnectionPool, INSERT_TELEMETRY_SQL, TELEMETRY_FIELDS, telemetry_params
+from trips import TripDetector
+
+def ts(epoch):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+def synthetic(devices, rides, interval, ride_min=20, park_min=40):
+    start = int(time.time()) - rides * (ride_min + park_min) * 60 - 3600
+    for d in range(devices):
+        epoch, total, fuel, lat = start, 1000.0, 12.0, 50.4
+        for _ in range(rides):
+            for phase, minutes in (('park', park_min), ('ride', ride_min)):
+                for _ in range(minutes * 60 // interval):
+                    epoch += interval
+                    if phase == 'ride':
+                        total += 0.01 * interval   # ~36 км/год
+                        fuel -= 0.0004 * interval
+                        lat += 0.0001 * interval
+                    yield {
+                        'timestamp': ts(epoch), 'device_id': f"dev-{d}",
+                        'engine_temperature': 90.0 if phase == 'ride' else 40.0,
+                        'latitude': lat, 'longitude': 30.5, 'fuel_liters': fuel,
+                        'totalDistance': total, 'dailyDistance': total - 1000.0,
+                    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--rides', type=int, default=30)
+    parser.add_argument('--interval', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'bench.db'))
+        pool.execute(
+            "CREATE TABLE telemetry (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME, "
+            + ", ".join(f"{f} {'TEXT' if f == 'device_id' else 'REAL'}" for f in TELEMETRY_FIELDS)
+            + ", device_seq INTEGER)"
+        )
+        pool.execute("CREATE INDEX idx_telemetry_device_id ON telemetry (device_id, id)")
+        detector = TripDetector(pool)
+        detector.init_schema()
+
+        samples = list(synthetic(args.devices, args.rides, args.interval))
+        # у потоці зразки пристроїв перемішані, як у справжніх пачках записувача
+        samples.sort(key=lambda s: s['timestamp'])
+        pool.executemany(
+            INSERT_TELEMETRY_SQL,
+            (telemetry_params(s) for s in samples)
+        )
+
+        t0 = time.perf_counter()
+        stored = 0
+        for n in range(0, len(samples), 1000):
+            stored += detector.process(samples[n:n + 1000])
+        stored += detector.close_idle()
+        elapsed = time.perf_counter() - t0
+        print(f"stream: {len(samples)} samples -> {stored} trips "
+              f"(expected {args.devices * args.rides}) at {len(samples) / elapsed:,.0f} samples/s")
+
+        t0 = time.perf_counter()
+        replayed, stored = detector.replay()
+        elapsed = time.perf_counter() - t0
+        print(f"replay: {replayed} samples -> {stored} trips at {replayed / elapsed:,.0f} samples/s")
+        trip = detector.last_trips('dev-0', 1)[0]
+        print(f"sample trip: {trip['start_time']} -> {trip['end_time']}, {trip['distance']:.1f} km, "
+              f"{trip['fuel_burned']:.2f} l, {trip['avg_consumption']:.2f} l/100km")
+        pool.close_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""WeatherClient проти локального заглушки OpenWeather: частка влучань
+у кеш, злиття однакових запитів і максимальна затримка циклу asyncio.
+
+Для порівняння той самий потік запитів проганяється через старий
+блокуючий requests.get прямо в циклі.
+
+    python benchmarks/bench_weather.py --lookups 400 --delay 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import multiprocessing
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from weather import WeatherClient, format_weather
+
+class StubWeather(BaseHTTPRequestHandler):
+    delay = 0.1
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps({
+            'weather': [{'description': 'хмарно'}],
+            'main': {'temp': 17.5, 'humidity': 60},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve_stub(port, delay):
+    # окремий процес, щоб заглушка не ділила GIL з циклом, який міряємо
+    StubWeather.delay = delay
+    ThreadingHTTPServer(('127.0.0.1', port), StubWeather).serve_forever()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_for(port, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("stub server did not start")
+
+async def lag_monitor(stop, interval=0.005):
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - t0 - interval)
+    return worst
+
+def coordinates(n, spots):
+    rng = random.Random(7)
+    centres = [(50.0 + rng.random(), 30.0 + rng.random()) for _ in range(spots)]
+    # дрібне тремтіння GPS усередині одного ~1 км кошика
+    return [(lat + rng.uniform(-0.001, 0.001), lon + rng.uniform(-0.001, 0.001))
+            for lat, lon in (rng.choice(centres) for _ in range(n))]
+
+async def run_client(url, coords, concurrency):
+    client = WeatherClient("stub", base_url=url)
+    # перший запит платить одноразові витрати (SSL-контекст, імпорти httpcore) — поза виміром
+    await client.get(0.0, 0.0)
+    client.stats = dict.fromkeys(client.stats, 0)
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(lag_monitor(stop))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def lookup(lat, lon):
+        async with sem:
+            return await client.get(lat, lon)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(lookup(lat, lon) for lat, lon in coords))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    lag = await monitor
+    await client.close()
+    return elapsed, lag, client.stats
+
+async def run_blocking(url, coords):
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(lag_monitor(stop))
+    t0 = time.perf_counter()
+    for lat, lon in coords:
+        try:
+            format_weather(requests.get(url, params={'lat': lat, 'lon': lon}).json())
+        except Exception:
+            pass
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    return elapsed, await monitor
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lookups', type=int, default=400)
+    parser.add_argument('--spots', type=int, default=10, help="різних місць (кошиків)")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--delay', type=float, default=0.1, help="затримка заглушки, с")
+    parser.add_argument('--blocking-sample', type=int, default=20)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve_stub, args=(port, args.delay), daemon=True)
+    server.start()
+    wait_for(port)
+    url = f"http://127.0.0.1:{port}/data/2.5/weather"
+    coords = coordinates(args.lookups, args.spots)
+
+    elapsed, lag, stats = asyncio.run(run_client(url, coords, args.concurrency))
+    served = stats['hits'] + stats['coalesced']
+    print(f"async client: {args.lookups} lookups in {elapsed:.2f} s, upstream requests {stats['misses']}")
+    print(f"  cache hits {stats['hits']}, coalesced {stats['coalesced']}, "
+          f"hit rate {served / args.lookups:.1%}, errors {stats['errors']}")
+    print(f"  max event-loop lag {lag * 1000:.1f} ms")
+
+    elapsed, lag = asyncio.run(run_blocking(url, coords[:args.blocking_sample]))
+    print(f"blocking requests.get: {args.blocking_sample} lookups in {elapsed:.2f} s, "
+          f"upstream requests {args.blocking_sample}, max event-loop lag {lag * 1000:.1f} ms")
+    server.terminate()
+
+if __name__ == '__main__':
+    main()
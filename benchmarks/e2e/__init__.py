@@ -0,0 +1,4 @@
+"""Наскрізний бенчмарк сервісу: парк симульованих ESP32 (пуші, long-poll
+команд, ack), користувачі Telegram через вебхук або getUpdates, локальні
+заглушки OpenWeather і Bot API. Звіт — JSON, придатний для порівняння
+прогонів між собою (див. __main__.py)."""
@@ -0,0 +1,195 @@
+"""Наскрізний прогін: сервер окремим процесом, парк ESP32 і користувачі Telegram.
+
+    python -m benchmarks.e2e --runtime asgi --devices 100 --users 20 --duration 60 \\
+        --output e2e.json --history e2e-history.ndjson --baseline previous.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from .fleet import Recorder, run_fleet
+from .report import compare, db_snapshot, git_revision, summarize, tree_rss
+from .stubs import StubTelegram, StubWeather
+from .telegram import TelegramDriver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TOKEN = "123456:BENCH"
+SECRET = "bench-secret"
+PIN = "1234"
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.e2e")
+    parser.add_argument('--runtime', choices=('asgi', 'flask'), default='asgi',
+                        help="asgi — uvicorn asgi:app з вебхуком; flask — python app.py з polling")
+    parser.add_argument('--workers', type=int, default=1, help="воркери uvicorn (asgi)")
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--push-interval', type=float, default=1.0, help="секунд між пушами пристрою")
+    parser.add_argument('--poll-wait', type=float, default=20.0, help="long-poll команд, секунд")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--think', type=float, default=1.0, help="пауза користувача між повідомленнями, секунд")
+    parser.add_argument('--weather-delay', type=float, default=0.05)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--port', type=int, default=8797)
+    parser.add_argument('--output', help="записати JSON-звіт у файл")
+    parser.add_argument('--history', help="дописати звіт рядком у NDJSON")
+    parser.add_argument('--baseline', help="JSON попереднього прогону для порівняння")
+    parser.add_argument('--threshold', type=float, default=0.10, help="допустиме погіршення (частка)")
+    return parser.parse_args()
+
+def start_server(args, db_file, telegram, weather, log):
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(
+        os.environ, DB_FILE=db_file, TELEGRAM_TOKEN=TOKEN, TELEGRAM_API_URL=telegram.url,
+        OPENWEATHER_URL=weather.url + "/data/2.5/weather", MASTER_PIN=PIN, ESP32_DEVICE_ID="sim-0",
+        ADMIN_CHAT_ID="10000", DAILY_REPORT_TIME="", LONG_POLL_MAX_WAIT=str(args.poll_wait),
+        PORT=str(args.port), WEBHOOK_URL=base_url if args.runtime == 'asgi' else "", WEBHOOK_SECRET=SECRET,
+    )
+    if args.runtime == 'asgi':
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(args.port), '--workers', str(args.workers),
+               '--log-level', 'warning', '--no-access-log']
+        ready = 'setWebhook'
+    else:
+        cmd = [sys.executable, 'app.py']
+        ready = 'getUpdates'
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}, see {log.name}")
+        try:
+            up = httpx.get(base_url + "/esp32_push/stats", timeout=1).status_code == 200
+        except httpx.HTTPError:
+            up = False
+        if up and telegram.calls.get(ready):
+            return proc, base_url
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"server did not become ready, see {log.name}")
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(15)
+    except subprocess.TimeoutExpired:
+        # python app.py: потік Flask не daemon і сам не завершується
+        proc.kill()
+        proc.wait()
+
+async def sample_rss(pid, samples, stop):
+    while not stop.is_set():
+        samples.append(tree_rss(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+async def drive(args, base_url, telegram, proc):
+    devices = Recorder()
+    bot = Recorder()
+    rss = []
+    stop = asyncio.Event()
+    async with httpx.AsyncClient(timeout=10) as client:
+        if args.runtime == 'asgi':
+            async def send(update):
+                response = await client.post(base_url + "/telegram/webhook", json=update,
+                                             headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                response.raise_for_status()
+        else:
+            async def send(update):
+                telegram.enqueue(update)
+        driver = TelegramDriver(send, bot, users=args.users, think=args.think, pin=PIN)
+        telegram.on_reply = driver.on_reply
+        sampler = asyncio.create_task(sample_rss(proc.pid, rss, stop))
+        started = time.perf_counter()
+        device_ids = [f"sim-{n}" for n in range(args.devices)]
+        await asyncio.gather(
+            run_fleet(base_url, device_ids, devices, args.duration, args.push_interval, args.poll_wait),
+            driver.run(args.duration),
+        )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+        await asyncio.sleep(1)  # дати записувачу дописати чергу
+        server_stats = (await client.get(base_url + "/esp32_push/stats")).json()
+    return devices, bot, rss, elapsed, server_stats
+
+def main():
+    args = parse_args()
+    weather = StubWeather(delay=args.weather_delay).start()
+    telegram = StubTelegram().start()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'bench.db')
+        with open(os.path.join(tmp, 'server.log'), 'w') as log:
+            proc, base_url = start_server(args, db_file, telegram, weather, log)
+            try:
+                db_before = db_snapshot(db_file)
+                rss_before = tree_rss(proc.pid)
+                devices, bot, rss, elapsed, server_stats = asyncio.run(drive(args, base_url, telegram, proc))
+                db_after = db_snapshot(db_file)
+            finally:
+                stop_server(proc)
+    weather.stop()
+    telegram.stop()
+
+    report = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(ROOT),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'args': {k: v for k, v in vars(args).items() if k not in ('output', 'history', 'baseline')},
+        },
+        'results': {
+            'elapsed_s': round(elapsed, 2),
+            'devices': summarize(devices, elapsed),
+            'commands': {
+                'received': devices.counts.get('commands_received', 0),
+                'acked': devices.counts.get('commands_acked', 0),
+                'ack_latency': server_stats.get('commands', {}),
+            },
+            'telegram': summarize(bot, elapsed),
+            'ingest': {k: v for k, v in server_stats.items() if isinstance(v, (int, float))},
+            'db': {
+                'bytes_before': db_before['bytes'],
+                'bytes_after': db_after['bytes'],
+                # WAL теж: під навантаженням чекпойнт відстає, і основний файл майже не росте
+                'growth_bytes': db_after['bytes'] + db_after['wal_bytes'] - db_before['bytes'] - db_before['wal_bytes'],
+                'wal_bytes_before': db_before['wal_bytes'],
+                'wal_bytes': db_after['wal_bytes'],
+                'rows': db_after['rows'],
+            },
+            'rss': {
+                'start_bytes': rss_before,
+                'peak_bytes': max(rss, default=rss_before),
+                'end_bytes': rss[-1] if rss else rss_before,
+            },
+            'stubs': {'telegram_calls': dict(telegram.calls), 'weather_requests': weather.requests},
+        },
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    if args.history:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for name, old, new, change in regressions:
+            print(f"REGRESSION {name}: {old} -> {new} ({change:+.0%})", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
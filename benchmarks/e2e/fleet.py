@@ -0,0 +1,125 @@
+"""Парк симульованих ESP32: пуші телеметрії за схемою /esp32_push,
+long-poll команд і пакетне підтвердження, як у прошивці."""
+import asyncio
+import math
+import random
+import time
+
+import httpx
+
+class Recorder:
+    """Затримки (мс) і помилки за назвою операції."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.counts = {}
+
+    def add(self, op, ms, ok=True):
+        self.latencies.setdefault(op, []).append(ms)
+        if not ok:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+class DeviceSim:
+    """Один мотоцикл: їде по колу навколо старту, палить пальне, гріє двигун."""
+
+    def __init__(self, device_id, seed):
+        rnd = random.Random(seed)
+        self.device_id = device_id
+        self.rnd = rnd
+        self.seq = 0
+        self.lat0 = 50.45 + rnd.uniform(-0.1, 0.1)
+        self.lon0 = 30.52 + rnd.uniform(-0.1, 0.1)
+        self.angle = rnd.uniform(0, 2 * math.pi)
+        self.total = rnd.uniform(1000, 30000)
+        self.daily = 0.0
+        self.fuel = rnd.uniform(5, 14)
+        self.pulses = 0
+        self.engine = 20.0
+        self.chain = rnd.uniform(0, 600)
+        self.oil = rnd.uniform(0, 3000)
+
+    def payload(self, interval):
+        moving = self.rnd.random() < 0.8
+        km = (self.rnd.uniform(30, 80) * interval / 3600) if moving else 0.0
+        self.angle += km / 2.0
+        self.total += km
+        self.daily += km
+        self.chain = max(self.chain - km, 0)
+        self.oil = max(self.oil - km, 0)
+        used = km * 4.2 / 100
+        self.fuel = max(self.fuel - used, 0.5)
+        self.pulses += int(used * 1000)
+        self.engine += ((90.0 if moving else 40.0) - self.engine) * 0.1
+        self.seq += 1
+        return {
+            'device_id': self.device_id,
+            'device_seq': self.seq,
+            'engine_temperature': round(self.engine, 1),
+            'air_temperature': round(18 + self.rnd.uniform(-2, 2), 1),
+            'latitude': self.lat0 + 0.02 * math.sin(self.angle),
+            'longitude': self.lon0 + 0.03 * math.cos(self.angle),
+            'fuel_pulses': self.pulses,
+            'fuel_liters': round(self.fuel, 3),
+            'dailyDistance': round(self.daily, 3),
+            'totalDistance': round(self.total, 3),
+            'dailyAvgConsumption': 4.2,
+            'totalAvgConsumption': 4.3,
+            'distanceRemCharge': round(self.fuel / 4.3 * 100, 1),
+            'batteryVoltage': round(3.7 + self.rnd.uniform(0, 0.4), 2),
+            'batteryAkkVoltage': round(12.4 + self.rnd.uniform(0, 0.8), 2),
+            'chainServiceLeft': round(self.chain),
+            'oilServiceLeft': round(self.oil),
+        }
+
+async def _timed(recorder, op, request):
+    started = time.perf_counter()
+    try:
+        response = await request
+        ok = response.status_code == 200
+    except httpx.HTTPError:
+        response, ok = None, False
+    recorder.add(op, (time.perf_counter() - started) * 1000, ok)
+    return response if ok else None
+
+async def run_device(client, sim, recorder, deadline, interval, poll_wait):
+    # пуші і опитування команд — два незалежні цикли, як дві задачі в прошивці
+    async def push_loop():
+        # розносимо старт, щоб пристрої не пушили синхронно
+        await asyncio.sleep(sim.rnd.uniform(0, interval))
+        while time.monotonic() < deadline:
+            await _timed(recorder, 'push', client.post('/esp32_push', json=sim.payload(interval)))
+            await asyncio.sleep(interval)
+
+    async def command_loop():
+        while time.monotonic() < deadline:
+            wait = min(poll_wait, max(deadline - time.monotonic(), 0))
+            response = await _timed(recorder, 'poll', client.get(
+                '/esp32_push/commands', params={'device_id': sim.device_id, 'wait': wait}
+            ))
+            if response is None:
+                await asyncio.sleep(1)
+                continue
+            commands = response.json().get('commands') or []
+            if commands:
+                recorder.count('commands_received', len(commands))
+                acked = await _timed(recorder, 'ack', client.post('/esp32_push/commands/ack_batch', json={
+                    'device_id': sim.device_id, 'command_ids': [c['id'] for c in commands],
+                }))
+                if acked is not None:
+                    recorder.count('commands_acked', acked.json().get('acked', 0))
+
+    await asyncio.gather(push_loop(), command_loop())
+
+async def run_fleet(base_url, device_ids, recorder, duration, interval, poll_wait):
+    limits = httpx.Limits(max_connections=2 * len(device_ids), max_keepalive_connections=0)
+    timeout = httpx.Timeout(poll_wait + 10)
+    deadline = time.monotonic() + duration
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        await asyncio.gather(*(
+            run_device(client, DeviceSim(device_id, n), recorder, deadline, interval, poll_wait)
+            for n, device_id in enumerate(device_ids)
+        ))
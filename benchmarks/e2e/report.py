@@ -0,0 +1,116 @@
+"""Звіт прогону: перцентилі, RSS дерева процесів сервера, розмір БД і
+порівняння з попереднім JSON."""
+import os
+import sqlite3
+import statistics
+import subprocess
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))]
+    return {
+        'count': len(values),
+        'mean_ms': round(statistics.fmean(values), 3),
+        'p50_ms': round(pick(0.50), 3),
+        'p95_ms': round(pick(0.95), 3),
+        'p99_ms': round(pick(0.99), 3),
+        'max_ms': round(values[-1], 3),
+    }
+
+def summarize(recorder, elapsed):
+    result = {}
+    for op, values in sorted(recorder.latencies.items()):
+        item = percentiles(values)
+        item['per_sec'] = round(len(values) / elapsed, 2) if elapsed else 0.0
+        item['errors'] = recorder.errors.get(op, 0)
+        result[op] = item
+    return result
+
+def _children():
+    tree = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # поле comm може містити пробіли — беремо все після останньої ')'
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        tree.setdefault(ppid, []).append(int(name))
+    return tree
+
+def tree_rss(pid):
+    """Сумарний RSS (байти) процесу і всіх його нащадків (воркери uvicorn). Лише Linux."""
+    tree = _children()
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+        stack.extend(tree.get(current, ()))
+    return total
+
+def db_snapshot(path):
+    size = lambda p: os.path.getsize(p) if os.path.exists(p) else 0
+    rows = {}
+    if os.path.exists(path):
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=5)
+        try:
+            for table in ('telemetry', 'telemetry_rollup', 'telemetry_geo', 'trips', 'commands'):
+                try:
+                    rows[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                except sqlite3.Error:
+                    pass
+        finally:
+            conn.close()
+    return {'bytes': size(path), 'wal_bytes': size(path + '-wal'), 'rows': rows}
+
+def git_revision(root):
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def flatten(data, prefix=''):
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+# що вважати регресією: більше — гірше для затримок/пам'яті, менше — для пропускної здатності
+COMPARE = (
+    ('.p95_ms', 1), ('.p99_ms', 1), ('.per_sec', -1), ('.errors', 1), ('rss.peak_bytes', 1), ('db.growth_bytes', 1),
+)
+
+def compare(current, baseline, threshold):
+    """[(метрика, було, стало, зміна), ...] для змін, гірших за threshold (частка)."""
+    now, before = flatten(current['results']), flatten(baseline['results'])
+    regressions = []
+    for name, value in sorted(now.items()):
+        direction = next((sign for suffix, sign in COMPARE if name.endswith(suffix)), 0)
+        old = before.get(name)
+        if not direction or old is None:
+            continue
+        if old == 0:
+            worse = direction > 0 and value > 0
+            change = float('inf') if worse else 0.0
+        else:
+            change = (value - old) / abs(old)
+            worse = change * direction > threshold
+        if worse:
+            regressions.append((name, old, value, change))
+    return regressions
@@ -0,0 +1,126 @@
+"""Локальні заглушки зовнішніх сервісів: OpenWeather і Telegram Bot API."""
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WEATHER_RESPONSE = json.dumps({
+    'weather': [{'description': "ясно"}],
+    'main': {'temp': 18.5, 'humidity': 55},
+}).encode()
+
+class _Server:
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, як у справжніх API
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _WeatherHandler(_QuietHandler):
+    def do_GET(self):
+        stub = self.server.stub
+        if stub.delay:
+            time.sleep(stub.delay)
+        with stub.lock:
+            stub.requests += 1
+        self.reply(WEATHER_RESPONSE)
+
+class StubWeather(_Server):
+    """OpenWeather /data/2.5/weather: завжди однакова відповідь через delay секунд."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.requests = 0
+        self.lock = threading.Lock()
+        super().__init__(_WeatherHandler)
+
+class _TelegramHandler(_QuietHandler):
+    def _params(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+        if 'json' in content_type:
+            return json.loads(body or b'{}')
+        if 'multipart' in content_type:
+            return {}  # файли (sendDocument) не розбираємо
+        return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+    def do_POST(self):
+        # /bot<token>/<method>
+        method = urlparse(self.path).path.rsplit('/', 1)[-1]
+        result = self.server.stub.handle(method, self._params())
+        self.reply(json.dumps({'ok': True, 'result': result}).encode())
+
+    do_GET = do_POST
+
+class StubTelegram(_Server):
+    """Мінімальний Bot API: getMe, getUpdates (черга enqueue()), sendMessage
+    та інші send*, решта методів — {"ok": true, "result": true}.
+    on_reply(chat_id, method) викликається з потоку сервера на кожну відповідь бота."""
+
+    BOT_USER = {'id': 1000, 'is_bot': True, 'first_name': "HiSha", 'username': "hisha_bench_bot"}
+
+    def __init__(self, on_reply=None):
+        self.on_reply = on_reply
+        self.calls = {}
+        self.lock = threading.Lock()
+        self._updates = queue.Queue()
+        self._message_id = 0
+        super().__init__(_TelegramHandler)
+
+    def enqueue(self, update):
+        self._updates.put(update)
+
+    def handle(self, method, params):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if method == 'getMe':
+            return self.BOT_USER
+        if method == 'getUpdates':
+            return self._get_updates(float(params.get('timeout') or 0))
+        if method.startswith('send'):
+            chat_id = int(params.get('chat_id') or 0)
+            with self.lock:
+                self._message_id += 1
+                message_id = self._message_id
+            if self.on_reply is not None:
+                self.on_reply(chat_id, method)
+            return {'message_id': message_id, 'date': int(time.time()), 'text': params.get('text', ''),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'from': self.BOT_USER}
+        return True
+
+    def _get_updates(self, timeout):
+        # офсет не відстежуємо: кожне оновлення віддається рівно один раз
+        updates = []
+        try:
+            updates.append(self._updates.get(timeout=min(timeout, 1.0)))
+            while len(updates) < 100:
+                updates.append(self._updates.get_nowait())
+        except queue.Empty:
+            pass
+        return updates
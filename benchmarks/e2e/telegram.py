@@ -0,0 +1,92 @@
+"""Генератор оновлень Telegram: користувачі тиснуть кнопки меню, проходять
+діалоги заправки й PIN і пишуть сміття. Затримка — від відправки
+оновлення боту до першої відповіді бота на заглушці Bot API."""
+import asyncio
+import itertools
+import random
+import time
+
+# кнопка -> вага; діалоги з кількох повідомлень — в dialogs()
+BUTTONS = {
+    "📊 Статус": 20, "🌤 Погода": 8, "🛵 Пробіг": 8, "⛽️ Дизель": 6, "🛢 Залишок": 6,
+    "⚙️ Управління": 4, "🧰 ТО": 3, "🛠 Налаштування": 2, "⬅️ Назад": 10, "ℹ️ Нагадування": 3,
+    "🏁 Поїздки": 3, "⛽ Аналітика": 2,
+    "🚫 Вимкнути запалення": 2, "✅ Змастив цеп": 1, "✅ Замінив масло": 1,
+}
+
+def dialogs(pin):
+    return (
+        (0.08, lambda rnd: ["⛽ Заправився", rnd.choice(["5", "12,5", "7.25", "багато"])]),
+        (0.04, lambda rnd: ["🔑 Увімкнути запалення", pin if rnd.random() < 0.8 else "0000"]),
+        (0.03, lambda rnd: [rnd.choice(["привіт", "/foo", "?", "дякую"])]),
+    )
+
+class TelegramDriver:
+    """Кожен користувач шле наступне повідомлення лише після відповіді на
+    попереднє і паузи think (за неї доходять решта відповідей: деякі гілки
+    шлють кілька повідомлень). send(update) — вебхук або черга getUpdates."""
+
+    def __init__(self, send, recorder, users, think, pin, timeout=10.0, seed=1):
+        self.send = send
+        self.recorder = recorder
+        self.users = users
+        self.think = think
+        self.pin = pin
+        self.timeout = timeout
+        self.seed = seed
+        self._ids = itertools.count(1)
+        self._waiters = {}
+        self._loop = None
+
+    def on_reply(self, chat_id, method):
+        # з потоку заглушки Telegram
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._resolve, chat_id)
+
+    def _resolve(self, chat_id):
+        waiter = self._waiters.pop(chat_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(time.perf_counter())
+
+    def _update(self, chat_id, text):
+        update_id = next(self._ids)
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id, 'date': int(time.time()), 'text': text,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': f"user{chat_id}"},
+            },
+        }
+
+    async def _user(self, chat_id, deadline):
+        rnd = random.Random(self.seed * 100003 + chat_id)
+        texts, weights = zip(*BUTTONS.items())
+        await asyncio.sleep(rnd.uniform(0, self.think))
+        while time.monotonic() < deadline:
+            roll = rnd.random()
+            for share, make in dialogs(self.pin):
+                if roll < share:
+                    messages = make(rnd)
+                    break
+                roll -= share
+            else:
+                messages = [rnd.choices(texts, weights)[0]]
+            for text in messages:
+                waiter = self._loop.create_future()
+                self._waiters[chat_id] = waiter
+                started = time.perf_counter()
+                try:
+                    await self.send(self._update(chat_id, text))
+                    replied = await asyncio.wait_for(waiter, self.timeout)
+                    self.recorder.add('reply', (replied - started) * 1000)
+                except Exception:
+                    self._waiters.pop(chat_id, None)
+                    self.recorder.add('reply', (time.perf_counter() - started) * 1000, ok=False)
+                await asyncio.sleep(self.think * rnd.uniform(0.5, 1.5))
+
+    async def run(self, duration):
+        self._loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + duration
+        # chat_id з 10001, щоб не збігались з ADMIN_CHAT_ID
+        await asyncio.gather(*(self._user(10000 + n, deadline) for n in range(1, self.users + 1)))
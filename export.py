@@ -0,0 +1,143 @@
+import csv
+import io
+from xml.sax.saxutils import escape, quoteattr
+
+from storage import TELEMETRY_FIELDS
+from ingest import normalize_timestamp
+from rollups import to_epoch
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet необов'язковий: без pyarrow працюють CSV і GPX
+    pa = pc = pq = None
+
+PARQUET_AVAILABLE = pa is not None
+
+EXPORT_COLUMNS = ('id', 'timestamp', 'device_seq') + TELEMETRY_FIELDS
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'gpx': ('application/gpx+xml', 'gpx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+def parse_bound(value):
+    """Межа діапазону з запиту (unix-секунди або ISO 8601) у форматі колонки timestamp."""
+    if value in (None, ''):
+        return None
+    return normalize_timestamp(to_epoch(value))
+
+def iter_chunks(pool, device_id, since=None, until=None, chunk=5000):
+    """Рядки телеметрії пристрою за [since, until) пачками по chunk, у порядку часу.
+
+    Keyset-пагінація по індексу (device_id, timestamp): кожна пачка — окремий
+    короткий запит, тож довгий експорт не тримає снапшот WAL і не заважає
+    checkpoint, а в пам'яті ніколи немає більше однієї пачки."""
+    sql = f'''
+        SELECT {', '.join(EXPORT_COLUMNS)} FROM telemetry
+        WHERE device_id = ? AND (timestamp, id) > (?, ?) {"AND timestamp < ?" if until else ""}
+        ORDER BY timestamp, id LIMIT {int(chunk)}
+    '''
+    last = (since or '', 0)
+    while True:
+        params = (device_id,) + last + ((until,) if until else ())
+        rows = pool.query_all(sql, params)
+        if not rows:
+            return
+        yield rows
+        last = (rows[-1]['timestamp'], rows[-1]['id'])
+        if len(rows) < chunk:
+            return
+
+def stream_csv(chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+def stream_gpx(chunks, device_id):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="HondaShadow" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        f'<trk><name>{escape(str(device_id))}</name><trkseg>\n'
+    ).encode()
+    for rows in chunks:
+        points = []
+        for row in rows:
+            lat, lon = row['latitude'], row['longitude']
+            if lat is None or lon is None or not (lat or lon):
+                continue  # немає фіксу GPS
+            points.append(
+                f'<trkpt lat={quoteattr(repr(lat))} lon={quoteattr(repr(lon))}>'
+                f'<time>{row["timestamp"].replace(" ", "T")}Z</time></trkpt>\n'
+            )
+        if points:
+            yield ''.join(points).encode()
+    yield b'</trkseg></trk>\n</gpx>\n'
+
+class _ChunkSink(io.RawIOBase):
+    """Файл лише на запис для ParquetWriter: віддає накопичені байти через take()."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+def _parquet_schema():
+    fields = [('id', pa.int64()), ('timestamp', pa.timestamp('s', tz='UTC')), ('device_seq', pa.int64()),
+              ('device_id', pa.string())]
+    fields += [(name, pa.float64()) for name in TELEMETRY_FIELDS if name != 'device_id']
+    return pa.schema(fields)
+
+def stream_parquet(chunks, compression='zstd'):
+    """Кожна пачка — окрема row group; байти віддаються одразу після її запису."""
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("parquet export requires pyarrow")
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for rows in chunks:
+            columns = {name: [row[i] for row in rows] for i, name in enumerate(EXPORT_COLUMNS)}
+            columns['timestamp'] = pc.strptime(
+                pa.array(columns['timestamp'], pa.string()), format='%Y-%m-%d %H:%M:%S', unit='s'
+            ).cast(schema.field('timestamp').type)
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+def stream_export(pool, fmt, device_id, since=None, until=None, chunk=5000):
+    chunks = iter_chunks(pool, device_id, since, until, chunk)
+    if fmt == 'csv':
+        return stream_csv(chunks)
+    if fmt == 'gpx':
+        return stream_gpx(chunks, device_id)
+    if fmt == 'parquet':
+        return stream_parquet(chunks)
+    raise ValueError(f"format must be one of {', '.join(FORMATS)}")
@@ -0,0 +1,327 @@
+import json
+import math
+import threading
+import time
+
+import numpy as np
+
+from rollups import to_epoch
+from trips import haversine_km
+
+M_PER_DEG = 111320.0
+
+def _has_fix(lat, lon):
+    return lat is not None and lon is not None and bool(lat or lon)
+
+def simplify(points, tolerance_m):
+    """Дуглас–Пекер над масивом [[ts, lat, lon], ...]: лишає точки, без яких
+    трек відхилився б більше ніж на tolerance_m метрів. Повертає індекси."""
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    # локальна рівнокутна проєкція в метри — на масштабі треку похибка мізерна
+    lat0 = math.radians(float(np.mean(points[:, 1])))
+    x = points[:, 2] * M_PER_DEG * math.cos(lat0)
+    y = points[:, 1] * M_PER_DEG
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(px * dy - py * dx) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance_m:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+    return np.flatnonzero(keep)
+
+class GeoIndex:
+    """Просторовий індекс позицій на SQLite R*Tree.
+
+    Кожна позиція — точка-прямокутник у віртуальній таблиці telemetry_geo
+    з device_id і часом у допоміжних колонках. Щоб стоянка на добу не
+    давала 86400 однакових точок, пристрій потрапляє в індекс, лише коли
+    зрушив на min_move_m метрів або минуло min_interval секунд."""
+
+    def __init__(self, pool, min_move_m=20.0, min_interval=60.0, track_max_points=5000):
+        self.pool = pool
+        self.track_max_points = track_max_points
+        self.min_move_km = min_move_m / 1000
+        self.min_interval = min_interval
+        self._last = {}  # device_id -> (ts, lat, lon) останньої точки в індексі
+        self._lock = threading.Lock()
+
+    def init_schema(self):
+        with self.pool.transaction() as c:
+            c.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS telemetry_geo USING rtree(
+                    id, min_lat, max_lat, min_lon, max_lon, +device_id, +ts
+                )
+            ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS geofences (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device_id TEXT,
+                    name TEXT,
+                    latitude REAL,
+                    longitude REAL,
+                    radius_m REAL
+                )
+            ''')
+
+    def _rows(self, samples):
+        rows = []
+        for sample in samples:
+            lat, lon = sample.get('latitude'), sample.get('longitude')
+            if not _has_fix(lat, lon):
+                continue
+            device_id = sample.get('device_id')
+            ts = to_epoch(sample.get('timestamp'))
+            last = self._last.get(device_id)
+            if last is not None and abs(ts - last[0]) < self.min_interval \
+                    and haversine_km(last[1], last[2], lat, lon) < self.min_move_km:
+                continue
+            self._last[device_id] = (ts, lat, lon)
+            rows.append((lat, lat, lon, lon, device_id, int(ts)))
+        return rows
+
+    def process(self, samples):
+        with self._lock:
+            rows = self._rows(samples)
+        if rows:
+            self.pool.executemany(
+                'INSERT INTO telemetry_geo (min_lat, max_lat, min_lon, max_lon, device_id, ts) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        return len(rows)
+
+    def rebuild(self, device_id=None, chunk=20000):
+        """Наповнює індекс з сирої телеметрії (для історії, що була до нього)."""
+        with self.pool.transaction() as c:
+            if device_id is None:
+                c.execute('DELETE FROM telemetry_geo')
+            else:
+                c.execute('DELETE FROM telemetry_geo WHERE device_id=?', (device_id,))
+        with self._lock:
+            if device_id is None:
+                self._last.clear()
+            else:
+                self._last.pop(device_id, None)
+        last_id = indexed = 0
+        where = "id > ?" + (" AND device_id = ?" if device_id is not None else "")
+        while True:
+            params = (last_id, device_id) if device_id is not None else (last_id,)
+            rows = self.pool.query_all(
+                f"SELECT id, device_id, timestamp, latitude, longitude FROM telemetry "
+                f"WHERE {where} ORDER BY id LIMIT {int(chunk)}", params
+            )
+            if not rows:
+                break
+            indexed += self.process([dict(row) for row in rows])
+            last_id = rows[-1]['id']
+        return indexed
+
+    def track(self, device_id, since=None, until=None, tolerance_m=10.0, max_points=None):
+        """Де був пристрій за [since, until): трек з сирої телеметрії по індексу
+        (device_id, timestamp), спрощений Дугласом–Пекером.
+
+        Якщо в діапазоні більше max_points зразків (доба посекундно — 86400),
+        перед спрощенням береться кожен step-й: id — з покривного індексу
+        без читання рядків, з таблиці читаються лише вибрані. points у
+        відповіді — скільки точок пішло в спрощення."""
+        max_points = self.track_max_points if max_points is None else max_points
+        bounds = (device_id, since or '', until or '9999-12-31 23:59:59')
+        cur = self.pool.connection().cursor()
+        cur.row_factory = None
+        ids = [row[0] for row in cur.execute(
+            'SELECT id FROM telemetry WHERE device_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp, id',
+            bounds
+        )]
+        step = -(-len(ids) // max_points) if max_points else 1
+        if step > 1:
+            picked = ids[::step]
+            if picked[-1] != ids[-1]:
+                picked.append(ids[-1])  # кінець треку не губимо
+            where, params = 'id IN (SELECT value FROM json_each(?))', (json.dumps(picked),)
+        else:
+            where, params = 'device_id = ? AND timestamp >= ? AND timestamp < ?', bounds
+        cur.execute(f'''
+            SELECT CAST(strftime('%s', timestamp) AS INTEGER), latitude, longitude FROM telemetry
+            WHERE {where}
+              AND latitude IS NOT NULL AND longitude IS NOT NULL AND (latitude != 0 OR longitude != 0)
+            ORDER BY timestamp, id
+        ''', params)
+        points = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 3)
+        keep = simplify(points, tolerance_m) if tolerance_m else np.arange(len(points))
+        return {
+            'device_id': device_id,
+            'points': len(points),
+            'step': step,
+            'track': [(int(t), lat, lon) for t, lat, lon in points[keep].tolist()],
+        }
+
+    def nearby(self, lat, lon, radius_m, device_id=None, since=None, until=None):
+        """Точки індексу в радіусі radius_m: [(device_id, ts, lat, lon, метрів)]."""
+        dlat = radius_m / M_PER_DEG
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        sql = '''
+            SELECT device_id, ts, (min_lat + max_lat) / 2, (min_lon + max_lon) / 2 FROM telemetry_geo
+            WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+        '''
+        params = [lat - dlat, lat + dlat, lon - dlon, lon + dlon]
+        if device_id is not None:
+            sql += ' AND device_id = ?'
+            params.append(device_id)
+        if since is not None:
+            sql += ' AND ts >= ?'
+            params.append(int(to_epoch(since)))
+        if until is not None:
+            sql += ' AND ts < ?'
+            params.append(int(to_epoch(until)))
+        rows = self.pool.query_all(sql, params)
+        if not rows:
+            return []
+        # прямокутник R*Tree ширший за коло — точна відстань для всіх кандидатів разом
+        coords = np.array([(row[2], row[3]) for row in rows], dtype=np.float64)
+        p1, p2 = math.radians(lat), np.radians(coords[:, 0])
+        a = np.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(np.radians(coords[:, 1] - lon) / 2) ** 2
+        meters = 2 * 6371000.0 * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+        result = [
+            (rows[i][0], rows[i][1], coords[i, 0], coords[i, 1], float(meters[i]))
+            for i in np.flatnonzero(meters <= radius_m).tolist()
+        ]
+        result.sort(key=lambda p: (p[0], p[1]))
+        return result
+
+    def visits(self, lat, lon, radius_m=100.0, device_id=None, since=None, until=None, gap=1800):
+        """Візити біля точки: сусідні точки індексу з перервою до gap секунд
+        зливаються в один візит [прибув, поїхав]."""
+        visits = []
+        for dev, ts, _, _, meters in self.nearby(lat, lon, radius_m, device_id, since, until):
+            last = visits[-1] if visits else None
+            if last is not None and last['device_id'] == dev and ts - last['left'] <= gap:
+                last['left'] = ts
+                last['points'] += 1
+                last['closest_m'] = min(last['closest_m'], meters)
+            else:
+                visits.append({'device_id': dev, 'arrived': ts, 'left': ts, 'points': 1, 'closest_m': meters})
+        return visits
+
+    def prune(self, days, chunk=500, pause=0.01):
+        cutoff = int(time.time() - days * 86400)
+        deleted = 0
+        while True:
+            cur = self.pool.execute(
+                'DELETE FROM telemetry_geo WHERE id IN (SELECT id FROM telemetry_geo WHERE ts < ? LIMIT ?)',
+                (cutoff, chunk)
+            )
+            deleted += cur.rowcount
+            if cur.rowcount < chunk:
+                return deleted
+            time.sleep(pause)
+
+class GeofenceMonitor:
+    """Входи й виходи з круглих геозон на кожному зразку.
+
+    Зони розкладені по сітці cell градусів, тож на зразок перевіряються
+    лише зони його клітинки плюс ті, в яких пристрій зараз перебуває.
+    Вихід — лише за межею radius * (1 + margin), щоб GPS-шум на межі
+    не давав пар вхід/вихід. Перший зразок пристрою лише задає стан."""
+
+    def __init__(self, notify=None, margin=0.2, cell=0.01, max_age=600):
+        self.notify = notify  # notify(device_id, fence, event, sample), event: 'enter' | 'exit'
+        self.margin = margin
+        self.cell = cell
+        self.max_age = max_age
+        self._fences = {}
+        self._grid = {}
+        self._inside = {}  # device_id -> set(fence id)
+        self._lock = threading.Lock()
+
+    def _cells(self, fence):
+        dlat = fence['radius_m'] / M_PER_DEG
+        dlon = dlat / max(math.cos(math.radians(fence['latitude'])), 1e-6)
+        for i in range(math.floor((fence['latitude'] - dlat) / self.cell), math.floor((fence['latitude'] + dlat) / self.cell) + 1):
+            for j in range(math.floor((fence['longitude'] - dlon) / self.cell), math.floor((fence['longitude'] + dlon) / self.cell) + 1):
+                yield i, j
+
+    def add(self, fence):
+        with self._lock:
+            self._fences[fence['id']] = fence
+            for key in self._cells(fence):
+                self._grid.setdefault(key, []).append(fence)
+
+    def remove(self, fence_id):
+        with self._lock:
+            fence = self._fences.pop(fence_id, None)
+            if fence is None:
+                return False
+            for key in self._cells(fence):
+                cell = [f for f in self._grid.get(key, ()) if f['id'] != fence_id]
+                if cell:
+                    self._grid[key] = cell
+                else:
+                    self._grid.pop(key, None)
+            for inside in self._inside.values():
+                inside.discard(fence_id)
+            return True
+
+    def load(self, pool):
+        rows = pool.query_all('SELECT * FROM geofences')
+        for row in rows:
+            self.add(dict(row))
+        return len(rows)
+
+    def fences(self, device_id=None):
+        with self._lock:
+            return [dict(f) for f in self._fences.values()
+                    if device_id is None or f['device_id'] in (None, device_id)]
+
+    def _step(self, sample, events, now):
+        lat, lon = sample.get('latitude'), sample.get('longitude')
+        if not _has_fix(lat, lon):
+            return
+        device_id = sample.get('device_id')
+        inside = self._inside.get(device_id)
+        first = inside is None
+        if first:
+            inside = self._inside[device_id] = set()
+        ts = sample.get('timestamp')
+        quiet = first or (ts is not None and now - to_epoch(ts) > self.max_age)
+        for fence_id in list(inside):
+            fence = self._fences[fence_id]
+            if haversine_km(fence['latitude'], fence['longitude'], lat, lon) * 1000 > fence['radius_m'] * (1 + self.margin):
+                inside.discard(fence_id)
+                if not quiet:
+                    events.append((device_id, fence, 'exit', sample))
+        for fence in self._grid.get((math.floor(lat / self.cell), math.floor(lon / self.cell)), ()):
+            if fence['id'] in inside or fence['device_id'] not in (None, device_id):
+                continue
+            if haversine_km(fence['latitude'], fence['longitude'], lat, lon) * 1000 <= fence['radius_m']:
+                inside.add(fence['id'])
+                if not quiet:
+                    events.append((device_id, fence, 'enter', sample))
+
+    def process(self, samples):
+        now = time.time()
+        events = []
+        with self._lock:
+            for sample in samples:
+                self._step(sample, events, now)
+        if self.notify is not None:
+            for event in events:
+                try:
+                    self.notify(*event)
+                except Exception as e:
+                    print("❌ Помилка сповіщення геозони:", e)
+        return events
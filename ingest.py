@@ -0,0 +1,310 @@
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from storage import INSERT_TELEMETRY_SQL, TELEMETRY_FIELDS, telemetry_params
+
+NUMERIC_FIELDS = tuple(f for f in TELEMETRY_FIELDS if f != 'device_id')
+MAX_DEVICE_ID_LENGTH = 64
+MAX_DEVICE_SEQ = 2 ** 63 - 1  # INTEGER у SQLite — 64 біти зі знаком
+
+def validate_telemetry(data):
+    """Перевіряє payload з /esp32_push і повертає нормалізований dict.
+    Кидає ValueError, якщо зразок не можна записати."""
+    if not isinstance(data, dict):
+        raise ValueError("payload must be a JSON object")
+    sample = {'device_id': data.get('device_id')}
+    if sample['device_id'] is not None:
+        if not isinstance(sample['device_id'], str):
+            raise ValueError("device_id must be a string")
+        if len(sample['device_id']) > MAX_DEVICE_ID_LENGTH:
+            raise ValueError(f"device_id must be at most {MAX_DEVICE_ID_LENGTH} characters")
+        try:
+            # одиночні сурогати з JSON ("\ud800") SQLite не прийме
+            sample['device_id'].encode('utf-8')
+        except UnicodeEncodeError:
+            raise ValueError("device_id must be valid UTF-8")
+    for field in NUMERIC_FIELDS:
+        value = data.get(field)
+        if value is None:
+            sample[field] = None
+            continue
+        if isinstance(value, bool):
+            raise ValueError(f"{field} must be a number")
+        try:
+            sample[field] = float(value)
+        except (TypeError, ValueError, OverflowError):  # float(10**400) — OverflowError
+            raise ValueError(f"{field} must be a number")
+    if data.get('timestamp') is not None:
+        sample['timestamp'] = normalize_timestamp(data['timestamp'])
+    if data.get('device_seq') is not None:
+        seq = data['device_seq']
+        if isinstance(seq, bool) or not isinstance(seq, int) or not 0 <= seq <= MAX_DEVICE_SEQ:
+            raise ValueError(f"device_seq must be an integer from 0 to {MAX_DEVICE_SEQ}")
+        sample['device_seq'] = seq
+    return sample
+
+def normalize_timestamp(value):
+    """Час з пристрою (unix-секунди або ISO 8601) -> 'YYYY-MM-DD HH:MM:SS' UTC,
+    той самий формат, що й DEFAULT CURRENT_TIMESTAMP."""
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        if isinstance(value, (int, float)):
+            dt = datetime.fromtimestamp(value, timezone.utc)
+        else:
+            dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError("timestamp must be unix seconds or ISO 8601")
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class TelemetryIngestQueue:
+    """Обмежена черга зразків телеметрії з фоновим записувачем.
+
+    HTTP-обробник лише кладе зразок у чергу; потік-записувач забирає
+    пачки до batch_size штук (або все, що набралось за flush_interval)
+    і пише їх одним executemany в одній транзакції. Коли черга повна
+    або вже зупиняється (stop), submit() повертає False — обробник
+    віддає 503, пристрій повторить.
+
+    Тимчасові помилки БД (sqlite3.OperationalError: locked, busy, диск)
+    повторюються; на будь-якій іншій пачка ділиться навпіл, доки не
+    лишиться зразок, який не записується — його відкидаємо з логом
+    (stats['dropped']), щоб один битий рядок не зупинив запис для всіх."""
+
+    def __init__(self, pool, max_pending=50000, batch_size=1000, flush_interval=0.05,
+                 retry_delay=0.5):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._submit_lock = threading.Lock()
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'accepted': 0,
+            'rejected': 0,
+            'written': 0,
+            'duplicates': 0,
+            'batches': 0,
+            'errors': 0,
+            'dropped': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def add_listener(self, callback):
+        """callback(samples) викликається в потоці записувача після коміту пачки."""
+        self._listeners.append(callback)
+
+    def detach_listeners(self):
+        """Забирає всіх слухачів (їх далі годує TelemetryTailer)."""
+        listeners, self._listeners = self._listeners, []
+        return listeners
+
+    def submit(self, sample):
+        return self.submit_many((sample,))
+
+    def submit_many(self, samples):
+        """Кладе пачку зразків цілком або не кладе нічого — пристрій, що
+        отримав 503, просто повторить весь запит без дублікатів."""
+        with self._submit_lock:
+            # записувач лише забирає з черги, тож вільне місце може тільки зрости;
+            # після stop() черги ніхто не дописав би — зразок загубився б
+            if self._stop.is_set() or self._queue.maxsize - self._queue.qsize() < len(samples):
+                with self._stats_lock:
+                    self._stats['rejected'] += len(samples)
+                return False
+            for sample in samples:
+                self._queue.put_nowait(sample)
+        with self._stats_lock:
+            self._stats['accepted'] += len(samples)
+        return True
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Зупиняє записувача і дописує все, що лишилось у черзі. Нові
+        submit() після цього відхиляються."""
+        with self._submit_lock:
+            self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        while not self._queue.empty():
+            self.write(self._drain(block=False))
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        stats['avg_batch_size'] = (stats['written'] + stats['duplicates']) / stats['batches'] if stats['batches'] else 0.0
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+    def _drain(self, block=True):
+        batch = []
+        if block:
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if not block or remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _insert(self, batch):
+        if not any(sample.get('device_seq') is not None for sample in batch):
+            self.pool.executemany(INSERT_TELEMETRY_SQL, [telemetry_params(s) for s in batch])
+            return batch
+        # є номери послідовності — дізнаємось, які рядки справді вставлено,
+        # щоб повтори не потрапили в агрегати й поїздки
+        inserted = []
+        with self.pool.transaction() as c:
+            for sample in batch:
+                if c.execute(INSERT_TELEMETRY_SQL, telemetry_params(sample)).rowcount:
+                    inserted.append(sample)
+        return inserted
+
+    def _insert_or_split(self, batch, retry):
+        # -> (вставлені зразки, кількість відкинутих)
+        while True:
+            try:
+                return self._insert(batch), 0
+            except sqlite3.OperationalError as e:
+                # БД зайнята або недоступна — пачку не викидаємо, повторюємо, поки не оживе
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+                print("❌ Не вдалося записати пачку телеметрії:", e)
+                if not retry or (self._stop.is_set() and self._thread is None):
+                    raise
+                time.sleep(self.retry_delay)
+            except Exception as e:
+                # проблема в даних: шукаємо битий зразок поділом навпіл, решту пишемо
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+                if len(batch) == 1:
+                    print(f"❌ Зразок телеметрії відкинуто ({type(e).__name__}: {e}):", batch[0])
+                    return [], 1
+                middle = len(batch) // 2
+                head, head_dropped = self._insert_or_split(batch[:middle], retry)
+                tail, tail_dropped = self._insert_or_split(batch[middle:], retry)
+                return head + tail, head_dropped + tail_dropped
+
+    def write(self, batch, retry=True):
+        """Пише пачку одразу в потоці, що викликає (використовує і bulk-завантаження).
+        Повертає зразки, які справді додано (без дублікатів за device_seq і
+        без відкинутих битих). З retry=False тимчасова помилка БД летить
+        нагору замість нескінченних повторів."""
+        if not batch:
+            return []
+        started = time.perf_counter()
+        inserted, dropped = self._insert_or_split(batch, retry)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            s = self._stats
+            s['written'] += len(inserted)
+            s['duplicates'] += len(batch) - len(inserted) - dropped
+            s['dropped'] += dropped
+            s['batches'] += 1
+            s['last_batch_size'] = len(batch)
+            s['max_batch_size'] = max(s['max_batch_size'], len(batch))
+            s['last_flush_ms'] = elapsed_ms
+            s['max_flush_ms'] = max(s['max_flush_ms'], elapsed_ms)
+            s['total_flush_ms'] += elapsed_ms
+        if inserted:
+            for callback in self._listeners:
+                try:
+                    callback(inserted)
+                except Exception as e:
+                    print("❌ Помилка обробника пачки телеметрії:", e)
+        return inserted
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.write(self._drain())
+
+class TelemetryTailer:
+    """Годує слухачів рядками, які вже лежать у telemetry, а не зразками з
+    черги свого процесу. Потрібен, коли пишуть кілька процесів (воркери
+    uvicorn): слухачі зі станом у пам'яті (агрегати, поїздки, сповіщення)
+    працюють лише в одному з них і бачать потік кожного пристрою цілком.
+    SQLite серіалізує записувачів, тож id з'являються в порядку коміту
+    і курсора "останній прочитаний id" достатньо."""
+
+    def __init__(self, pool, listeners, interval=0.2, batch_size=5000):
+        self.pool = pool
+        self.listeners = list(listeners)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, last_id=None):
+        if last_id is None:
+            last_id = self.pool.query_one('SELECT MAX(id) FROM telemetry')[0] or 0
+        self.last_id = last_id
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-tailer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.poll()
+
+    def poll(self):
+        """Один прохід: роздає всі нові рядки, повертає їх кількість."""
+        total = 0
+        while True:
+            rows = self.pool.query_all(
+                'SELECT * FROM telemetry WHERE id > ? ORDER BY id LIMIT ?', (self.last_id, self.batch_size)
+            )
+            if not rows:
+                return total
+            samples = [dict(row) for row in rows]
+            for callback in self.listeners:
+                try:
+                    callback(samples)
+                except Exception as e:
+                    print("❌ Помилка обробника пачки телеметрії:", e)
+            self.last_id = rows[-1]['id']
+            total += len(rows)
+            if len(rows) < self.batch_size:
+                return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print("❌ Не вдалося прочитати нову телеметрію:", e)
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from metrics import Counter, Histogram
+
+JOB_SECONDS = Histogram('job_duration_seconds', "Тривалість регулярних задач", ('job',))
+JOB_RUNS = Counter('job_runs_total', "Запуски регулярних задач", ('job', 'status'))  # ok/error/missed/skipped
+
+def _new_stats():
+    return {
+        'runs': 0, 'failures': 0, 'misfires': 0, 'skipped': 0, 'running': False,
+        'last_run': None, 'last_duration_ms': 0.0, 'max_duration_ms': 0.0, 'total_duration_ms': 0.0,
+        'last_delay_ms': 0.0, 'max_delay_ms': 0.0, 'last_error': None,
+    }
+
+class JobRunner:
+    """Регулярні задачі в циклі asyncio бота (або ASGI-лідера) на
+    AsyncIOScheduler — тому ж планувальнику, що стоїть за PTB JobQueue.
+    Корутини виконуються прямо в циклі, блокуючі функції (blocking=True) —
+    у власному пулі потоків: VACUUM чи чистка історії не займають потоки
+    db_executor, на яких працюють обробники бота.
+
+    Кожна задача має coalesce (пропущені запуски зливаються в один),
+    max_instances=1, misfire_grace_time і jitter. Запуск, що спізнився
+    більше ніж на misfire_grace, не виконується і рахується в misfires;
+    запуск, поки попередній ще працює, — у skipped."""
+
+    def __init__(self, timezone, jitter=0, misfire_grace=300, workers=2):
+        self.jitter = jitter
+        self.misfire_grace = misfire_grace
+        self.scheduler = AsyncIOScheduler(timezone=timezone)
+        self.scheduler.add_listener(self._on_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jobs")
+        self._stats = {}
+
+    @property
+    def running(self):
+        return self.scheduler.running
+
+    def add(self, name, func, trigger, blocking=False, jitter=None, misfire_grace=None, **trigger_args):
+        """Додає або замінює задачу name. func — корутинна функція без
+        аргументів, або звичайна з blocking=True."""
+        self._stats.setdefault(name, _new_stats())
+        self.scheduler.add_job(
+            self._run, trigger, args=(name, func, blocking), id=name, name=name,
+            replace_existing=True, coalesce=True, max_instances=1,
+            jitter=int(self.jitter if jitter is None else jitter) or None,
+            misfire_grace_time=int(self.misfire_grace if misfire_grace is None else misfire_grace),
+            **trigger_args
+        )
+
+    def remove(self, name):
+        self._stats.pop(name, None)
+        try:
+            self.scheduler.remove_job(name)
+            return True
+        except JobLookupError:
+            return False
+
+    def start(self):
+        # викликати з циклу, в якому мають працювати задачі
+        if not self.scheduler.running:
+            self.scheduler.start()
+
+    def shutdown(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        result = {}
+        for name, stats in list(self._stats.items()):
+            item = dict(stats)
+            item['avg_duration_ms'] = stats['total_duration_ms'] / stats['runs'] if stats['runs'] else 0.0
+            job = self.scheduler.get_job(name)
+            next_run = getattr(job, 'next_run_time', None)
+            item['next_run'] = next_run.isoformat() if next_run else None
+            result[name] = item
+        return result
+
+    def _on_event(self, event):
+        stats = self._stats.get(event.job_id)
+        if stats is None:
+            return
+        if event.code == EVENT_JOB_SUBMITTED:
+            # наскільки цикл запізнився відносно запланованого (разом з jitter) часу
+            delay_ms = max(0.0, time.time() - event.scheduled_run_times[-1].timestamp()) * 1000
+            stats['last_delay_ms'] = delay_ms
+            stats['max_delay_ms'] = max(stats['max_delay_ms'], delay_ms)
+        elif event.code == EVENT_JOB_MISSED:
+            stats['misfires'] += 1
+            JOB_RUNS.labels(event.job_id, 'missed').inc()
+            print(f"⚠️ Задача {event.job_id} пропущена: запізнення більше {self.misfire_grace:.0f} с")
+        else:
+            stats['skipped'] += 1
+            JOB_RUNS.labels(event.job_id, 'skipped').inc()
+
+    async def _run(self, name, func, blocking):
+        stats = self._stats.setdefault(name, _new_stats())
+        stats['running'] = True
+        stats['last_run'] = time.time()
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            if blocking:
+                await asyncio.get_running_loop().run_in_executor(self._executor, func)
+            else:
+                await func()
+        except Exception as e:
+            status = 'error'
+            stats['failures'] += 1
+            stats['last_error'] = f"{type(e).__name__}: {e}"
+            print(f"❌ Задача {name} завершилась з помилкою:", e)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats['running'] = False
+            stats['runs'] += 1
+            stats['last_duration_ms'] = elapsed_ms
+            stats['max_duration_ms'] = max(stats['max_duration_ms'], elapsed_ms)
+            stats['total_duration_ms'] += elapsed_ms
+            JOB_SECONDS.labels(name).observe(elapsed_ms / 1000)
+            JOB_RUNS.labels(name, status).inc()
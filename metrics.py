@@ -0,0 +1,329 @@
+"""Метрики у текстовому форматі Prometheus без зовнішніх залежностей.
+
+Counter/Gauge/Histogram з мітками реєструються в REGISTRY при створенні,
+GET /metrics віддає REGISTRY.render(). Дочірня метрика для набору міток
+кешується, тож гарячий шлях — це пошук у dict, bisect і інкремент під
+локом (~1–2 мкс на виклик). Стан у пам'яті процесу: під uvicorn з
+кількома воркерами кожен воркер віддає свої значення (див. мітку pid у
+process_info).
+"""
+import bisect
+import collections
+import functools
+import inspect
+import math
+import os
+import sys
+import threading
+import time
+
+# секунди: від швидкого запиту в SQLite до long-poll і звіту з погодою
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # одна зламана колбек-метрика не повинна ламати весь scrape
+                lines.append(f"# {metric.name} collect failed: {_escape(e)}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self._header()
+        for values, child in sorted(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self, lock):
+        self.value = 0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class Gauge(_Metric):
+    """Gauge з set()/inc(), або з collect — функцією, яку викликають на
+    кожен scrape: повертає число (без міток) чи {мітки-кортеж: число}."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY, collect=None):
+        super().__init__(name, documentation, labels, registry)
+        self.collect = collect
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def render(self):
+        if self.collect is None:
+            return super().render()
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = self._header()
+        for label_values, value in sorted(values.items(), key=lambda kv: kv[0]):
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}")
+        return lines
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets, lock):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # останній — понад найбільший кошик
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+class _Timer:
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets, self._lock)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = self._header()
+        for values, child in sorted(self._children.items()):
+            with self._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = (('le', _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class StatsCollector:
+    """Віддає числові поля готового dict зі статистикою (ingest_queue.stats(),
+    WeatherClient.stats...) як untyped-метрики prefix_<поле>."""
+
+    def __init__(self, prefix, documentation, collect, registry=REGISTRY):
+        self.name = prefix
+        self.documentation = documentation
+        self.collect = collect
+        if registry is not None:
+            registry.register(self)
+
+    def render(self):
+        lines = []
+        for key, value in sorted(self.collect().items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = f"{self.name}_{key}"
+                lines += [f"# HELP {name} {self.documentation}", f"# TYPE {name} untyped",
+                          f"{name} {_format_value(value)}"]
+        return lines
+
+_in_progress = threading.local()  # гістограми, які зараз міряє зовнішній виклик цього потоку
+
+def timed(histogram, label=None, errors=None, outermost=False):
+    """Декоратор: час виклику в histogram{label}, винятки — в errors{label}.
+    label за замовчуванням — ім'я функції. Працює і з корутинами.
+
+    outermost=True (лише для звичайних функцій): якщо в цьому ж потоці вже
+    йде виміряний виклик у ту саму histogram, вкладений не міряється —
+    інакше час і помилка вкладеного хелпера рахувались би двічі."""
+    def decorator(fn):
+        name = label or fn.__name__
+        child = histogram.labels(name)
+        failed = errors.labels(name) if errors is not None else None
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    if failed is not None:
+                        failed.inc()
+                    raise
+                finally:
+                    child.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if outermost:
+                active = getattr(_in_progress, 'histograms', None)
+                if active is None:
+                    active = _in_progress.histograms = set()
+                if histogram in active:
+                    return fn(*args, **kwargs)
+                active.add(histogram)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                if failed is not None:
+                    failed.inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - started)
+                if outermost:
+                    active.discard(histogram)
+        return wrapper
+    return decorator
+
+Gauge('process_info', "PID процесу, що віддав метрики", ('pid',), collect=lambda: {(os.getpid(),): 1})
+_started = time.time()
+Gauge('process_start_time_seconds', "Час старту процесу (unix)", collect=lambda: _started)
+
+# ==========  PROFILER  ==========
+class SamplingProfiler:
+    """Семплювальний профайлер на запит: кожні interval секунд знімає стеки
+    всіх потоків (sys._current_frames) і рахує однакові. Результат — згорнуті
+    стеки "потік;файл:функція;... кількість" для flamegraph.pl чи speedscope.
+    Поки не запущений, нічого не коштує; одночасно працює лише один прогін."""
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+
+    def run(self, seconds):
+        """Семплює в потоці, що викликав, seconds секунд. None, якщо вже зайнято."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            me = threading.get_ident()
+            names = {}
+            stacks = collections.Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    if ident not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    stacks[(names.get(ident, str(ident)),) + self._stack(frame)] += 1
+                time.sleep(self.interval)
+            return stacks
+        finally:
+            self._lock.release()
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    @staticmethod
+    def folded(stacks):
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
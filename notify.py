@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+class CommandNotifier:
+    """Будильник для long-poll запитів пристроїв.
+
+    У кожного пристрою свій лічильник версій і своя Condition на спільному
+    локу: add_command будить лише запити цього пристрою, а не весь парк.
+    Сповіщення живуть в межах процесу, тому той, хто чекає, все одно
+    періодично перечитує БД (див. esp32_get_commands)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conditions = {}
+        self._versions = {}
+        self._futures = {}  # device_id -> [(loop, future)] для async-очікувань (ASGI)
+
+    def _condition(self, device_id):
+        cond = self._conditions.get(device_id)
+        if cond is None:
+            cond = self._conditions[device_id] = threading.Condition(self._lock)
+        return cond
+
+    def version(self, device_id):
+        with self._lock:
+            return self._versions.get(device_id, 0)
+
+    def notify(self, device_id):
+        with self._lock:
+            self._versions[device_id] = self._versions.get(device_id, 0) + 1
+            cond = self._conditions.get(device_id)
+            if cond is not None:
+                cond.notify_all()
+            waiters = self._futures.pop(device_id, ())
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def wait(self, device_id, version, timeout):
+        """Чекає, поки версія пристрою зміниться. Повертає нову версію
+        або None, якщо вийшов timeout."""
+        with self._lock:
+            cond = self._condition(device_id)
+            changed = cond.wait_for(lambda: self._versions.get(device_id, 0) != version, timeout)
+            return self._versions.get(device_id, 0) if changed else None
+
+    async def wait_async(self, device_id, version, timeout):
+        """Як wait(), але не займає потік: для long-poll в циклі asyncio."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            current = self._versions.get(device_id, 0)
+            if current != version:
+                return current
+            self._futures.setdefault(device_id, []).append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                waiters = self._futures.get(device_id)
+                if waiters and (loop, future) in waiters:
+                    waiters.remove((loop, future))
+                    if not waiters:
+                        del self._futures[device_id]
+                current = self._versions.get(device_id, 0)
+            return current if current != version else None
+        return self.version(device_id)
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,315 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+# роздільності агрегатів, секунди
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# поле телеметрії -> префікс колонок агрегату
+METRICS = (
+    ('engine_temperature', 'engine'),
+    ('air_temperature', 'air'),
+    ('batteryVoltage', 'battery'),
+    ('batteryAkkVoltage', 'akk'),
+)
+
+_METRIC_COLS = [f"{p}_{s}" for _, p in METRICS for s in ('min', 'max', 'sum', 'n')]
+_COLUMNS = ['device_id', 'resolution', 'bucket', 'samples'] + _METRIC_COLS + ['fuel_used', 'distance']
+
+def _merge(col):
+    if col.endswith('_min'):
+        return f"{col}=min(coalesce({col}, excluded.{col}), coalesce(excluded.{col}, {col}))"
+    if col.endswith('_max'):
+        return f"{col}=max(coalesce({col}, excluded.{col}), coalesce(excluded.{col}, {col}))"
+    return f"{col}=coalesce({col}, 0) + coalesce(excluded.{col}, 0)"
+
+UPSERT_ROLLUP_SQL = (
+    f"INSERT INTO telemetry_rollup ({', '.join(_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _COLUMNS)}) "
+    f"ON CONFLICT (device_id, resolution, bucket) DO UPDATE SET "
+    + ", ".join(_merge(c) for c in _COLUMNS[3:])
+)
+
+def to_epoch(ts):
+    """'YYYY-MM-DD HH:MM:SS' (UTC, як CURRENT_TIMESTAMP), ISO-рядок або число."""
+    if ts is None:
+        return time.time()
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    try:
+        return float(ts)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(str(ts).replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def to_sql_time(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def telemetry_before(pool, device_id, since):
+    """Останній зразок пристрою, старший за since (epoch) — стан для дельт перед перерахунком."""
+    row = pool.query_one(
+        'SELECT * FROM telemetry WHERE device_id=? AND timestamp<? ORDER BY timestamp DESC, id DESC LIMIT 1',
+        (device_id, to_sql_time(since)),
+    )
+    return dict(row) if row else None
+
+def iter_device_telemetry(pool, device_id, since=None, chunk=5000):
+    """Пачки зразків пристрою в порядку часу (а не id: офлайн-буфер дописує
+    старі зразки пізніше), по індексу (device_id, timestamp). Row value
+    (timestamp, id) > (?, ?), як в export.iter_chunks: SQLite бере його
+    межею діапазону індексу, а OR з двох умов — ні, і кожна пачка
+    сканувала б індекс пристрою з початку."""
+    last = (to_sql_time(since) if since is not None else '', 0)
+    while True:
+        rows = pool.query_all('''
+            SELECT * FROM telemetry
+            WHERE device_id=? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp, id LIMIT ?
+        ''', (device_id,) + last + (chunk,))
+        if not rows:
+            return
+        yield [dict(row) for row in rows]
+        last = (rows[-1]['timestamp'], rows[-1]['id'])
+        if len(rows) < chunk:
+            return
+
+class RollupEngine:
+    """Хвилинні, годинні та добові агрегати телеметрії по кожному пристрою.
+
+    process() підписаний на пачки з TelemetryIngestQueue: пачка спершу
+    згортається в пам'яті, а потім кожен зачеплений кошик оновлюється
+    одним UPSERT. Для витрати пального і пробігу тримається лише
+    попередній зразок пристрою — історію не перечитуємо, крім випадку
+    запізнілих зразків з офлайн-буфера: їх час запам'ятовується, і
+    rebuild_late() перераховує агрегати пристрою від найстаршого з них
+    (задача replay_late в app.py).
+
+    raw_days — скільки днів живе сира телеметрія (RAW_RETENTION_DAYS).
+    Кошики, які сирі дані вже не покривають повністю, перерахунок не
+    чіпає, а зразки, старші за цю межу, запізнілими не вважаються —
+    інакше пристрій з хибним годинником стер би історію агрегатів."""
+
+    def __init__(self, pool, resolutions=None, raw_days=None):
+        self.pool = pool
+        self.resolutions = tuple((resolutions or RESOLUTIONS).values())
+        self.raw_days = raw_days
+        self._prev = {}  # device_id -> (час, fuel_liters, totalDistance)
+        self._late = {}  # device_id -> час найстаршого запізнілого зразка
+        # RLock: rebuild тримає його весь перерахунок пристрою і викликає process
+        self._lock = threading.RLock()
+
+    def init_schema(self):
+        with self.pool.transaction() as c:
+            c.execute(f'''
+                CREATE TABLE IF NOT EXISTS telemetry_rollup (
+                    device_id TEXT,
+                    resolution INTEGER,
+                    bucket INTEGER,
+                    samples INTEGER,
+                    {', '.join(f"{col} {'INTEGER' if col.endswith('_n') else 'REAL'}" for col in _METRIC_COLS)},
+                    fuel_used REAL,
+                    distance REAL,
+                    PRIMARY KEY (device_id, resolution, bucket)
+                ) WITHOUT ROWID
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_rollup_resolution_bucket ON telemetry_rollup (resolution, bucket)')
+
+    def warm(self, snapshots):
+        # стан для дельт з кешу останніх знімків, щоб перший зразок після
+        # рестарту не губив пробіг і пальне
+        with self._lock:
+            for s in snapshots:
+                if s:
+                    self._prev[s.get('device_id')] = (
+                        to_epoch(s.get('timestamp')), s.get('fuel_liters'), s.get('totalDistance'),
+                    )
+
+    def raw_floor(self):
+        """Час (epoch), з якого сира телеметрія ще повна; None — зберігається вся."""
+        return time.time() - self.raw_days * 86400 if self.raw_days else None
+
+    def _deltas(self, sample, ts):
+        device_id = sample.get('device_id')
+        fuel, total = sample.get('fuel_liters'), sample.get('totalDistance')
+        prev_ts, prev_fuel, prev_total = self._prev.get(device_id, (None, None, None))
+        if prev_ts is not None and ts < prev_ts:
+            # зразок з офлайн-буфера, старший за вже врахований — дельти порахує rebuild_late()
+            floor = self.raw_floor()
+            if floor is None or ts >= floor:
+                self._late[device_id] = min(ts, self._late.get(device_id, ts))
+            return 0.0, 0.0
+        self._prev[device_id] = (
+            ts,
+            fuel if fuel is not None else prev_fuel,
+            total if total is not None else prev_total,
+        )
+        # зростання пального — це заправка, а не витрата; скидання одометра ігноруємо
+        fuel_used = prev_fuel - fuel if fuel is not None and prev_fuel is not None and fuel < prev_fuel else 0.0
+        distance = total - prev_total if total is not None and prev_total is not None and total > prev_total else 0.0
+        return fuel_used, distance
+
+    def aggregate(self, samples, starts=None):
+        """starts — {роздільність: перший кошик}: раніші кошики лише рахують дельти (rebuild)."""
+        buckets = {}
+        with self._lock:
+            for sample in samples:
+                ts = to_epoch(sample.get('timestamp'))
+                fuel_used, distance = self._deltas(sample, ts)
+                for resolution in self.resolutions:
+                    key = (sample.get('device_id'), resolution, int(ts // resolution * resolution))
+                    if starts is not None and key[2] < starts[resolution]:
+                        continue
+                    acc = buckets.get(key)
+                    if acc is None:
+                        acc = buckets[key] = dict.fromkeys(_COLUMNS[3:])
+                        acc['samples'] = 0
+                        acc['fuel_used'] = 0.0
+                        acc['distance'] = 0.0
+                    acc['samples'] += 1
+                    acc['fuel_used'] += fuel_used
+                    acc['distance'] += distance
+                    for field, prefix in METRICS:
+                        value = sample.get(field)
+                        if value is None:
+                            continue
+                        mn, mx = acc[prefix + '_min'], acc[prefix + '_max']
+                        acc[prefix + '_min'] = value if mn is None or value < mn else mn
+                        acc[prefix + '_max'] = value if mx is None or value > mx else mx
+                        acc[prefix + '_sum'] = (acc[prefix + '_sum'] or 0.0) + value
+                        acc[prefix + '_n'] = (acc[prefix + '_n'] or 0) + 1
+        return [key + tuple(acc[c] for c in _COLUMNS[3:]) for key, acc in buckets.items()]
+
+    def process(self, samples, starts=None):
+        # UPSERT теж під локом: інакше пачка, агрегована до rebuild, могла б
+        # записатись після нього і порахуватись двічі
+        with self._lock:
+            rows = self.aggregate(samples, starts)
+            if rows:
+                self.pool.executemany(UPSERT_ROLLUP_SQL, rows)
+
+    def _starts(self, since):
+        # перший кошик кожної роздільності, який сирі дані покривають від початку
+        floor = self.raw_floor()
+        if floor is not None:
+            since = floor if since is None else max(since, floor)
+        if since is None:
+            return {resolution: 0 for resolution in self.resolutions}
+        starts = {}
+        for resolution in self.resolutions:
+            start = int(since // resolution * resolution)
+            if floor is not None and start < floor:
+                start += resolution
+            starts[resolution] = start
+        return starts
+
+    def rebuild(self, device_id=None, since=None, chunk=5000):
+        """Перераховує агрегати з сирої телеметрії: всю історію (те, що було
+        до rollup) або від since (epoch) — тоді кошик, що містить since, і
+        всі пізніші видаляються і збираються наново. Кошики, початок яких
+        старший за raw_floor(), лишаються як є: сирих даних для них уже немає."""
+        if device_id is None:
+            devices = [row[0] for row in self.pool.query_all(
+                'SELECT DISTINCT device_id FROM telemetry WHERE device_id IS NOT NULL'
+            )]
+        else:
+            devices = [device_id]
+        starts = self._starts(since)
+        stream_from = min(starts.values()) or None
+        for dev in devices:
+            # живі пачки пристрою чекають, щоб не змішатись з перерахунком
+            with self._lock:
+                with self.pool.transaction() as c:
+                    for resolution, start in starts.items():
+                        c.execute('DELETE FROM telemetry_rollup WHERE device_id=? AND resolution=? AND bucket>=?',
+                                  (dev, resolution, start))
+                self._prev.pop(dev, None)
+                seed = telemetry_before(self.pool, dev, stream_from) if stream_from is not None else None
+                if seed is not None:
+                    self._deltas(seed, to_epoch(seed['timestamp']))
+                for samples in iter_device_telemetry(self.pool, dev, stream_from, chunk):
+                    self.process(samples, starts)
+                # у порядку часу запізнілих немає; все, що тут позначилось, уже враховано
+                self._late.pop(dev, None)
+
+    def rebuild_late(self):
+        """Перераховує агрегати пристроїв, що отримали запізнілі зразки.
+        Повертає кількість пристроїв."""
+        with self._lock:
+            late, self._late = self._late, {}
+        for device_id, since in late.items():
+            self.rebuild(device_id, since)
+        return len(late)
+
+    def history(self, device_id, resolution='1h', since=None, until=None):
+        step = RESOLUTIONS[resolution] if isinstance(resolution, str) else resolution
+        since = 0 if since is None else int(to_epoch(since))
+        until = 2 ** 62 if until is None else int(to_epoch(until))
+        rows = self.pool.query_all('''
+            SELECT * FROM telemetry_rollup
+            WHERE device_id=? AND resolution=? AND bucket>=? AND bucket<?
+            ORDER BY bucket
+        ''', (device_id, step, since, until))
+        result = []
+        for row in rows:
+            item = {
+                'bucket': row['bucket'],
+                'samples': row['samples'],
+                'fuel_used': row['fuel_used'],
+                'distance': row['distance'],
+            }
+            for field, prefix in METRICS:
+                n = row[prefix + '_n']
+                item[field] = {
+                    'min': row[prefix + '_min'],
+                    'max': row[prefix + '_max'],
+                    'avg': row[prefix + '_sum'] / n if n else None,
+                }
+            result.append(item)
+        return result
+
+    def prune(self, raw_days=None, keep=None, chunk=500, pause=0.01):
+        """Видаляє старі сирі рядки і агрегати дрібними порціями, кожна у своїй
+        короткій транзакції, щоб записувач телеметрії не чекав на лок.
+
+        keep — {роздільність у секундах: днів зберігання}. Останній рядок
+        кожного пристрою не видаляється ніколи (з нього прогрівається кеш)."""
+        deleted = 0
+        now = time.time()
+        if raw_days:
+            cutoff = datetime.fromtimestamp(now - raw_days * 86400, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            row = self.pool.query_one(
+                'SELECT id FROM telemetry WHERE timestamp >= ? ORDER BY id LIMIT 1', (cutoff,)
+            )
+            cutoff_id = row[0] if row else (self.pool.query_one('SELECT MAX(id) FROM telemetry')[0] or 0) + 1
+            while True:
+                cur = self.pool.execute('''
+                    DELETE FROM telemetry WHERE id IN (
+                        SELECT t.id FROM telemetry t
+                        WHERE t.id < ? AND EXISTS (
+                            SELECT 1 FROM telemetry n WHERE n.device_id = t.device_id AND n.id > t.id
+                        )
+                        ORDER BY t.id LIMIT ?
+                    )
+                ''', (cutoff_id, chunk))
+                deleted += cur.rowcount
+                if cur.rowcount < chunk:
+                    break
+                time.sleep(pause)
+        for resolution, days in (keep or {}).items():
+            if not days:
+                continue
+            while True:
+                cur = self.pool.execute('''
+                    DELETE FROM telemetry_rollup WHERE (device_id, resolution, bucket) IN (
+                        SELECT device_id, resolution, bucket FROM telemetry_rollup
+                        WHERE resolution=? AND bucket<? LIMIT ?
+                    )
+                ''', (resolution, int(now - days * 86400), chunk))
+                deleted += cur.rowcount
+                if cur.rowcount < chunk:
+                    break
+                time.sleep(pause)
+        return deleted
@@ -0,0 +1,135 @@
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+# ==========  SCHEMA  ==========
+# Колонки телеметрії у тому порядку, в якому їх пише INSERT_TELEMETRY_SQL
+TELEMETRY_FIELDS = (
+    'device_id', 'engine_temperature', 'air_temperature',
+    'latitude', 'longitude', 'fuel_pulses', 'fuel_liters',
+    'dailyDistance', 'totalDistance', 'dailyAvgConsumption',
+    'totalAvgConsumption', 'distanceRemCharge', 'batteryVoltage',
+    'batteryAkkVoltage', 'chainServiceLeft', 'oilServiceLeft',
+)
+
+# timestamp береться з пристрою, якщо він його надіслав (буфер офлайн-даних);
+# OR IGNORE відкидає повтори за унікальним (device_id, device_seq)
+INSERT_TELEMETRY_SQL = (
+    f"INSERT OR IGNORE INTO telemetry (timestamp, device_seq, {', '.join(TELEMETRY_FIELDS)}) "
+    f"VALUES (coalesce(?, CURRENT_TIMESTAMP), ?, {', '.join('?' for _ in TELEMETRY_FIELDS)})"
+)
+
+def telemetry_params(data):
+    return (data.get('timestamp'), data.get('device_seq')) + tuple(data.get(field) for field in TELEMETRY_FIELDS)
+
+# ==========  CONNECTION POOL  ==========
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",      # у WAL fsync лише на checkpoint
+    "PRAGMA cache_size=-16000",       # ~16 МБ сторінкового кешу
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+class _Slot:
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn):
+        self.conn = conn
+
+class ConnectionPool:
+    """Одне з'єднання на потік: Flask-потоки, цикл PTB та фонові воркери
+    не відкривають файл заново на кожен запит і не ділять курсори.
+    Коли потік завершується, його з'єднання повертається у пул простою
+    і дістається наступному потоку (threaded Flask створює потік на запит)."""
+
+    def __init__(self, path, busy_timeout=5.0, cached_statements=256, max_idle=8):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.max_idle = max_idle
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._idle = []
+        self._connections = set()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,  # кеш підготовлених запитів
+            isolation_level=None,  # транзакціями керуємо явно, див. transaction()
+            check_same_thread=False,  # у кожен момент з'єднанням володіє один потік
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._connections.add(conn)
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            if conn not in self._connections:
+                return  # пул уже закрито через close_all()
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self._connections.discard(conn)
+        conn.close()
+
+    def connection(self):
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            slot = _Slot(conn)
+            weakref.finalize(slot, self._release, conn)
+            self._local.slot = slot
+        return slot.conn
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        conn = self.connection()
+        if conn.in_transaction:
+            # вкладений виклик — працюємо в зовнішній транзакції
+            yield conn
+            return
+        # IMMEDIATE одразу бере лок запису: у WAL відкладена транзакція, що
+        # переходить з читання на запис, отримує SQLITE_BUSY без очікування
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def execute(self, sql, params=()):
+        # один оператор в autocommit — сам собі транзакція
+        return self.connection().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        with self.transaction() as conn:
+            return conn.executemany(sql, seq_of_params)
+
+    def query_one(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchone()
+
+    def query_all(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, set()
+            self._idle = []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
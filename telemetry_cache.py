@@ -0,0 +1,77 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+def _epoch(timestamp):
+    try:
+        return datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class LatestTelemetryCache:
+    """Останній зразок телеметрії кожного пристрою в пам'яті.
+
+    Знімки ніколи не змінюються на місці — update() підміняє dict цілком
+    під локом, тож Flask-потоки й цикл PTB завжди бачать узгоджений рядок."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_device = {}
+        self._received = {}  # device_id -> time.time() останнього пушу
+        self._latest = None
+
+    def warm(self, pool):
+        # по одному пошуку в індексі (device_id, timestamp) на кожен пристрій
+        # реєстру; останній — за часом, бо офлайн-буфер дописує старі зразки
+        # з більшим id
+        rows = pool.query_all('''
+            SELECT t.* FROM devices d
+            JOIN telemetry t ON t.id = (
+                SELECT id FROM telemetry WHERE device_id = d.device_id
+                ORDER BY timestamp DESC, id DESC LIMIT 1
+            )
+            ORDER BY t.timestamp, t.id
+        ''')
+        with self._lock:
+            for row in rows:
+                snapshot = dict(row)
+                self._by_device[snapshot['device_id']] = snapshot
+                self._received[snapshot['device_id']] = _epoch(snapshot['timestamp'])
+                self._latest = snapshot
+        return len(rows)
+
+    def update(self, sample):
+        snapshot = dict(sample)
+        snapshot.setdefault('id', None)
+        if snapshot.get('timestamp') is None:
+            # той самий формат, що й DEFAULT CURRENT_TIMESTAMP у SQLite
+            snapshot['timestamp'] = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        device_id = snapshot.get('device_id')
+        with self._lock:
+            self._received[device_id] = time.time()
+            current = self._by_device.get(device_id)
+            if current and current['timestamp'] and snapshot['timestamp'] < current['timestamp']:
+                return  # старий зразок з офлайн-буфера не затирає свіжий
+            self._by_device[device_id] = snapshot
+            self._latest = snapshot
+
+    def get(self, device_id=None):
+        with self._lock:
+            snapshot = self._latest if device_id is None else self._by_device.get(device_id)
+        return dict(snapshot) if snapshot else None
+
+    def push_ages(self):
+        """{device_id: секунд від останнього пушу} — для метрик."""
+        now = time.time()
+        with self._lock:
+            return {device_id: now - t for device_id, t in self._received.items() if t is not None}
+
+    def devices(self):
+        with self._lock:
+            return list(self._by_device)
+
+    def clear(self):
+        with self._lock:
+            self._by_device.clear()
+            self._received.clear()
+            self._latest = None
@@ -0,0 +1,220 @@
+"""Компактний бінарний формат телеметрії для POST /esp32_push/bin.
+
+Усі числа little-endian. Пакет:
+
+    b'HS' | version:u8 | flags:u8 | len:u8 | device_id:len байт | count:u16
+          | [base_time:u32, якщо FLAG_TIME] | записи...
+
+Запис починається з типу (u8) і маски присутніх полів (u16, біт i —
+поле FIELDS[i]), далі час і номер, якщо їх увімкнено прапорцями:
+
+    0 FULL  — [FLAG_TIME: int32 секунд від base_time] [FLAG_SEQ: u64 device_seq],
+              для кожного біта int32: значення * SCALE поля; поля без біта — None
+    1 DELTA — [FLAG_TIME: int16 секунд від попереднього запису]
+              [FLAG_SEQ: int16 зміна device_seq від попереднього],
+              для кожного біта int16: зміна від попереднього запису
+              в тих самих одиницях; поля без біта такі ж, як у попередньому
+
+base_time і timestamp записів — unix-секунди UTC. Час і device_seq
+задаються для всіх зразків пакета або для жодного; без часу зразки
+отримують час запису на сервері, як у версії 1 (її пакети — це пакети
+без прапорців, і вони далі розбираються).
+
+Перший запис пакета завжди FULL. Кодувальник переходить на FULL, коли
+дельта (поля, часу чи номера) не влазить в int16 або поле
+стало/перестало бути None.
+"""
+import struct
+from functools import lru_cache
+
+MAGIC = b'HS'
+VERSION = 2
+FULL, DELTA = 0, 1
+FLAG_TIME, FLAG_SEQ = 1, 2
+
+# поле -> множник фіксованої коми
+FIELDS = (
+    ('engine_temperature', 100),
+    ('air_temperature', 100),
+    ('latitude', 1000000),
+    ('longitude', 1000000),
+    ('fuel_pulses', 1),
+    ('fuel_liters', 1000),
+    ('dailyDistance', 1000),
+    ('totalDistance', 1000),
+    ('dailyAvgConsumption', 100),
+    ('totalAvgConsumption', 100),
+    ('distanceRemCharge', 100),
+    ('batteryVoltage', 1000),
+    ('batteryAkkVoltage', 1000),
+    ('chainServiceLeft', 10),
+    ('oilServiceLeft', 10),
+)
+
+_HEAD = struct.Struct('<2sBBB')
+_COUNT = struct.Struct('<H')
+_RECORD = struct.Struct('<BH')
+_BASE_TIME = struct.Struct('<I')
+_FULL_TIME = struct.Struct('<i')
+_FULL_SEQ = struct.Struct('<Q')
+_DELTA_META = struct.Struct('<h')
+_INT32 = [struct.Struct('<' + 'i' * n) for n in range(len(FIELDS) + 1)]
+_INT16 = [struct.Struct('<' + 'h' * n) for n in range(len(FIELDS) + 1)]
+_I32_MIN, _I32_MAX = -2 ** 31, 2 ** 31 - 1
+_I16_MIN, _I16_MAX = -2 ** 15, 2 ** 15 - 1
+
+class DecodeError(ValueError):
+    pass
+
+@lru_cache(maxsize=None)
+def _indexes(mask):
+    return tuple(i for i in range(len(FIELDS)) if mask >> i & 1)
+
+def _quantize(sample):
+    values = []
+    for name, scale in FIELDS:
+        value = sample.get(name)
+        if value is None:
+            values.append(None)
+            continue
+        q = int(round(float(value) * scale))
+        if not _I32_MIN <= q <= _I32_MAX:
+            raise ValueError(f"{name} out of range")
+        values.append(q)
+    return values
+
+def _optional(samples, key, check):
+    # поле є у всіх зразків -> список значень, ні в кого -> None
+    values = [s.get(key) for s in samples]
+    if all(v is None for v in values):
+        return None
+    if any(v is None for v in values):
+        raise ValueError(f"{key} must be set for all samples or none")
+    return [check(v) for v in values]
+
+def _unix_time(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("timestamp must be unix seconds")
+    value = int(round(value))
+    if not 0 <= value <= 2 ** 32 - 1:
+        raise ValueError("timestamp out of range")
+    return value
+
+def _seq(value):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < 2 ** 63:
+        raise ValueError("device_seq out of range")
+    return value
+
+def encode(device_id, samples, delta=True):
+    device = device_id.encode()
+    if len(device) > 255:
+        raise ValueError("device_id too long")
+    times = _optional(samples, 'timestamp', _unix_time)
+    seqs = _optional(samples, 'device_seq', _seq)
+    flags = (FLAG_TIME if times else 0) | (FLAG_SEQ if seqs else 0)
+    out = [_HEAD.pack(MAGIC, VERSION, flags, len(device)), device, _COUNT.pack(len(samples))]
+    base_time = min(times) if times else 0
+    if times:
+        if max(times) - base_time > _I32_MAX:
+            raise ValueError("timestamps span too long")
+        out.append(_BASE_TIME.pack(base_time))
+    prev = prev_time = prev_seq = None
+    for n, sample in enumerate(samples):
+        cur = _quantize(sample)
+        t = times[n] if times else 0
+        seq = seqs[n] if seqs else 0
+        if delta and prev is not None and all((a is None) == (b is None) for a, b in zip(cur, prev)):
+            mask, diffs = 0, []
+            for i, (a, b) in enumerate(zip(cur, prev)):
+                if a is not None and a != b:
+                    mask |= 1 << i
+                    diffs.append(a - b)
+            meta = ([t - prev_time] if times else []) + ([seq - prev_seq] if seqs else [])
+            if all(_I16_MIN <= d <= _I16_MAX for d in diffs + meta):
+                out.append(_RECORD.pack(DELTA, mask))
+                out.extend(_DELTA_META.pack(d) for d in meta)
+                out.append(_INT16[len(diffs)].pack(*diffs))
+                prev, prev_time, prev_seq = cur, t, seq
+                continue
+        mask, present = 0, []
+        for i, q in enumerate(cur):
+            if q is not None:
+                mask |= 1 << i
+                present.append(q)
+        out.append(_RECORD.pack(FULL, mask))
+        if times:
+            out.append(_FULL_TIME.pack(t - base_time))
+        if seqs:
+            out.append(_FULL_SEQ.pack(seq))
+        out.append(_INT32[len(present)].pack(*present))
+        prev, prev_time, prev_seq = cur, t, seq
+    return b''.join(out)
+
+def decode(payload):
+    """Розбирає пакет і повертає список dict у схемі validate_telemetry
+    (timestamp — unix-секунди, якщо пакет їх несе)."""
+    try:
+        magic, version, flags, dev_len = _HEAD.unpack_from(payload, 0)
+    except struct.error:
+        raise DecodeError("truncated header")
+    if magic != MAGIC or version not in (1, VERSION) or flags & ~(FLAG_TIME | FLAG_SEQ) \
+            or (version == 1 and flags):
+        raise DecodeError("unsupported payload")
+    offset = _HEAD.size
+    device_id = payload[offset:offset + dev_len].decode('utf-8', 'replace')
+    offset += dev_len
+    try:
+        (count,) = _COUNT.unpack_from(payload, offset)
+        offset += _COUNT.size
+        base_time = 0
+        if flags & FLAG_TIME:
+            (base_time,) = _BASE_TIME.unpack_from(payload, offset)
+            offset += _BASE_TIME.size
+        samples = []
+        prev = t = seq = None
+        for _ in range(count):
+            kind, mask = _RECORD.unpack_from(payload, offset)
+            offset += _RECORD.size
+            idx = _indexes(mask)
+            if kind == FULL:
+                if flags & FLAG_TIME:
+                    t = base_time + _FULL_TIME.unpack_from(payload, offset)[0]
+                    offset += _FULL_TIME.size
+                if flags & FLAG_SEQ:
+                    (seq,) = _FULL_SEQ.unpack_from(payload, offset)
+                    offset += _FULL_SEQ.size
+                values = _INT32[len(idx)].unpack_from(payload, offset)
+                offset += _INT32[len(idx)].size
+                cur = [None] * len(FIELDS)
+                for i, v in zip(idx, values):
+                    cur[i] = v
+            elif kind == DELTA and prev is not None:
+                if flags & FLAG_TIME:
+                    t += _DELTA_META.unpack_from(payload, offset)[0]
+                    offset += _DELTA_META.size
+                if flags & FLAG_SEQ:
+                    seq += _DELTA_META.unpack_from(payload, offset)[0]
+                    offset += _DELTA_META.size
+                values = _INT16[len(idx)].unpack_from(payload, offset)
+                offset += _INT16[len(idx)].size
+                cur = list(prev)
+                for i, v in zip(idx, values):
+                    if cur[i] is None:
+                        raise DecodeError("delta against a missing field")
+                    cur[i] += v
+            else:
+                raise DecodeError("bad record")
+            prev = cur
+            sample = {'device_id': device_id}
+            if flags & FLAG_TIME:
+                sample['timestamp'] = t
+            if flags & FLAG_SEQ:
+                sample['device_seq'] = seq
+            for (name, scale), q in zip(FIELDS, cur):
+                sample[name] = None if q is None else q / scale
+            samples.append(sample)
+    except struct.error:
+        raise DecodeError("truncated payload")
+    if offset != len(payload):
+        raise DecodeError("trailing bytes")
+    return samples
@@ -0,0 +1,274 @@
+import argparse
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from rollups import iter_device_telemetry, telemetry_before, to_epoch
+
+INSERT_TRIP_SQL = '''
+    INSERT INTO trips (
+        device_id, start_time, end_time, distance, fuel_burned,
+        avg_consumption, max_engine_temperature,
+        start_latitude, start_longitude, end_latitude, end_longitude, samples
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(min(1.0, a)))
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class TripDetector:
+    """Потоковий сегментатор поїздок.
+
+    На кожен пристрій тримається лише попередній зразок і поточна відкрита
+    поїздка. Рух — це приріст totalDistance (або dailyDistance), або зсув
+    GPS більше за min_move_km. Поїздка закривається, коли пристрій стоїть
+    довше idle_timeout секунд; коротші за min_distance км відкидаються.
+
+    Запізнілі зразки з офлайн-буфера (старші за попередній) пропускаються,
+    але їх час запам'ятовується: replay_late() перебудовує поїздки
+    пристрою від цього моменту (задача replay_late в app.py).
+
+    raw_days — скільки днів живе сира телеметрія (RAW_RETENTION_DAYS):
+    поїздки, що почались раніше, перебудова не видаляє, а старші зразки
+    запізнілими не вважаються."""
+
+    def __init__(self, pool, idle_timeout=300, min_distance=0.3, min_move_km=0.05, raw_days=None):
+        self.pool = pool
+        self.idle_timeout = idle_timeout
+        self.min_distance = min_distance
+        self.min_move_km = min_move_km
+        self.raw_days = raw_days
+        self._prev = {}   # device_id -> попередній зразок (лише потрібні поля)
+        self._open = {}   # device_id -> відкрита поїздка
+        self._late = {}   # device_id -> час найстаршого запізнілого зразка
+        # RLock: replay тримає його всю перебудову пристрою і викликає process
+        self._lock = threading.RLock()
+
+    def init_schema(self):
+        with self.pool.transaction() as c:
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS trips (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device_id TEXT,
+                    start_time DATETIME,
+                    end_time DATETIME,
+                    distance REAL,
+                    fuel_burned REAL,
+                    avg_consumption REAL,
+                    max_engine_temperature REAL,
+                    start_latitude REAL,
+                    start_longitude REAL,
+                    end_latitude REAL,
+                    end_longitude REAL,
+                    samples INTEGER
+                )
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_trips_device_id ON trips (device_id, id)')
+
+    def _step(self, sample, closed):
+        device_id = sample.get('device_id')
+        ts = to_epoch(sample.get('timestamp'))
+        lat, lon = sample.get('latitude'), sample.get('longitude')
+        fuel = sample.get('fuel_liters')
+        total, daily = sample.get('totalDistance'), sample.get('dailyDistance')
+        prev = self._prev.get(device_id)
+        if prev is not None and ts < prev['ts']:
+            # запізнілий зразок з офлайн-буфера; цей період перебудує replay_late()
+            floor = self.raw_floor()
+            if floor is None or ts >= floor:
+                self._late[device_id] = min(ts, self._late.get(device_id, ts))
+            return
+        self._prev[device_id] = {
+            'ts': ts, 'lat': lat, 'lon': lon, 'fuel': fuel, 'total': total, 'daily': daily,
+        }
+        if prev is None:
+            return
+
+        distance = 0.0
+        if total is not None and prev['total'] is not None:
+            distance = max(0.0, total - prev['total'])
+        elif daily is not None and prev['daily'] is not None:
+            distance = max(0.0, daily - prev['daily'])
+        gps = 0.0
+        if None not in (lat, lon, prev['lat'], prev['lon']) and (lat or lon):
+            gps = haversine_km(prev['lat'], prev['lon'], lat, lon)
+        if distance == 0.0 and gps >= self.min_move_km:
+            distance = gps  # одометр не рахує — беремо трек GPS
+        moving = distance > 0.0
+        fuel_burned = max(0.0, prev['fuel'] - fuel) if fuel is not None and prev['fuel'] is not None else 0.0
+
+        trip = self._open.get(device_id)
+        if trip is not None and ts - trip['last_move'] > self.idle_timeout:
+            closed.append(self._close(device_id))
+            trip = None
+        if trip is None:
+            if not moving:
+                return
+            trip = self._open[device_id] = {
+                # початок — попередній зразок, якщо він не з давньої стоянки
+                'device_id': device_id, 'start': prev['ts'] if ts - prev['ts'] <= self.idle_timeout else ts,
+                'last_move': ts,
+                'distance': 0.0, 'fuel': 0.0, 'max_engine': None, 'samples': 1,
+                'start_lat': prev['lat'], 'start_lon': prev['lon'], 'end_lat': lat, 'end_lon': lon,
+            }
+        trip['distance'] += distance
+        trip['fuel'] += fuel_burned
+        trip['samples'] += 1
+        engine = sample.get('engine_temperature')
+        if engine is not None and (trip['max_engine'] is None or engine > trip['max_engine']):
+            trip['max_engine'] = engine
+        if moving:
+            trip['last_move'] = ts
+            trip['end_lat'], trip['end_lon'] = lat, lon
+
+    def _close(self, device_id):
+        return self._open.pop(device_id)
+
+    def _row(self, trip):
+        if trip['distance'] < self.min_distance:
+            return None
+        return (
+            trip['device_id'], _iso(trip['start']), _iso(trip['last_move']),
+            trip['distance'], trip['fuel'],
+            trip['fuel'] / trip['distance'] * 100 if trip['distance'] else None,
+            trip['max_engine'],
+            trip['start_lat'], trip['start_lon'], trip['end_lat'], trip['end_lon'], trip['samples'],
+        )
+
+    def _store(self, closed):
+        rows = [row for row in (self._row(t) for t in closed) if row]
+        if rows:
+            self.pool.executemany(INSERT_TRIP_SQL, rows)
+        return len(rows)
+
+    def process(self, samples):
+        closed = []
+        # запис теж під локом, щоб закрита тут поїздка не розминулась з replay
+        with self._lock:
+            for sample in samples:
+                self._step(sample, closed)
+            return self._store(closed)
+
+    def close_idle(self, now=None):
+        """Закриває поїздки пристроїв, що замовкли (вимкнули живлення на стоянці)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            closed = [self._close(d) for d, t in list(self._open.items())
+                      if now - t['last_move'] > self.idle_timeout]
+        return self._store(closed)
+
+    def flush(self):
+        with self._lock:
+            closed = [self._close(d) for d in list(self._open)]
+        return self._store(closed)
+
+    def open_trip(self, device_id):
+        with self._lock:
+            trip = self._open.get(device_id)
+            return dict(trip) if trip else None
+
+    def last_trips(self, device_id, limit=5):
+        rows = self.pool.query_all(
+            'SELECT * FROM trips WHERE device_id=? ORDER BY id DESC LIMIT ?', (device_id, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def raw_floor(self):
+        """Час (epoch), з якого сира телеметрія ще повна; None — зберігається вся."""
+        return time.time() - self.raw_days * 86400 if self.raw_days else None
+
+    def _replay_start(self, device_id, since):
+        # поїздки, які запізнілий зразок міг продовжити або злити, — ті, що
+        # закінчились не раніше ніж за idle_timeout до нього, і відкрита
+        row = self.pool.query_one(
+            'SELECT MIN(start_time) FROM trips WHERE device_id=? AND end_time>=?',
+            (device_id, _iso(since - self.idle_timeout)),
+        )
+        start = min(since, to_epoch(row[0])) if row and row[0] else since
+        trip = self._open.get(device_id)
+        start = min(start, trip['start']) if trip else start
+        floor = self.raw_floor()
+        if floor is None or start >= floor:
+            return start
+        # поїздки, що почались до межі сирих даних, не перебудувати — лишаємо
+        # їх і починаємо після кінця останньої з них
+        row = self.pool.query_one(
+            'SELECT MAX(end_time) FROM trips WHERE device_id=? AND start_time<?',
+            (device_id, _iso(floor)),
+        )
+        return max(floor, to_epoch(row[0]) + 1) if row and row[0] else floor
+
+    def replay(self, device_id=None, since=None, chunk=20000):
+        """Перебудовує поїздки з сирої телеметрії в порядку часу по індексу
+        (device_id, timestamp), пачками, зі вставкою закритих поїздок одним
+        executemany на пачку. since (epoch) — лише поїздки, які зачіпає
+        цей момент, і все після нього. Раніше за raw_floor() не сягає."""
+        if device_id is None:
+            devices = [row[0] for row in self.pool.query_all(
+                'SELECT DISTINCT device_id FROM telemetry WHERE device_id IS NOT NULL'
+            )]
+        else:
+            devices = [device_id]
+        floor = self.raw_floor()
+        if floor is not None:
+            since = floor if since is None else max(since, floor)
+        samples = stored = 0
+        for dev in devices:
+            # живі пачки пристрою чекають, щоб не змішатись з перебудовою
+            with self._lock:
+                start = self._replay_start(dev, since) if since is not None else None
+                with self.pool.transaction() as c:
+                    if start is None:
+                        c.execute('DELETE FROM trips WHERE device_id=?', (dev,))
+                    else:
+                        c.execute('DELETE FROM trips WHERE device_id=? AND end_time>=?', (dev, _iso(start)))
+                self._prev.pop(dev, None)
+                self._open.pop(dev, None)
+                seed = telemetry_before(self.pool, dev, start) if start is not None else None
+                if seed is not None:
+                    self.process([seed])
+                for rows in iter_device_telemetry(self.pool, dev, start, chunk):
+                    samples += len(rows)
+                    stored += self.process(rows)
+                self._late.pop(dev, None)
+                # остання поїздка закрита, лише якщо пристрій відтоді стоїть
+                stored += self.close_idle()
+        return samples, stored
+
+    def replay_late(self):
+        """Перебудовує поїздки пристроїв, що отримали запізнілі зразки.
+        Повертає (зразків, поїздок)."""
+        with self._lock:
+            late, self._late = self._late, {}
+        samples = stored = 0
+        for device_id, since in late.items():
+            n, m = self.replay(device_id, since)
+            samples += n
+            stored += m
+        return samples, stored
+
+if __name__ == '__main__':
+    import os
+    from storage import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Перебудувати таблицю trips з історії телеметрії")
+    parser.add_argument('--db', default=os.getenv("DB_FILE", "hondashadow.db"))
+    parser.add_argument('--device', default=None)
+    parser.add_argument('--raw-days', type=float, default=float(os.getenv("RAW_RETENTION_DAYS", "90")),
+                        help="зберігання сирої телеметрії, днів (0 — вся); старші поїздки не чіпаються")
+    args = parser.parse_args()
+
+    detector = TripDetector(ConnectionPool(args.db), raw_days=args.raw_days)
+    detector.init_schema()
+    t0 = time.perf_counter()
+    samples, stored = detector.replay(args.device)
+    elapsed = time.perf_counter() - t0
+    print(f"{samples} зразків -> {stored} поїздок за {elapsed:.2f} с "
+          f"({samples / elapsed if elapsed else 0:.0f} зразків/с)")
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import httpx
+
+from metrics import Counter, Histogram
+
+WEATHER_ERROR = "⚠️ Не вдалося отримати погоду."
+
+WEATHER_SECONDS = Histogram('weather_request_duration_seconds', "Запити до OpenWeather", ('outcome',))
+WEATHER_LOOKUPS = Counter('weather_lookups_total', "Звернення за погодою", ('result',))  # hit/miss/coalesced
+
+def format_weather(w):
+    return f"🌤 {w['weather'][0]['description'].capitalize()}, {w['main']['temp']}°C, Вологість: {w['main']['humidity']}%"
+
+class WeatherClient:
+    """Асинхронний клієнт OpenWeather для циклу PTB.
+
+    Один httpx.AsyncClient з пулом з'єднань і явними таймаутами; відповіді
+    кешуються на ttl секунд за координатами, округленими до precision
+    знаків (2 знаки ≈ 1 км), а однакові одночасні запити зливаються в один."""
+
+    def __init__(self, api_key, base_url="https://api.openweathermap.org/data/2.5/weather",
+                 ttl=600, precision=2, timeout=5.0, max_connections=10, max_entries=1024):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.ttl = ttl
+        self.precision = precision
+        self.max_entries = max_entries
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 3.0))
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = None
+        self._cache = {}
+        self._inflight = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    def _bucket(self, lat, lon):
+        return (round(float(lat), self.precision), round(float(lon), self.precision))
+
+    def _session(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def _fetch(self, key):
+        lat, lon = key
+        started = time.perf_counter()
+        try:
+            r = await self._session().get(self.base_url, params={
+                'lat': lat, 'lon': lon, 'units': 'metric', 'lang': 'ua', 'appid': self.api_key,
+            })
+            r.raise_for_status()
+            text = format_weather(r.json())
+        except Exception:
+            # помилки не кешуємо — наступний запит спробує ще раз
+            self.stats['errors'] += 1
+            WEATHER_SECONDS.labels('error').observe(time.perf_counter() - started)
+            return WEATHER_ERROR
+        WEATHER_SECONDS.labels('ok').observe(time.perf_counter() - started)
+        self._store(key, text)
+        return text
+
+    def _store(self, key, text):
+        now = time.monotonic()
+        if len(self._cache) >= self.max_entries:
+            for k in [k for k, (expires, _) in self._cache.items() if expires <= now]:
+                del self._cache[k]
+            while len(self._cache) >= self.max_entries:
+                del self._cache[next(iter(self._cache))]  # найстаріший запис
+        self._cache[key] = (now + self.ttl, text)
+
+    async def get(self, lat, lon):
+        try:
+            key = self._bucket(lat, lon)
+        except (TypeError, ValueError):
+            return WEATHER_ERROR
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.stats['hits'] += 1
+            WEATHER_LOOKUPS.labels('hit').inc()
+            return cached[1]
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+            WEATHER_LOOKUPS.labels('coalesced').inc()
+        else:
+            self.stats['misses'] += 1
+            WEATHER_LOOKUPS.labels('miss').inc()
+            task = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: скасування одного з тих, хто чекає, не вбиває спільний запит
+        return await asyncio.shield(task)
+
+    def clear(self):
+        self._cache.clear()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None